@@ -0,0 +1,40 @@
+"""Add indexes on the meetings and meetings_users tables
+
+Revision ID: 1b6ad9f5c3e4
+Revises: 351329b8d7da
+Create Date: 2026-10-18 10:12:41.518302
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1b6ad9f5c3e4'
+down_revision = '351329b8d7da'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    ''' Add the indexes used by the date, location, recursion and manager
+    queries on the meetings and meetings_users tables.
+    '''
+    op.create_index(
+        'ix_meetings_calendar_dates', 'meetings',
+        ['calendar_name', 'meeting_date', 'meeting_date_end'])
+    op.create_index(
+        'ix_meetings_location_date', 'meetings',
+        ['meeting_location', 'meeting_date'],
+        mysql_length={'meeting_location': 255})
+    op.create_index(
+        'ix_meetings_recursion', 'meetings',
+        ['recursion_frequency', 'recursion_ends'])
+    op.create_index(
+        'ix_meetings_users_meeting_id', 'meetings_users', ['meeting_id'])
+
+
+def downgrade():
+    ''' Drop the indexes on the meetings and meetings_users tables '''
+    op.drop_index('ix_meetings_users_meeting_id', 'meetings_users')
+    op.drop_index('ix_meetings_recursion', 'meetings')
+    op.drop_index('ix_meetings_location_date', 'meetings')
+    op.drop_index('ix_meetings_calendar_dates', 'meetings')
@@ -0,0 +1,45 @@
+"""Add the calendar_generation and calendar_updated fields
+
+Revision ID: 3c7d9b2e4f10
+Revises: 5a2c8e1d7f43
+Create Date: 2026-10-18 14:21:43.518230
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c7d9b2e4f10'
+down_revision = '5a2c8e1d7f43'
+
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    ''' Add the calendar_generation and calendar_updated columns to the
+    calendars table.
+    '''
+    op.add_column(
+        'calendars',
+        sa.Column(
+            'calendar_generation', sa.Integer, nullable=False,
+            server_default='0')
+    )
+    op.add_column(
+        'calendars',
+        sa.Column('calendar_updated', sa.DateTime, nullable=True)
+    )
+
+    calendars = sa.sql.table(
+        'calendars',
+        sa.sql.column('calendar_updated', sa.DateTime),
+    )
+    op.execute(calendars.update().values(calendar_updated=datetime.utcnow()))
+
+
+def downgrade():
+    ''' Drop the calendar_generation and calendar_updated columns of the
+    calendars table '''
+    op.drop_column('calendars', 'calendar_updated')
+    op.drop_column('calendars', 'calendar_generation')
@@ -0,0 +1,103 @@
+"""Add the meeting_start_utc and meeting_stop_utc fields
+
+Revision ID: 5a2c8e1d7f43
+Revises: 1b6ad9f5c3e4
+Create Date: 2026-10-18 11:02:17.284915
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a2c8e1d7f43'
+down_revision = '1b6ad9f5c3e4'
+
+from datetime import datetime
+
+from alembic import op
+import pytz
+import sqlalchemy as sa
+
+
+def _to_utc(day, hour, tzone):
+    ''' Return the naive UTC datetime of the given day and hour in the
+    specified timezone. '''
+    value = datetime(day.year, day.month, day.day, hour.hour, hour.minute)
+    if tzone != 'UTC':
+        value = pytz.timezone(tzone).localize(value).astimezone(
+            pytz.utc).replace(tzinfo=None)
+    return value
+
+
+def _utc_columns(row):
+    ''' Return the UTC start and stop of the meeting in the given row,
+    computed the same way as Meeting.update_utc does. '''
+    if row.meeting_date is None or row.meeting_time_start is None:
+        return None, None
+    tzone = row.meeting_timezone or 'UTC'
+    return (
+        _to_utc(row.meeting_date, row.meeting_time_start, tzone),
+        _to_utc(
+            row.meeting_date_end or row.meeting_date,
+            row.meeting_time_stop or row.meeting_time_start, tzone),
+    )
+
+
+def upgrade():
+    ''' Add the meeting_start_utc and meeting_stop_utc columns to the
+    meetings table, fill them and index them.
+    '''
+    op.add_column(
+        'meetings',
+        sa.Column('meeting_start_utc', sa.DateTime, nullable=True)
+    )
+    op.add_column(
+        'meetings',
+        sa.Column('meeting_stop_utc', sa.DateTime, nullable=True)
+    )
+
+    meetings = sa.sql.table(
+        'meetings',
+        sa.sql.column('meeting_id', sa.Integer),
+        sa.sql.column('meeting_date', sa.Date),
+        sa.sql.column('meeting_date_end', sa.Date),
+        sa.sql.column('meeting_time_start', sa.Time),
+        sa.sql.column('meeting_time_stop', sa.Time),
+        sa.sql.column('meeting_timezone', sa.Text),
+        sa.sql.column('meeting_start_utc', sa.DateTime),
+        sa.sql.column('meeting_stop_utc', sa.DateTime),
+    )
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(
+        meetings.c.meeting_id,
+        meetings.c.meeting_date,
+        meetings.c.meeting_date_end,
+        meetings.c.meeting_time_start,
+        meetings.c.meeting_time_stop,
+        meetings.c.meeting_timezone,
+    )).fetchall()
+    for row in rows:
+        start_utc, stop_utc = _utc_columns(row)
+        if start_utc is None:
+            continue
+        connection.execute(
+            meetings.update().where(
+                meetings.c.meeting_id == row.meeting_id
+            ).values(
+                meeting_start_utc=start_utc,
+                meeting_stop_utc=stop_utc,
+            )
+        )
+
+    op.create_index(
+        'ix_meetings_calendar_start_utc', 'meetings',
+        ['calendar_name', 'meeting_start_utc'])
+    op.create_index(
+        'ix_meetings_start_utc', 'meetings', ['meeting_start_utc'])
+
+
+def downgrade():
+    ''' Drop the meeting_start_utc and meeting_stop_utc columns of the
+    meetings table '''
+    op.drop_index('ix_meetings_start_utc', 'meetings')
+    op.drop_index('ix_meetings_calendar_start_utc', 'meetings')
+    op.drop_column('meetings', 'meeting_stop_utc')
+    op.drop_column('meetings', 'meeting_start_utc')
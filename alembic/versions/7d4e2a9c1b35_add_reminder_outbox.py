@@ -0,0 +1,50 @@
+"""Add the reminder_outbox table
+
+Revision ID: 7d4e2a9c1b35
+Revises: 3c7d9b2e4f10
+Create Date: 2026-10-18 16:02:11.274815
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7d4e2a9c1b35'
+down_revision = '3c7d9b2e4f10'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    ''' Create the reminder_outbox table. '''
+    op.create_table(
+        'reminder_outbox',
+        sa.Column('outbox_id', sa.Integer, primary_key=True),
+        sa.Column(
+            'meeting_id', sa.Integer,
+            sa.ForeignKey(
+                'meetings.meeting_id', onupdate='cascade',
+                ondelete='cascade'),
+            nullable=False),
+        sa.Column('reminder_offset', sa.String(10), nullable=False),
+        sa.Column('occurrence_start', sa.DateTime, nullable=False),
+        sa.Column('send_at', sa.DateTime, nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('attempts', sa.Integer, nullable=False),
+        sa.Column('next_attempt', sa.DateTime, nullable=False),
+        sa.Column('lease_owner', sa.String(100), nullable=True),
+        sa.Column('lease_expires', sa.DateTime, nullable=True),
+        sa.Column('sent_at', sa.DateTime, nullable=True),
+        sa.Column('last_error', sa.Text, nullable=True),
+        sa.UniqueConstraint(
+            'meeting_id', 'reminder_offset', 'occurrence_start',
+            name='uq_reminder_outbox_occurrence'),
+    )
+    op.create_index(
+        'ix_reminder_outbox_status', 'reminder_outbox',
+        ['status', 'next_attempt'])
+
+
+def downgrade():
+    ''' Drop the reminder_outbox table. '''
+    op.drop_index('ix_reminder_outbox_status', table_name='reminder_outbox')
+    op.drop_table('reminder_outbox')
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+benchmarks - Small scripts measuring the cost of the hot paths of
+             fedocal against a generated database.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Each benchmark is a module of this package and is run using:
+
+    FEDOCAL_CONFIG=tests/fedocal_test.cfg \
+        python -m benchmarks.<module> [--db-url <url>]
+
+Importing fedocal loads the application, hence the FEDOCAL_CONFIG
+variable. By default the benchmarks run against an in-memory SQLite
+database.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import argparse
+import time
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from fedocal.fedocallib import model
+
+
+def get_parser(description, series=5000):
+    """ Return the parser of the command line arguments common to all the
+    benchmarks, each benchmark may add its own arguments to it.
+
+    :arg description: the description of the benchmark, shown in --help.
+    :kwarg series: the default number of meetings to generate.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--series', default=series, type=int,
+        help='Number of meetings to generate.')
+    parser.add_argument(
+        '--db-url', default='sqlite:///:memory:',
+        help='URL of the database to run the benchmark against, it will '
+        'be filled with generated data.')
+    parser.add_argument(
+        '--repeat', default=20, type=int,
+        help='Number of time each measure is repeated.')
+    return parser
+
+
+def create_session(db_url):
+    """ Create the tables in the specified database and return a session
+    to it, with a test calendar created.
+
+    :arg db_url: URL used to connect to the database.
+    """
+    session = model.create_tables(db_url)
+    calendar = model.Calendar(
+        calendar_name='bench_calendar',
+        calendar_contact='bench@example.com',
+        calendar_description='Calendar used for the benchmarks')
+    session.add(calendar)
+    session.commit()
+    return session
+
+
+def measure(func, repeat=20):
+    """ Call the provided function ``repeat`` times and return a tuple
+    with the result of the last call and the best duration observed, in
+    milliseconds.
+
+    :arg func: the function to call, without argument.
+    :kwarg repeat: the number of time to call it.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        duration = (time.time() - start) * 1000
+        if best is None or duration < best:
+            best = duration
+    return result, best
+
+
+@contextmanager
+def count_queries(session):
+    """ Context manager counting the SQL queries sent to the database
+    through the provided session, yields a list whose only element is
+    the number of queries run so far.
+
+    :arg session: the database session to watch.
+    """
+    counter = [0]
+    engine = session.get_bind()
+
+    def increment(conn, cursor, statement, parameters, context, many):
+        counter[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', increment)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', increment)
+
+
+@contextmanager
+def record_queries(session):
+    """ Context manager recording the SQL queries sent to the database
+    through the provided session and the number of objects loaded from
+    their results, yields a dictionnary with the list of the (statement,
+    parameters) of the queries and the number of objects loaded.
+
+    :arg session: the database session to watch.
+    """
+    output = {'queries': [], 'objects': 0}
+    engine = session.get_bind()
+
+    def record(conn, cursor, statement, parameters, context, many):
+        output['queries'].append((statement, parameters))
+
+    def loaded(target, context):
+        output['objects'] += 1
+
+    event.listen(engine, 'before_cursor_execute', record)
+    event.listen(model.BASE, 'load', loaded, propagate=True)
+    try:
+        yield output
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+        event.remove(model.BASE, 'load', loaded)
+
+
+def measure_results(session, queries):
+    """ Run again the provided queries, as recorded by record_queries,
+    and return a tuple with the number of rows they return and an
+    estimate of the number of bytes transferred: the size of the text
+    representation of the values of these rows.
+
+    :arg session: the database session to use.
+    :arg queries: a list of (statement, parameters) tuples.
+    """
+    rows = 0
+    size = 0
+    connection = session.get_bind().raw_connection()
+    try:
+        cursor = connection.cursor()
+        for statement, parameters in queries:
+            cursor.execute(statement, parameters)
+            for row in cursor.fetchall():
+                rows += 1
+                size += sum(
+                    len(str(value)) for value in row if value is not None)
+        cursor.close()
+    finally:
+        connection.close()
+    return rows, size
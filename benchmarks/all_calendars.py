@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+all_calendars - Benchmark the retrieval of the meetings of all the
+                calendars at once.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Usage:
+
+    FEDOCAL_CONFIG=tests/fedocal_test.cfg \\
+        python -m benchmarks.all_calendars [--calendars 150] [--series 20]
+
+Compares the number of queries and the time spent retrieving the meetings
+of the /api/meetings/ and /ical/ default window when looping over the
+calendars and when asking for all the calendars at once.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import random
+
+from datetime import date, time, timedelta
+
+from benchmarks import count_queries, create_session, get_parser, \
+    measure
+from fedocal import fedocallib
+from fedocal.fedocallib import model
+
+
+def fill_database(session, nb_calendars, nb_meetings):
+    """ Create ``nb_calendars`` calendars each with ``nb_meetings``
+    meetings, a quarter of which are recursive.
+    """
+    rand = random.Random(42)
+    today = date.today()
+    for cnt in range(nb_calendars):
+        calendar_name = 'calendar_%03d' % cnt
+        session.add(model.Calendar(
+            calendar_name=calendar_name,
+            calendar_contact='bench@example.com',
+            calendar_description='Generated calendar'))
+        for cnt2 in range(nb_meetings):
+            start = today + timedelta(days=rand.randint(-60, 200))
+            recursive = cnt2 % 4 == 0
+            session.add(model.Meeting(
+                meeting_name='Meeting %s' % cnt2,
+                meeting_date=start,
+                meeting_date_end=start,
+                meeting_time_start=time(rand.randint(0, 22), 0),
+                meeting_time_stop=time(23, 0),
+                meeting_information='Generated meeting',
+                calendar_name=calendar_name,
+                recursion_frequency=7 if recursive else None,
+                recursion_ends=start + timedelta(days=180)
+                if recursive else None))
+    session.commit()
+
+
+def per_calendar(session, start_date, end_date):
+    """ Retrieve the meetings looping over the calendars. """
+    meetings = []
+    for calendar in fedocallib.get_calendars(session):
+        meetings.extend(fedocallib.get_by_date(
+            session, calendar, start_date, end_date))
+    return meetings
+
+
+def all_calendars(session, start_date, end_date):
+    """ Retrieve the meetings of all the calendars at once. """
+    return fedocallib.get_by_date(session, None, start_date, end_date)
+
+
+def main():
+    """ Run the benchmark. """
+    parser = get_parser(__doc__.split('\n\n')[0].strip(), series=20)
+    parser.add_argument(
+        '--calendars', default=150, type=int,
+        help='Number of calendars to generate.')
+    parser_args = parser.parse_args()
+    session = create_session(parser_args.db_url)
+    fill_database(session, parser_args.calendars, parser_args.series)
+
+    start_date = date.today() - timedelta(days=30)
+    end_date = date.today() + timedelta(days=180)
+    print('%s calendars of %s meetings' % (
+        parser_args.calendars, parser_args.series))
+    print('%-14s %8s %8s %10s' % ('method', 'queries', 'meetings', 'ms'))
+    for name, function in [
+            ('per calendar', per_calendar),
+            ('all calendars', all_calendars)]:
+        def run():
+            session.expunge_all()
+            with count_queries(session) as counter:
+                meetings = function(session, start_date, end_date)
+            return counter[0], meetings
+
+        (queries, meetings), best = measure(run, parser_args.repeat)
+        print('%-14s %8s %8s %10.2f' % (name, queries, len(meetings), best))
+
+
+if __name__ == '__main__':
+    main()
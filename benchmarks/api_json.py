@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+api_json - Benchmark the serialization of the meetings returned by the
+           /api/meetings/ endpoint.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Usage:
+
+    FEDOCAL_CONFIG=tests/fedocal_test.cfg \\
+        python -m benchmarks.api_json [--sizes 1000,50000]
+
+Compares, for payloads of each of the given number of meetings (a tenth
+of them being series of ten occurrences), the time spent producing the
+whole JSON and the time before the first chunk is available when calling
+to_json on each meeting and dumping the whole response at once (as the
+API used to) and when streaming it with the MeetingSerializer, using the
+json module of the standard library and orjson. No database is needed,
+the meetings are only built in memory.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import json
+import random
+import time as _time
+
+from datetime import date, time, timedelta
+
+from benchmarks import get_parser, measure
+from fedocal.fedocallib import model
+from fedocal.fedocallib import serializer
+
+
+def generate_meetings(nb_meetings):
+    """ Build ``nb_meetings`` meetings and occurrences of recursive
+    meetings, each meeting having three managers.
+    """
+    rand = random.Random(42)
+    today = date.today()
+    meetings = []
+    cnt = 0
+    while len(meetings) < nb_meetings:
+        cnt += 1
+        day = today + timedelta(days=rand.randint(0, 180))
+        hour = rand.randint(0, 22)
+        meeting = model.Meeting(
+            meeting_name='Meeting %s' % cnt,
+            meeting_date=day,
+            meeting_date_end=day,
+            meeting_time_start=time(hour, rand.choice([0, 30])),
+            meeting_time_stop=time(hour + 1, 0),
+            meeting_information='Generated meeting ' * 10,
+            calendar_name='bench_calendar',
+            meeting_timezone='UTC')
+        meeting.meeting_id = cnt
+        meeting.meeting_manager_user = [
+            model.MeetingsUsers(username='user%03d' % rand.randint(0, 99))
+            for _ in range(3)
+        ]
+        if cnt % 10:
+            meetings.append(meeting)
+            continue
+        for week in range(min(10, nb_meetings - len(meetings))):
+            occurrence = day + timedelta(days=7 * week)
+            meetings.append(
+                model.MeetingOccurrence(meeting, occurrence, occurrence))
+    return meetings
+
+
+def legacy_to_json(meeting):
+    """ Return the JSON representation of the meeting as to_json used
+    to, formatting everything at every call. """
+    return dict(
+        meeting_id=meeting.meeting_id,
+        meeting_name=meeting.meeting_name,
+        meeting_manager=meeting.meeting_manager,
+        meeting_date=meeting.meeting_date.strftime('%Y-%m-%d'),
+        meeting_date_end=meeting.meeting_date_end.strftime('%Y-%m-%d'),
+        meeting_time_start=meeting.meeting_time_start.strftime('%H:%M:%S'),
+        meeting_time_stop=meeting.meeting_time_stop.strftime('%H:%M:%S'),
+        meeting_timezone=meeting.meeting_timezone,
+        meeting_information=meeting.meeting_information,
+        meeting_location=meeting.meeting_location,
+        calendar_name=meeting.calendar_name
+    )
+
+
+def legacy_response(meetings):
+    """ Yield the response the way api_meetings used to build it. """
+    output = {'arguments': {}}
+    output['meetings'] = [legacy_to_json(meeting) for meeting in meetings]
+    yield json.dumps(output)
+
+
+def streamed_response(meetings, backend):
+    """ Yield the response the way api_meetings streams it, using the
+    specified JSON backend. """
+    serializer.configure({'JSON_BACKEND': backend})
+    serialize = serializer.MeetingSerializer()
+    for chunk in serializer.iterencode(
+            {'arguments': {}}, 'meetings',
+            (serialize(meeting) for meeting in meetings)):
+        yield chunk
+
+
+def consume(response):
+    """ Read the whole response, return the number of milliseconds spent
+    before the first chunk and the size of the response. """
+    start = _time.time()
+    first = None
+    size = 0
+    for chunk in response:
+        if first is None:
+            first = (_time.time() - start) * 1000
+        size += len(chunk)
+    return first, size
+
+
+def main():
+    """ Run the benchmark. """
+    parser = get_parser(__doc__.split('\n\n')[0].strip())
+    parser.add_argument(
+        '--sizes', default='1000,50000',
+        help='Comma separated numbers of meetings in the payloads.')
+    parser_args = parser.parse_args()
+
+    functions = [('to_json + json.dumps', legacy_response)]
+    functions.append((
+        'streamed (json)',
+        lambda meetings: streamed_response(meetings, 'json')))
+    if serializer.orjson is not None:
+        functions.append((
+            'streamed (orjson)',
+            lambda meetings: streamed_response(meetings, 'orjson')))
+    else:  # pragma: no cover
+        print('orjson is not installed')
+
+    print('%-24s %8s %10s %10s %12s' % (
+        'function', 'meetings', 'bytes', 'ms', 'first (ms)'))
+    for size in [int(item) for item in parser_args.sizes.split(',')]:
+        meetings = generate_meetings(size)
+        for name, function in functions:
+            (first, length), best = measure(
+                lambda: consume(function(meetings)), parser_args.repeat)
+            print('%-24s %8s %10s %10.2f %12.2f' % (
+                name, size, length, best, first))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+ical_import - Benchmark the import of an iCalendar file into a calendar.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Usage:
+
+    FEDOCAL_CONFIG=tests/fedocal_test.cfg \\
+        python -m benchmarks.ical_import [--series 10000]
+
+Compares the number of queries, the time spent and the throughput when
+importing a generated iCalendar file by adding its meetings one at a
+time, as add_vcal_file used to, and with the bulk import of
+add_vcal_file.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import random
+
+from datetime import date, datetime, timedelta
+
+import vobject
+
+from benchmarks import count_queries, create_session, get_parser, \
+    measure
+from fedocal import fedocallib
+from fedocal.fedocallib import model
+
+TIMEZONES = ['UTC', 'Europe/Paris', 'America/New_York', 'Asia/Tokyo']
+
+
+class BenchUser(object):
+    """ The user importing the files. """
+    username = 'bench_user'
+    groups = []
+
+
+def generate_file(nb_meetings):
+    """ Return an iCalendar file with ``nb_meetings`` events in various
+    timezones.
+    """
+    rand = random.Random(42)
+    today = date.today()
+    ical = vobject.iCalendar()
+    for cnt in range(nb_meetings):
+        tzone = fedocallib.get_timezone(rand.choice(TIMEZONES))
+        start = tzone.localize(datetime.combine(
+            today + timedelta(days=rand.randint(-60, 200)),
+            datetime.min.time()) + timedelta(hours=rand.randint(0, 22)))
+        entry = ical.add('vevent')
+        entry.add('summary').value = 'Meeting %s' % cnt
+        entry.add('description').value = 'Generated meeting'
+        entry.add('dtstart').value = start
+        entry.add('dtend').value = start + timedelta(hours=1)
+    return ical.serialize()
+
+
+def legacy_import(session, calendar, data, fas_user):
+    """ Parse the whole file then add its meetings one at a time. """
+    for component in vobject.readOne(data).components():
+        if component.name == 'VTIMEZONE':
+            continue
+        meeting = fedocallib.get_vcal_meeting(component, calendar)
+        fedocallib.add_meeting(
+            session,
+            calendarobj=calendar,
+            fas_user=fas_user,
+            meeting_name=meeting['meeting_name'],
+            meeting_date=meeting['meeting_date'],
+            meeting_date_end=meeting['meeting_date_end'],
+            meeting_time_start=meeting['meeting_time_start'],
+            meeting_time_stop=meeting['meeting_time_stop'],
+            comanager=fas_user.username,
+            meeting_information=meeting['meeting_information'],
+            meeting_location=None,
+            tzone=meeting['meeting_timezone'],
+            frequency=None,
+            end_repeats=None,
+            remind_when=None,
+            reminder_from=None,
+            remind_who=None,
+            full_day=meeting['full_day'],
+            admin=True)
+
+
+def bulk_import(session, calendar, data, fas_user):
+    """ Import the file using add_vcal_file. """
+    fedocallib.add_vcal_file(session, calendar, data, fas_user, admin=True)
+
+
+def main():
+    """ Run the benchmark. """
+    parser = get_parser(__doc__.split('\n\n')[0].strip(), series=10000)
+    parser.set_defaults(repeat=1)
+    parser_args = parser.parse_args()
+    session = create_session(parser_args.db_url)
+    data = generate_file(parser_args.series)
+    fas_user = BenchUser()
+
+    print('%s events' % parser_args.series)
+    print('%-8s %8s %10s %12s' % ('method', 'queries', 'ms', 'events/s'))
+    runs = [0]
+    for name, function in [
+            ('legacy', legacy_import),
+            ('bulk', bulk_import)]:
+        def run():
+            runs[0] += 1
+            calendar = model.Calendar(
+                calendar_name='import_%s' % runs[0],
+                calendar_contact='bench@example.com',
+                calendar_description='Calendar the files are imported in')
+            session.add(calendar)
+            session.commit()
+            with count_queries(session) as counter:
+                function(session, calendar, data, fas_user)
+            session.expunge_all()
+            return counter[0]
+
+        queries, best = measure(run, parser_args.repeat)
+        print('%-8s %8s %10.2f %12.0f' % (
+            name, queries, best, parser_args.series / best * 1000))
+
+
+if __name__ == '__main__':
+    main()
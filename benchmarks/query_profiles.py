@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+query_profiles - Benchmark the loading of the meetings with each of the
+                 query profiles.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Usage:
+
+    FEDOCAL_CONFIG=tests/fedocal_test.cfg \\
+        python -m benchmarks.query_profiles [--series 2000] [--managers 3]
+
+Compares, for the meetings of a calendar over six months, the number of
+queries, the rows and bytes returned by the database, the objects loaded
+and the time spent when loading the meetings with their default (joined)
+relationships and with each of the profiles of model.QUERY_PROFILES.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import random
+
+from datetime import date, time, timedelta
+
+from benchmarks import create_session, get_parser, measure, \
+    measure_results, record_queries
+from fedocal import fedocallib
+from fedocal.fedocallib import model
+
+
+def fill_database(session, nb_meetings, nb_managers):
+    """ Create ``nb_meetings`` meetings in the benchmark calendar, each
+    with ``nb_managers`` managers and a reminder, a quarter of them being
+    recursive.
+    """
+    rand = random.Random(42)
+    today = date.today()
+    users = [
+        model.User.get_or_create(session, 'user%03d' % cnt)
+        for cnt in range(50)
+    ]
+    for cnt in range(nb_meetings):
+        start = today + timedelta(days=rand.randint(-60, 200))
+        recursive = cnt % 4 == 0
+        reminder = model.Reminder(
+            'H-24', 'bench@example.com', 'list@example.com',
+            'Generated reminder')
+        session.add(reminder)
+        session.flush()
+        meeting = model.Meeting(
+            meeting_name='Meeting %s' % cnt,
+            meeting_date=start,
+            meeting_date_end=start,
+            meeting_time_start=time(rand.randint(0, 22), 0),
+            meeting_time_stop=time(23, 0),
+            meeting_information='Generated meeting ' * 20,
+            calendar_name='bench_calendar',
+            reminder_id=reminder.reminder_id,
+            recursion_frequency=7 if recursive else None,
+            recursion_ends=start + timedelta(days=180)
+            if recursive else None)
+        session.add(meeting)
+        session.flush()
+        for user in rand.sample(users, nb_managers):
+            model.MeetingsUsers.create(session, meeting, user)
+    session.commit()
+
+
+def main():
+    """ Run the benchmark. """
+    parser = get_parser(__doc__.split('\n\n')[0].strip(), series=2000)
+    parser.add_argument(
+        '--managers', default=3, type=int,
+        help='Number of managers of each meeting.')
+    parser_args = parser.parse_args()
+    session = create_session(parser_args.db_url)
+    fill_database(session, parser_args.series, parser_args.managers)
+
+    start_date = date.today() - timedelta(days=30)
+    end_date = date.today() + timedelta(days=180)
+    print('%s meetings of %s managers' % (
+        parser_args.series, parser_args.managers))
+    print('%-8s %8s %8s %10s %8s %10s' % (
+        'profile', 'queries', 'rows', 'bytes', 'objects', 'ms'))
+    for profile in [None] + sorted(model.QUERY_PROFILES):
+        def run():
+            session.expunge_all()
+            calendarobj = model.Calendar.by_id(session, 'bench_calendar')
+            with record_queries(session) as recorded:
+                fedocallib.get_by_date(
+                    session, calendarobj, start_date, end_date,
+                    extended=False, tzone=None, profile=profile)
+            return recorded
+
+        recorded, best = measure(run, parser_args.repeat)
+        rows, size = measure_results(session, recorded['queries'])
+        print('%-8s %8s %8s %10s %8s %10.2f' % (
+            profile or 'joined', len(recorded['queries']), rows, size,
+            recorded['objects'], best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+recurrence_window - Benchmark the selection of the recursive meetings
+                    having an occurrence in a given window.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Usage:
+
+    FEDOCAL_CONFIG=tests/fedocal_test.cfg \
+        python -m benchmarks.recurrence_window [--series 5000]
+
+Compares, for a week and a month window, the number of rows returned and
+the time spent retrieving and expanding the recursive meetings when only
+filtering on the end of the recursion (as fedocal used to) and when
+filtering on the occurrences in SQL.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import random
+
+from datetime import date, time, timedelta
+
+from sqlalchemy.sql import and_
+
+from benchmarks import create_session, get_parser, measure
+from fedocal.fedocallib import model
+from fedocal.fedocallib.model import Meeting
+
+FREQUENCIES = [7, 14, 21, 28, 91, 182, 364]
+
+
+def fill_database(session, nb_series):
+    """ Add ``nb_series`` live recursive meetings to the benchmark
+    calendar, started over the last five years and ending next year.
+    """
+    rand = random.Random(42)
+    today = date.today()
+    for cnt in range(nb_series):
+        start = today - timedelta(days=rand.randint(0, 5 * 365))
+        session.add(Meeting(
+            meeting_name='Series %s' % cnt,
+            meeting_date=start,
+            meeting_date_end=start,
+            meeting_time_start=time(rand.randint(0, 22), 0),
+            meeting_time_stop=time(23, 0),
+            meeting_information='Generated series',
+            calendar_name='bench_calendar',
+            recursion_frequency=rand.choice(FREQUENCIES),
+            recursion_ends=today + timedelta(days=365)))
+    session.commit()
+
+
+def legacy_query(session, calendar, start_date):
+    """ Retrieve the recursive meetings only filtering on the end of the
+    recursion.
+    """
+    return session.query(Meeting).filter(
+        and_(
+            (Meeting.recursion_ends >= start_date),
+            (Meeting.recursion_ends >= Meeting.meeting_date),
+            (Meeting.calendar == calendar),
+            (Meeting.recursion_frequency != None),
+            (Meeting.recursion_ends != None),
+        )
+    ).all()
+
+
+def main():
+    """ Run the benchmark. """
+    parser_args = get_parser(__doc__.split('\n\n')[0].strip()).parse_args()
+    session = create_session(parser_args.db_url)
+    fill_database(session, parser_args.series)
+    calendar = model.Calendar.by_id(session, 'bench_calendar')
+
+    start_date = date.today()
+    print('%s live recursive meetings' % parser_args.series)
+    print('%-8s %-8s %8s %12s %10s' % (
+        'window', 'query', 'rows', 'occurrences', 'ms'))
+    for label, days in [('week', 6), ('month', 30)]:
+        end_date = start_date + timedelta(days=days)
+        queries = [
+            ('legacy', lambda: legacy_query(session, calendar, start_date)),
+            ('window', lambda: Meeting.get_active_regular_meeting_by_date(
+                session, calendar, start_date, end_date=end_date)),
+        ]
+        for name, query in queries:
+            def run():
+                session.expunge_all()
+                rows = query()
+                return rows, Meeting.expand_regular_meetings(
+                    rows, start_date=start_date, end_date=end_date)
+
+            (rows, occurrences), best = measure(run, parser_args.repeat)
+            print('%-8s %-8s %8s %12s %10.2f' % (
+                label, name, len(rows), len(occurrences), best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""
+reminders - Benchmark the selection of the meetings to remind by the cron
+            job.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Usage:
+
+    FEDOCAL_CONFIG=tests/fedocal_test.cfg \\
+        python -m benchmarks.reminders [--series 5000]
+
+Compares the number of queries and the time spent selecting the meetings
+to remind when running three queries per reminder offset (as fedocal
+used to) and when selecting them all in a single query.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import random
+
+from datetime import datetime, time, timedelta
+
+from sqlalchemy.sql import and_
+
+from benchmarks import count_queries, create_session, get_parser, \
+    measure
+from fedocal.fedocallib import model
+from fedocal.fedocallib import recurrence
+
+OFFSETS = ['H-12', 'H-24', 'H-48', 'H-168']
+
+
+def fill_database(session, nb_series):
+    """ Create ``nb_series`` meetings each with a reminder, half of them
+    being long-running recursive meetings.
+    """
+    rand = random.Random(42)
+    today = datetime.utcnow().date()
+    for cnt in range(nb_series):
+        reminder = model.Reminder(
+            rand.choice(OFFSETS), 'bench@example.com', 'bench@example.com',
+            'Generated reminder')
+        session.add(reminder)
+        session.flush()
+        start = today - timedelta(days=rand.randint(0, 3650))
+        recursive = cnt % 2 == 0
+        session.add(model.Meeting(
+            meeting_name='Meeting %s' % cnt,
+            meeting_date=start if recursive else today + timedelta(
+                days=rand.randint(0, 10)),
+            meeting_date_end=start,
+            meeting_time_start=time(rand.randint(0, 22), 0),
+            meeting_time_stop=time(23, 0),
+            meeting_information='Generated meeting',
+            calendar_name='bench_calendar',
+            reminder_id=reminder.reminder_id,
+            recursion_frequency=rand.choice([1, 7, 14]) if recursive
+            else None,
+            recursion_ends=today + timedelta(days=3650) if recursive
+            else None))
+    session.commit()
+
+
+def legacy_get_meeting_with_reminder(session, start_utc, stop_utc, offset):
+    """ Select the meetings to remind for one offset, as
+    Meeting.get_meeting_with_reminder used to.
+    """
+    Meeting = model.Meeting
+    reminders = session.query(model.Reminder.reminder_id).filter(
+        model.Reminder.reminder_offset == offset).all()
+    reminders = [int(item.reminder_id) for item in reminders]
+    if not reminders:
+        return []
+    meetings = session.query(Meeting).filter(
+        and_(
+            (Meeting.meeting_start_utc >= start_utc),
+            (Meeting.meeting_start_utc < stop_utc),
+            (Meeting.recursion_frequency == None),
+            (Meeting.reminder_id.in_(reminders)))).all()
+
+    one_day = timedelta(days=1)
+    start_date = start_utc.date()
+    recursive_meetings = session.query(Meeting).filter(
+        and_(
+            model.recursion_in_window(
+                start_date - one_day, start_date + one_day),
+            (Meeting.reminder_id.in_(reminders)))).all()
+    for meeting in recursive_meetings:
+        for _, meeting_date, _ in recurrence.iter_occurrences(
+                meeting, start_date - one_day, start_date + one_day):
+            meeting_start = model.to_utc(
+                meeting_date, meeting.meeting_time_start,
+                meeting.meeting_timezone)
+            if start_utc <= meeting_start < stop_utc \
+                    and meeting not in meetings:
+                meetings.append(meeting)
+    return meetings
+
+
+def per_offset(session, windows):
+    """ Select the meetings to remind offset by offset. """
+    meetings = []
+    for offset, (start_utc, stop_utc) in windows.items():
+        meetings.extend(legacy_get_meeting_with_reminder(
+            session, start_utc, stop_utc, offset))
+    return meetings
+
+
+def single_query(session, windows):
+    """ Select the meetings to remind of all the offsets at once. """
+    return model.Meeting.get_meetings_to_remind(session, windows)
+
+
+def main():
+    """ Run the benchmark. """
+    parser_args = get_parser(__doc__.split('\n\n')[0].strip()).parse_args()
+    session = create_session(parser_args.db_url)
+    fill_database(session, parser_args.series)
+
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    windows = dict(
+        (offset, (
+            now + timedelta(hours=int(offset[2:])),
+            now + timedelta(hours=int(offset[2:]), minutes=30)))
+        for offset in OFFSETS)
+
+    print('%s meetings' % parser_args.series)
+    print('%-14s %8s %8s %10s' % ('method', 'queries', 'meetings', 'ms'))
+    for name, function in [
+            ('per offset', per_offset),
+            ('single query', single_query)]:
+        def run():
+            session.expunge_all()
+            with count_queries(session) as counter:
+                meetings = function(session, windows)
+            return counter[0], meetings
+
+        (queries, meetings), best = measure(run, parser_args.repeat)
+        print('%-14s %8s %8s %10.2f' % (name, queries, len(meetings), best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+timezones - Benchmark the conversion of the meetings from one timezone
+            to another.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Usage:
+
+    FEDOCAL_CONFIG=tests/fedocal_test.cfg \\
+        python -m benchmarks.timezones [--series 10000]
+
+Compares the time spent converting meetings and formatting them for the
+week view with uncached timezone look-ups and with the cached ones. No
+database is needed, the meetings are only built in memory.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import random
+
+from datetime import datetime, time, timedelta
+
+import pytz
+
+from benchmarks import get_parser, measure
+from fedocal import fedocallib
+from fedocal.fedocallib import model
+
+TIMEZONES = ['UTC', 'Europe/Paris', 'America/New_York', 'Asia/Tokyo',
+             'Australia/Sydney', 'America/Sao_Paulo']
+
+
+def legacy_convert_time(timeobj, tzfrom, tzto):
+    """ Convert the datetime resolving both timezones at every call. """
+    timez_from = pytz.timezone(tzfrom)
+    timez_to = pytz.timezone(tzto)
+    timeobj_from = timez_from.localize(timeobj)
+    return timeobj_from.astimezone(timez_to)
+
+
+def generate_meetings(nb_meetings, week_start):
+    """ Build ``nb_meetings`` meetings over the week starting at
+    week_start in random timezones.
+    """
+    rand = random.Random(42)
+    meetings = []
+    for cnt in range(nb_meetings):
+        day = week_start + timedelta(days=rand.randint(0, 6))
+        hour = rand.randint(0, 22)
+        meetings.append(model.Meeting(
+            meeting_name='Meeting %s' % cnt,
+            meeting_date=day,
+            meeting_date_end=day,
+            meeting_time_start=time(hour, rand.choice([0, 30])),
+            meeting_time_stop=time(hour + 1, 0),
+            meeting_information='Generated meeting',
+            calendar_name='bench_calendar',
+            meeting_timezone=rand.choice(TIMEZONES)))
+    return meetings
+
+
+def convert_all(meetings, convert):
+    """ Convert all the meetings to UTC and back using the provided
+    function, as format_week_meeting does.
+    """
+    for meeting in meetings:
+        start = datetime.combine(
+            meeting.meeting_date, meeting.meeting_time_start)
+        convert(start, meeting.meeting_timezone, 'UTC')
+        convert(start, meeting.meeting_timezone, meeting.meeting_timezone)
+        convert(start, meeting.meeting_timezone, meeting.meeting_timezone)
+
+
+def main():
+    """ Run the benchmark. """
+    parser_args = get_parser(
+        __doc__.split('\n\n')[0].strip(), series=10000).parse_args()
+    week_start = fedocallib.get_start_week()
+    meetings = generate_meetings(parser_args.series, week_start)
+
+    print('%s meetings' % parser_args.series)
+    print('%-28s %10s' % ('function', 'ms'))
+    for name, function in [
+            ('convert_time (uncached)',
+             lambda: convert_all(meetings, legacy_convert_time)),
+            ('convert_time (cached)',
+             lambda: convert_all(meetings, fedocallib.convert_time)),
+            ('format_week_meeting',
+             lambda: fedocallib.format_week_meeting(
+                 meetings, 'Europe/Paris', week_start)),
+    ]:
+        _, best = measure(function, parser_args.repeat)
+        print('%-28s %10.2f' % (name, best))
+
+
+if __name__ == '__main__':
+    main()
@@ -27,6 +27,7 @@ from __future__ import unicode_literals, absolute_import, print_function
 __version__ = '0.16'
 
 import datetime
+import hashlib
 import logging
 import textwrap
 import os
@@ -41,7 +42,6 @@ import markdown
 import munch
 import six
 import six.moves
-import vobject
 from dateutil.relativedelta import relativedelta
 from flask_oidc import OpenIDConnect
 from functools import wraps
@@ -58,6 +58,7 @@ from fedocal.fedocal_babel import format_datetime
 
 import fedocal.forms as forms
 import fedocal.fedocallib as fedocallib
+from fedocal.fedocallib import feeds
 import fedocal.mail_logging
 from fedocal.fedocallib.exceptions import FedocalException
 from fedocal.fedocallib.model import (Calendar, Meeting)
@@ -115,7 +116,20 @@ APP.add_url_rule(
 OIDC = OpenIDConnect(APP, credentials_store=flask.session )
 
 APP.wsgi_app = ProxyFix(APP.wsgi_app, x_proto=1, x_host=1)
-SESSION = fedocallib.create_session(APP.config['DB_URL'])
+SESSION = fedocallib.create_session(
+    APP.config['DB_URL'], **fedocallib.get_session_options(APP.config))
+# Read-only session, on the read replica if there is one, see read_session
+if APP.config.get('DB_REPLICA_URL'):  # pragma: no cover
+    READ_SESSION = fedocallib.create_session(
+        APP.config['DB_REPLICA_URL'], read_only=True,
+        **fedocallib.get_session_options(APP.config))
+else:
+    READ_SESSION = fedocallib.create_read_session(SESSION)
+fedocallib.cache.configure(APP.config)
+fedmsg.configure(APP.config)
+fedocallib.serializer.configure(APP.config)
+fedocallib.model.STRICT_LOADING = bool(
+    APP.config.get('DB_STRICT_LOADING', False))
 
 if not APP.debug:
     APP.logger.addHandler(fedocal.mail_logging.get_mail_handler(
@@ -269,6 +283,7 @@ def format_header_date(value):
 def shutdown_session(exception=None):
     """ Remove the DB session at the end of each request. """
     SESSION.remove()
+    READ_SESSION.remove()
 
 
 # pylint: disable=W0613
@@ -294,6 +309,15 @@ def set_session():
         flask.g.fas_user = None
 
 
+# Local function
+def read_session():
+    """ Return the session to use in the views only reading from the
+    database: a read-only session, on the read replica if there is one.
+    Nothing is ever written with it.
+    """
+    return READ_SESSION
+
+
 # Local function
 def is_admin():
     """ Return whether the user is admin for this application or not. """
@@ -372,6 +396,60 @@ def get_timezone():
     return tzone
 
 
+def calendar_etag(calendarobj, *args):
+    """ Return the ETag of a page presenting the specified calendar, built
+    from the generation of the calendar, the URL requested and the other
+    arguments provided that the page depends on.
+    """
+    variant = '|'.join(
+        six.text_type(arg)
+        for arg in (calendarobj.calendar_name, flask.request.full_path)
+        + args)
+    return '%s-%s' % (
+        calendarobj.calendar_generation,
+        hashlib.sha1(variant.encode('utf-8')).hexdigest())
+
+
+def html_calendar_etag(calendarobj):
+    """ Return the ETag of a HTML page presenting the specified calendar
+    or None if the page cannot be cached because messages are waiting to
+    be flashed.
+    The page also depends on the user, its timezone and language, the
+    current date and the list of all the calendars.
+    """
+    if flask.session.get('_flashes'):
+        return None
+    user = None
+    if authenticated():
+        user = '%s:%s' % (
+            flask.g.fas_user.username,
+            ','.join(sorted(flask.g.fas_user.groups or [])))
+    return calendar_etag(
+        calendarobj, user, get_timezone(), get_locale(),
+        datetime.date.today(), *Calendar.get_last_change(read_session()))
+
+
+def not_modified(etag, last_modified=None):
+    """ Return a 304 response if the client already has the version of
+    the page having the specified ETag, None otherwise.
+    """
+    if etag and flask.request.if_none_match.contains_weak(etag):
+        return set_validators(
+            flask.Response(status=304), etag, last_modified)
+    return None
+
+
+def set_validators(response, etag, last_modified=None):
+    """ Set the ETag and Last-Modified headers of the provided response
+    and return it.
+    """
+    if etag:
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+    return response
+
+
 def chunks(item_list, chunks_size):
     """ Yield successive n-sized chunks from item_list.
     """
@@ -452,7 +530,8 @@ def calendar(calendar_name, year=None, month=None, day=None, mid=None):
     :arg month: the month of the date one would like to consult.
     :arg day: the day of the date one would like to consult.
     """
-    calendarobj = Calendar.by_id(SESSION, calendar_name)
+    session = read_session()
+    calendarobj = Calendar.by_id(session, calendar_name)
     if not calendarobj:
         flask.flash(
             gettext(
@@ -462,15 +541,17 @@ def calendar(calendar_name, year=None, month=None, day=None, mid=None):
             'errors')
         return flask.redirect(flask.url_for('index'))
 
+    etag = html_calendar_etag(calendarobj)
+    response = not_modified(etag, calendarobj.calendar_updated)
+    if response:
+        return response
+
     week_start = fedocallib.get_start_week(year, month, day)
     weekdays = fedocallib.get_week_days(year, month, day)
-    week = fedocallib.get_week(SESSION, calendarobj, year, month, day)
 
     tzone = get_timezone()
-    meetings = fedocallib.format_week_meeting(
-        week.meetings, tzone, week_start)
-    full_day_meetings = fedocallib.format_full_day_meeting(
-        week.full_day_meetings, week_start)
+    meetings, full_day_meetings = fedocallib.get_week_grid(
+        session, calendarobj, week_start, tzone)
 
     # Information required for the pagination
     next_week = fedocallib.get_next_week(
@@ -493,14 +574,14 @@ def calendar(calendar_name, year=None, month=None, day=None, mid=None):
         inmonth = today.month
 
     busy_days = fedocallib.get_days_of_month_calendar(
-        SESSION, calendarobj, year=inyear, month=inmonth,
+        session, calendarobj, year=inyear, month=inmonth,
         tzone=tzone)
 
     curmonth_cal = fedocallib.get_html_monthly_cal(
         year=year, month=month, day=day, calendar_name=calendar_name,
         busy_days=busy_days)
 
-    return flask.render_template(
+    response = flask.make_response(flask.render_template(
         'agenda.html',
         now=datetime.datetime.utcnow(),
         calendar=calendarobj,
@@ -515,7 +596,8 @@ def calendar(calendar_name, year=None, month=None, day=None, mid=None):
         prev_week=prev_week,
         curmonth_cal=curmonth_cal,
         calendar_admin=is_calendar_admin(calendarobj),
-        calendar_editor=is_calendar_manager(calendarobj))
+        calendar_editor=is_calendar_manager(calendarobj)))
+    return set_validators(response, etag, calendarobj.calendar_updated)
 
 
 @APP.route('/list/<calendar_name>/')
@@ -575,7 +657,8 @@ def calendar_list(calendar_name, year=None, month=None, day=None):
     else:
         end_date = start_date + relativedelta(days=+1)
 
-    calendarobj = Calendar.by_id(SESSION, calendar_name)
+    session = read_session()
+    calendarobj = Calendar.by_id(session, calendar_name)
     if not calendarobj:
         flask.flash(
             gettext('No calendar named %(name)s could be found',
@@ -583,10 +666,15 @@ def calendar_list(calendar_name, year=None, month=None, day=None):
             'errors')
         return flask.redirect(flask.url_for('index'))
 
+    etag = html_calendar_etag(calendarobj)
+    response = not_modified(etag, calendarobj.calendar_updated)
+    if response:
+        return response
+
     tzone = get_timezone()
     meetings = fedocallib.get_by_date(
-        SESSION, calendarobj, start_date, end_date, tzone,
-        name=subject)
+        session, calendarobj, start_date, end_date, tzone,
+        name=subject, profile='list')
 
     month_name = datetime.date.today().strftime('%B')
 
@@ -602,14 +690,14 @@ def calendar_list(calendar_name, year=None, month=None, day=None):
         inmonth = today.month
 
     busy_days = fedocallib.get_days_of_month_calendar(
-        SESSION, calendarobj, year=inyear, month=inmonth,
+        session, calendarobj, year=inyear, month=inmonth,
         tzone=tzone)
 
     curmonth_cal = fedocallib.get_html_monthly_cal(
         year=year, month=month, day=day, calendar_name=calendar_name,
         busy_days=busy_days)
 
-    return flask.render_template(
+    response = flask.make_response(flask.render_template(
         'meeting_list.html',
         calendar=calendarobj,
         month=month_name,
@@ -622,7 +710,8 @@ def calendar_list(calendar_name, year=None, month=None, day=None):
         prev_week=prev_week,
         curmonth_cal=curmonth_cal,
         calendar_admin=is_calendar_admin(calendarobj),
-        today=datetime.date.today())
+        today=datetime.date.today()))
+    return set_validators(response, etag, calendarobj.calendar_updated)
 
 
 @APP.route('/ical/')
@@ -632,11 +721,9 @@ def ical_all():
     """
     startd = datetime.date.today() - datetime.timedelta(days=30)
     endd = datetime.date.today() + datetime.timedelta(days=180)
-    ical = vobject.iCalendar()
-    meetings = []
-    for calendarobj in Calendar.get_all(SESSION):
-        meetings.extend(fedocallib.get_by_date(
-            SESSION, calendarobj, startd, endd, extended=False))
+    meetings = fedocallib.get_by_date(
+        read_session(), None, startd, endd, extended=False,
+        profile='ical')
     try:
         reminder = datetime.timedelta(
             minutes=-1 * int(
@@ -645,7 +732,6 @@ def ical_all():
         )
     except ValueError:
         reminder = None
-    fedocallib.add_meetings_to_vcal(ical, meetings, reminder=reminder)
     headers = {}
     filename = secure_filename(
         'all_calendars-%s.ical' % (
@@ -653,7 +739,8 @@ def ical_all():
     )
     headers["Content-Disposition"] = "attachment; filename=%s" % filename
     return flask.Response(
-        ical.serialize(),
+        flask.stream_with_context(
+            feeds.iter_feed(meetings, reminder=reminder)),
         mimetype='text/calendar',
         headers=headers)
 
@@ -668,14 +755,21 @@ def ical_out(calendar_name):
     """
     startd = datetime.date.today() - datetime.timedelta(days=30)
     endd = datetime.date.today() + datetime.timedelta(days=180)
-    calendarobj = Calendar.by_id(SESSION, calendar_name)
+    session = read_session()
+    calendarobj = Calendar.by_id(session, calendar_name)
 
     if not calendarobj:
         return flask.abort(404)
 
+    # The feed covers a window moving with the current date
+    etag = calendar_etag(calendarobj, startd)
+    response = not_modified(etag, calendarobj.calendar_updated)
+    if response:
+        return response
+
     meetings = fedocallib.get_by_date(
-        SESSION, calendarobj, startd, endd, extended=False, tzone=False)
-    ical = vobject.iCalendar()
+        session, calendarobj, startd, endd, extended=False, tzone=False,
+        profile='ical')
     try:
         reminder = datetime.timedelta(
             minutes=-1 * int(
@@ -684,7 +778,6 @@ def ical_out(calendar_name):
         )
     except ValueError:
         reminder = None
-    fedocallib.add_meetings_to_vcal(ical, meetings, reminder=reminder)
     headers = {}
     filename = secure_filename(
         '%s-%s.ical' % (
@@ -692,13 +785,11 @@ def ical_out(calendar_name):
             datetime.datetime.utcnow().strftime('%Y-%m-%d %Hh%M'))
     )
     headers["Content-Disposition"] = "attachment; filename=%s" % filename
-    output = ical.serialize()
-    output = output.replace('TZID:', 'TZID:fedocal_')
-    output = output.replace('TZID=', 'TZID=fedocal_')
-    return flask.Response(
-        output,
-        mimetype='text/calendar',
-        headers=headers)
+    output = flask.stream_with_context(feeds.iter_feed(
+        meetings, reminder=reminder, tzid_prefix='fedocal_'))
+    return set_validators(
+        flask.Response(output, mimetype='text/calendar', headers=headers),
+        etag, calendarobj.calendar_updated)
 
 
 @APP.route('/ical/calendar/meeting/<int:meeting_id>/')
@@ -707,10 +798,9 @@ def ical_calendar_meeting(meeting_id):
 
     :arg meeting_id: the identifier of a meeting
     """
-    meeting = Meeting.by_id(SESSION, meeting_id)
+    meeting = Meeting.by_id(read_session(), meeting_id)
     if not meeting:
         return flask.abort(404)
-    ical = vobject.iCalendar()
     try:
         reminder = datetime.timedelta(
             minutes=-1 * int(
@@ -719,7 +809,6 @@ def ical_calendar_meeting(meeting_id):
         )
     except ValueError:
         reminder = None
-    fedocallib.add_meeting_to_vcal(ical, meeting, reminder=reminder)
     headers = {}
     filename = secure_filename(
         '%s-%s-%s.ical' % (
@@ -727,9 +816,8 @@ def ical_calendar_meeting(meeting_id):
             datetime.datetime.utcnow().strftime('%Y-%m-%d %Hh%M'))
     )
     headers["Content-Disposition"] = "attachment; filename=%s" % filename
-    output = ical.serialize()
-    output = output.replace('TZID:', 'TZID:fedocal_')
-    output = output.replace('TZID=', 'TZID=fedocal_')
+    output = feeds.build_feed(
+        [meeting], reminder=reminder, tzid_prefix='fedocal_')
     return flask.Response(
         output,
         mimetype='text/calendar',
@@ -1686,7 +1774,7 @@ def location_list(loc_name, year, month, day):
 
     tzone = get_timezone()
     meetings = fedocallib.get_by_date_at_location(
-        SESSION, loc_name, start_date, end_date, tzone)
+        SESSION, loc_name, start_date, end_date, tzone, profile='list')
 
     month_name = datetime.date.today().strftime('%B')
 
@@ -1782,8 +1870,10 @@ def upload_calendar(calendar_name):
                 'upload_calendar.html', form=form, calendar=calendarobj)
 
         try:
+            # The file is read and parsed one event at a time
             fedocallib.add_vcal_file(
-                SESSION, calendarobj, ical_file.read(), flask.g.fas_user, is_admin())
+                SESSION, calendarobj, ical_file.stream, flask.g.fas_user,
+                is_admin())
             flask.flash(gettext('Calendar uploaded'))
         except FedocalException as err:  # pragma: no cover
             flask.flash("%s" % err, 'error')
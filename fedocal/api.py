@@ -26,15 +26,18 @@ from __future__ import unicode_literals, absolute_import, print_function
 
 
 import datetime
+import functools
 import json
 from dateutil import parser
 
 import flask
 from sqlalchemy.exc import SQLAlchemyError
 
+import fedocal
 import fedocal.fedocallib as fedocallib
+import fedocal.fedocallib.fedmsgshim as fedmsg
 from fedocal.doc_utils import load_doc
-from fedocal import APP, SESSION, LOG
+from fedocal import APP, LOG
 from fedocal.fedocallib.model import Calendar
 
 
@@ -43,7 +46,17 @@ def check_callback(response):
     JQuery ajax calls.
     """
     callback = flask.request.args.get('callback', None)
-    if callback:
+    if callback and response.status_code == 304:
+        # Not Modified responses have no body to wrap
+        pass
+    elif callback and response.is_streamed:
+        response = flask.Response(
+            response=_wrap_stream(callback, response.response),
+            status=response.status_code,
+            headers=response.headers,
+            mimetype='application/javascript',
+        )
+    elif callback:
         response = flask.Response(
             response="%s(%s);" % (callback, response.response),
             status=response.status_code,
@@ -52,6 +65,33 @@ def check_callback(response):
     return response
 
 
+def stats_required(function):
+    """ Flask decorator restricting the access to the statistics of the
+    process to the admins, unless API_STATS is set in the configuration.
+    """
+    @functools.wraps(function)
+    def decorated_function(*args, **kwargs):
+        """ Decorated function, actually does the work. """
+        if not APP.config.get('API_STATS', False) \
+                and not fedocal.is_admin():
+            output = {"error": "Only available to the admins"}
+            return flask.Response(
+                response=json.dumps(output),
+                status=403,
+                mimetype='application/json')
+        return function(*args, **kwargs)
+    return decorated_function
+
+
+def _wrap_stream(callback, chunks):
+    """ Yield the provided chunks of a streamed response as the argument
+    of the callback. """
+    yield "%s(" % callback
+    for chunk in chunks:
+        yield chunk
+    yield ");"
+
+
 # API
 @APP.route('/api/')
 def api():
@@ -122,7 +162,7 @@ Sample response:
         """ Handle case the query was an JQuery ajax call. """
         return check_callback(response)
 
-    calendars = fedocallib.get_calendars(SESSION)
+    calendars = fedocallib.get_calendars(fedocal.read_session())
 
     output = {"calendars": [calendar.to_json() for calendar in calendars]}
 
@@ -160,7 +200,7 @@ Sample response:
         """ Handle case the query was an JQuery ajax call. """
         return check_callback(response)
 
-    list_locations = fedocallib.get_locations(SESSION)
+    list_locations = fedocallib.get_locations(fedocal.read_session())
 
     output = {"locations": list_locations}
 
@@ -215,7 +255,8 @@ Sample response:
     if '*' not in keyword:
         keyword = '*%s*' % keyword
 
-    list_locations = fedocallib.search_locations(SESSION, keyword)
+    list_locations = fedocallib.search_locations(
+        fedocal.read_session(), keyword)
 
     # filter out all locations containing '#'
     # https://fedorahosted.org/fedocal/ticket/118
@@ -325,6 +366,11 @@ Filter arguments
 ``calendar``
   Restrict the meetings to a specific calendar.
 
+  The responses restricted to a calendar carry an ``ETag`` header, the
+  requests sending it back in an ``If-None-Match`` header receive an
+  empty ``304 Not Modified`` response as long as the calendar did not
+  change.
+
   Default: all calendars
 
 ``region``
@@ -336,6 +382,44 @@ Filter arguments
 
   Default: all regions
 
+Recurring meetings
+------------------
+
+``expand``
+  By default the recurring meetings are expanded: every occurrence
+  happening in the timeframe is returned as a meeting of its own.
+
+  With ``expand=false`` each recurring meeting having at least one
+  occurrence in the timeframe is returned once, with the information of
+  its first occurrence and a ``recursion`` item describing how to expand
+  it. This item is ``null`` for the meetings which do not recur.
+
+  Default: true
+  Can be:  false, 0, f
+
+Sample ``recursion`` item:
+
+.. code-block:: javascript
+
+    "recursion": {
+        "frequency": 7,
+        "ends": "2013-12-31",
+        "dtstart": "2013-05-27T23:00:00",
+        "rrule": "FREQ=WEEKLY;INTERVAL=1;UNTIL=20131231T230000Z",
+        "exdate": []
+    }
+
+The occurrences start every ``frequency`` days from ``dtstart`` until the
+``ends`` date (included). ``dtstart`` is expressed in the
+``meeting_timezone`` of the meeting: the occurrences have to be computed
+in that timezone and then converted to UTC, so that they follow its DST
+rules. ``rrule`` expresses the same as an iCalendar (RFC 5545)
+recurrence rule applying to ``dtstart``. The occurrences listed in
+``exdate`` are to be skipped, fedocal currently splits the series
+instead so this list is always empty. Each occurrence lasts as long as
+the first one, the occurrences out of the timeframe are for the clients
+to filter out.
+
     """
     @flask.after_this_request
     def callback(response):
@@ -374,9 +458,12 @@ Filter arguments
     location = flask.request.args.get('location', None)
     region = flask.request.args.get('region', None)
     location = location or region
+    expand = flask.request.args.get('expand', True)
+    expand = str(expand).lower() not in ['0', 'false', 'f']
 
+    session = fedocal.read_session()
     if calendar_name:
-        calendarobj = Calendar.by_id(SESSION, calendar_name)
+        calendarobj = Calendar.by_id(session, calendar_name)
 
         if not calendarobj:
             output = {
@@ -387,6 +474,11 @@ Filter arguments
                 status=400,
                 mimetype='application/json')
 
+        etag = fedocal.calendar_etag(calendarobj, startd, endd)
+        response = fedocal.not_modified(etag, calendarobj.calendar_updated)
+        if response:
+            return response
+
     status = 200
     meetings = []
     try:
@@ -394,24 +486,27 @@ Filter arguments
             if location:
                 # print "calendar and region"
                 meetings = fedocallib.get_meetings_by_date_and_location(
-                    SESSION, calendar_name, startd, endd, location)
+                    session, calendar_name, startd, endd, location,
+                    profile='json')
             else:
                 # print "calendar and no region"
                 meetings = fedocallib.get_by_date(
-                    SESSION, calendarobj, startd, endd)
+                    session, calendarobj, startd, endd, extended=expand,
+                    profile='json')
         else:
             meetings = []
             if location:
                 # print "no calendar and region"
                 meetings.extend(
                     fedocallib.get_by_date_at_location(
-                        SESSION, location, startd, endd)
+                        session, location, startd, endd, extended=expand,
+                        profile='json')
                 )
             else:
                 # print "no calendar and no region"
-                for calendar in fedocallib.get_calendars(SESSION):
-                    meetings.extend(fedocallib.get_by_date(
-                        SESSION, calendar, startd, endd))
+                meetings = fedocallib.get_by_date(
+                    session, None, startd, endd, extended=expand,
+                    profile='json')
     except SQLAlchemyError as err:  # pragma: no cover
         status = 500
         LOG.debug('Error in api_meetings')
@@ -425,16 +520,20 @@ Filter arguments
         'location': location,
     }
 
-    meetings_json = []
-    for meeting in meetings:
-        meetings_json.append(meeting.to_json())
-    output['meetings'] = meetings_json
-
-    return flask.Response(
-        response=json.dumps(output),
+    # Stream the list of meetings, large responses are sent while they
+    # are serialized
+    serialize = fedocallib.serializer.MeetingSerializer(recursion=not expand)
+    response = flask.Response(
+        response=flask.stream_with_context(fedocallib.serializer.iterencode(
+            output, 'meetings',
+            (serialize(meeting) for meeting in meetings))),
         status=status,
         mimetype='application/json'
     )
+    if calendar_name and status == 200:
+        fedocal.set_validators(
+            response, etag, calendarobj.calendar_updated)
+    return response
 
 
 @APP.route('/api/<username>/shield/<calendar_name>/')
@@ -480,7 +579,8 @@ endpoint raises a 404.
     else:
         always = True
 
-    calendarobj = Calendar.by_id(SESSION, calendar_name)
+    session = fedocal.read_session()
+    calendarobj = Calendar.by_id(session, calendar_name)
     if not calendarobj:
         flask.abort(400, 'Invalid calendar provided')
 
@@ -488,7 +588,8 @@ endpoint raises a 404.
     end_date = start_date + datetime.timedelta(days=1)
 
     meetings = fedocallib.get_by_date(
-        SESSION, calendarobj, start_date, end_date, tzone='UTC')
+        session, calendarobj, start_date, end_date, tzone='UTC',
+        profile='json')
 
     green, red = 'brightgreen', 'red'
 
@@ -508,3 +609,140 @@ endpoint raises a 404.
         return flask.redirect(output)
     else:
         flask.abort(404)
+
+
+@APP.route('/api/cache/')
+@stats_required
+def api_cache():
+    """
+Cache statistics
+================
+
+The ``/api/cache/`` endpoint returns the number of hits and misses of the
+cache of the week and month views of the calendars.
+
+It is only available to the admins, unless ``API_STATS`` is enabled in
+the configuration.
+
+Sample response:
+
+.. code-block:: javascript
+
+    {
+        "backend": "MemoryCache",
+        "hits": 42,
+        "misses": 12,
+        "size": 12
+    }
+    """
+    @flask.after_this_request
+    def callback(response):
+        """ Handle case the query was an JQuery ajax call. """
+        return check_callback(response)
+
+    return flask.Response(
+        response=json.dumps(fedocallib.cache.stats()),
+        status=200,
+        mimetype='application/json'
+    )
+
+
+@APP.route('/api/messages/')
+@stats_required
+def api_messages():
+    """
+Messages statistics
+===================
+
+The ``/api/messages/`` endpoint returns the number of messages waiting in
+the publishing queue and in the spool, the number of messages published
+and the time (in seconds) between queuing a message and publishing it.
+
+It is only available to the admins, unless ``API_STATS`` is enabled in
+the configuration.
+
+Sample response:
+
+.. code-block:: javascript
+
+    {
+        "batches": 12,
+        "failed": 0,
+        "latency_avg": 0.012,
+        "latency_last": 0.008,
+        "latency_max": 0.154,
+        "published": 42,
+        "queue": 0,
+        "replayed": 3,
+        "send_avg": 0.006,
+        "spool": 0,
+        "spooled": 3
+    }
+
+``queue`` is ``null`` when the messages are published directly.
+    """
+    @flask.after_this_request
+    def callback(response):
+        """ Handle case the query was an JQuery ajax call. """
+        return check_callback(response)
+
+    return flask.Response(
+        response=json.dumps(fedmsg.stats()),
+        status=200,
+        mimetype='application/json'
+    )
+
+
+@APP.route('/api/db/')
+@stats_required
+def api_db():
+    """
+Database statistics
+===================
+
+The ``/api/db/`` endpoint describes the pools of connections to the
+database and to its read replica (``null`` if there is none) of the
+process answering: the number of connections checked out and the time
+(in seconds) spent waiting for one.
+
+It is only available to the admins, unless ``API_STATS`` is enabled in
+the configuration.
+
+Sample response:
+
+.. code-block:: javascript
+
+    {
+        "primary": {
+            "checkedout": 1,
+            "checkouts": 1204,
+            "overflow": -4,
+            "pool": "TimedQueuePool",
+            "size": 5,
+            "status": "Pool size: 5  Connections in pool: 0 ...",
+            "timeouts": 0,
+            "wait_avg": 0.0002,
+            "wait_max": 0.012,
+            "wait_total": 0.241
+        },
+        "replica": null
+    }
+    """
+    @flask.after_this_request
+    def callback(response):
+        """ Handle case the query was an JQuery ajax call. """
+        return check_callback(response)
+
+    output = {
+        'primary': fedocallib.pool.get_pool_stats(fedocal.SESSION),
+        'replica': None,
+    }
+    if APP.config.get('DB_REPLICA_URL'):  # pragma: no cover
+        output['replica'] = fedocallib.pool.get_pool_stats(
+            fedocal.READ_SESSION)
+
+    return flask.Response(
+        response=json.dumps(output),
+        status=200,
+        mimetype='application/json'
+    )
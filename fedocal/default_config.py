@@ -34,6 +34,31 @@ PERMANENT_SESSION_LIFETIME = timedelta(hours=1)
 # url to the database server:
 DB_URL = 'sqlite:////var/tmp/fedocal_dev.sqlite'
 
+# Pool of connections to the database (ignored with SQLite): each process
+# keeps DB_POOL_SIZE connections open and opens up to DB_MAX_OVERFLOW more
+# when they are all used, a request waits at most DB_POOL_TIMEOUT seconds
+# for one. The connections are opened again after DB_POOL_RECYCLE seconds
+# and, if DB_POOL_PRE_PING is True, tested before being used so that the
+# ones closed by the server are replaced.
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+DB_POOL_TIMEOUT = 30
+DB_POOL_RECYCLE = 3600
+DB_POOL_PRE_PING = True
+# Number of seconds after which the database cancels a query (PostgreSQL
+# and MySQL only), None for no limit.
+DB_STATEMENT_TIMEOUT = None
+
+# The pages only load the information about the meetings they need, if
+# True accessing the other information raises an error instead of querying
+# the database (useful to find the pages querying too much).
+DB_STRICT_LOADING = False
+
+# url to a read replica of the database used by the pages and the API
+# only reading from it (calendars, lists, iCal feeds), None to use DB_URL.
+# The pool settings above also apply to it.
+DB_REPLICA_URL = None
+
 
 # The FAS group in which the admin of fedocal are
 ADMIN_GROUP = 'fedocal_admin'
@@ -47,6 +72,39 @@ SMTP_SERVER = 'localhost'
 # The cron job can be set with any frequency but fedocal_cron
 CRON_FREQUENCY = 30
 
+# The reminders are added to an outbox REMINDER_HORIZON days ahead, the
+# ones which should have been sent up to REMINDER_CATCHUP hours ago are
+# still sent if their meeting did not start.
+REMINDER_HORIZON = 8
+REMINDER_CATCHUP = 24
+# A cron job has REMINDER_LEASE seconds to send the reminders it claimed,
+# the ones it could not send are tried again after REMINDER_RETRY_DELAY
+# seconds (doubled at each attempt), up to REMINDER_MAX_ATTEMPTS times.
+REMINDER_LEASE = 300
+REMINDER_RETRY_DELAY = 300
+REMINDER_MAX_ATTEMPTS = 5
+
+# The messages are published on fedora-messaging from a background thread
+# through a queue of at most PUBLISH_QUEUE_SIZE messages (0 to publish
+# them directly), PUBLISH_BATCH_SIZE messages at a time. While the broker
+# cannot be reached they are kept in the PUBLISH_SPOOL SQLite file (in
+# memory if None) and published again after PUBLISH_RETRY_DELAY seconds,
+# doubled at each attempt up to PUBLISH_MAX_RETRY_DELAY seconds.
+PUBLISH_QUEUE_SIZE = 1000
+PUBLISH_BATCH_SIZE = 50
+PUBLISH_SPOOL = '/var/tmp/fedocal_messages.sqlite'
+PUBLISH_RETRY_DELAY = 5
+PUBLISH_MAX_RETRY_DELAY = 300
+
+# Library producing the JSON of the API: 'orjson', 'json' (the standard
+# library) or 'auto' to use orjson when it is installed.
+JSON_BACKEND = 'auto'
+
+# Whether everyone may read the statistics of the cache, of the messages
+# and of the database (/api/cache/, /api/messages/ and /api/db/), they are
+# otherwise only available to the admins.
+API_STATS = False
+
 # Path to the alembic configuration file
 PATH_ALEMBIC_INI = os.path.join(
     os.path.dirname(os.path.abspath(__file__)),
@@ -73,6 +131,18 @@ LANGUAGES = {
     'fr': 'Français'
 }
 
+# Cache of the week and month views of the calendars, the entries of a
+# calendar are invalidated when one of its meetings changes.
+# Backend to use: None (disabled), 'memory' (one cache per process) or
+# 'memcached' (shared by all the processes, requires python-memcached).
+CACHE_BACKEND = None
+# Number of seconds the entries are kept in the cache.
+CACHE_TTL = 300
+# Maximum number of entries kept by the 'memory' backend.
+CACHE_SIZE = 512
+# Servers used by the 'memcached' backend.
+CACHE_SERVERS = ['127.0.0.1:11211']
+
 # Options for iCal remind before dropdown
 ICAL_REMINDER_OPTIONS = (
     ('5', '5 minutes'),
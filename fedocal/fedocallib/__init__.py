@@ -15,7 +15,7 @@ license.
 """
 from __future__ import unicode_literals, absolute_import, print_function
 
-import copy
+import collections
 import logging
 import operator
 from datetime import datetime
@@ -30,15 +30,26 @@ import six
 import pytz
 import vobject
 from sqlalchemy import create_engine
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import event
+from sqlalchemy import insert
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
 
 from fedocal.fedocallib.week import Week
 from fedocal.fedocallib.model import (
-    CalendarStatus, Calendar, Reminder, Meeting)
+    CalendarStatus, Calendar, Reminder, Meeting, MeetingOccurrence,
+    LocalizedMeeting, MeetingsUsers, ReminderOutbox, User, to_utc)
+from fedocal.fedocallib import cache
 from fedocal.fedocallib import dbaction
-from fedocal.fedocallib.exceptions import UserNotAllowed, InvalidMeeting
+from fedocal.fedocallib import pool
+from fedocal.fedocallib import recurrence
+from fedocal.fedocallib import serializer
+from fedocal.fedocallib.timezones import (
+    get_timezone, get_timezone_lookup, localize)
+from fedocal.fedocallib.exceptions import (
+    FedocalException, UserNotAllowed, InvalidMeeting)
 
 from fedocal.fedocallib.fedora_calendar import FedocalCalendar
 
@@ -51,6 +62,19 @@ HOURS = ['00', '01', '02', '03', '04', '05', '06', '07', '08', '09',
          '10', '11', '12', '13', '14', '15', '16', '17', '18', '19',
          '20', '21', '22', '23', '24']
 
+# The week view is a grid of 7 days of 48 slots of 30 minutes, the keys
+# of the slots are ['00h00', '00h30', '01h00', ... '23h30']
+SLOTS_PER_DAY = 48
+SLOT_KEYS = [
+    '%sh%s' % (hour, minute)
+    for hour in HOURS[:-1]
+    for minute in ['00', '30']
+]
+
+# The information shown about a meeting in the week view
+WeekMeeting = collections.namedtuple(
+    'WeekMeeting', ['meeting_id', 'meeting_name'])
+
 
 def convert_time(timeobj, tzfrom, tzto):
     """ Convert a given datetime object from a specified timezone to
@@ -60,11 +84,10 @@ def convert_time(timeobj, tzfrom, tzto):
     :arg tzfrom: the timezone from which to convert
     :arg tzto: the timezone to which to convert
     """
-    timez_from = pytz.timezone(tzfrom)
-    timez_to = pytz.timezone(tzto)
-    timeobj_from = timez_from.localize(timeobj)
-    timeobj_to = timeobj_from.astimezone(timez_to)
-    return timeobj_to
+    timeobj_from = localize(timeobj, tzfrom)
+    if tzfrom == tzto:
+        return timeobj_from
+    return timeobj_from.astimezone(get_timezone(tzto))
 
 
 def convert_meeting_timezone(meeting, tzfrom, tzto):
@@ -75,33 +98,39 @@ def convert_meeting_timezone(meeting, tzfrom, tzto):
         from one timezone to the other.
     :arg tzfrom: the timezone from which to convert
     :arg tzto: the timezone to which to convert
+    :return a read-only LocalizedMeeting object, the provided meeting is
+        left untouched.
     """
-    # Prevents the actual SQLAlchemy object from being changed
-    meeting = copy.copy(meeting)
-    meeting_start = convert_time(
+    timez_from = get_timezone(tzfrom)
+    timez_to = get_timezone(tzto)
+    meeting_start = timez_from.localize(
         datetime(
             meeting.meeting_date.year,
             meeting.meeting_date.month,
             meeting.meeting_date.day,
             meeting.meeting_time_start.hour,
-            meeting.meeting_time_start.minute),
-        tzfrom, tzto)
-    meeting_stop = convert_time(
+            meeting.meeting_time_start.minute))
+    meeting_stop = timez_from.localize(
         datetime(
             meeting.meeting_date_end.year,
             meeting.meeting_date_end.month,
             meeting.meeting_date_end.day,
             meeting.meeting_time_stop.hour,
-            meeting.meeting_time_stop.minute),
-        tzfrom, tzto)
-    meeting.meeting_date = meeting_start.date()
-    meeting.meeting_date_end = meeting_stop.date()
-    meeting.meeting_time_start = meeting_start.time()
-    meeting.meeting_time_stop = meeting_stop.time()
-    return meeting
-
-
-def create_session(db_url, debug=False, pool_recycle=3600):
+            meeting.meeting_time_stop.minute))
+    if tzfrom != tzto:
+        meeting_start = meeting_start.astimezone(timez_to)
+        meeting_stop = meeting_stop.astimezone(timez_to)
+    return LocalizedMeeting(
+        meeting,
+        meeting_start.date(),
+        meeting_stop.date(),
+        meeting_start.time(),
+        meeting_stop.time())
+
+
+def create_session(db_url, debug=False, pool_recycle=3600, pool_size=None,
+                   max_overflow=None, pool_timeout=None, pool_pre_ping=False,
+                   statement_timeout=None, read_only=False):
     """ Create the Session object to use to query the database.
 
     :arg db_url: URL used to connect to the database. The URL contains
@@ -110,13 +139,83 @@ def create_session(db_url, debug=False, pool_recycle=3600):
       ie: <engine>://<user>:<password>@<host>/<dbname>
     :arg debug: a boolean specifying wether we should have the verbose
         output of sqlalchemy or not.
+    :kwarg pool_recycle: the number of seconds after which the
+        connections are closed and opened again.
+    :kwarg pool_size: the number of connections kept open.
+    :kwarg max_overflow: the number of connections which can be opened
+        in addition to the pool_size ones when they are all used.
+    :kwarg pool_timeout: the number of seconds to wait for a connection
+        when they are all used before raising an error.
+    :kwarg pool_pre_ping: a boolean specifying wether the connections are
+        tested, and opened again if needed, before being used.
+    :kwarg statement_timeout: the number of seconds after which the
+        database cancels a statement, None for no limit.
+    :kwarg read_only: a boolean specifying wether the Session should be
+        a read-only one, see create_read_session.
     :return a Session that can be used to query the database.
     """
-    engine = create_engine(db_url, echo=debug, pool_recycle=pool_recycle)
+    engine = create_engine(
+        db_url, echo=debug, pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        **pool.get_engine_options(
+            db_url, pool_size=pool_size, max_overflow=max_overflow,
+            pool_timeout=pool_timeout))
+    if statement_timeout:
+        pool.set_statement_timeout(engine, statement_timeout)
+    if read_only:
+        return _create_read_session(engine)
     scopedsession = scoped_session(sessionmaker(bind=engine))
     return scopedsession
 
 
+def create_read_session(session):
+    """ Create a read-only Session object using the same database as the
+    provided one.
+
+    The read-only Session never flushes the objects added to it, for
+    example the copies of the meetings built while expanding recurring
+    meetings, nor expires them on commit. With PostgreSQL, its
+    transactions are also declared READ ONLY.
+
+    :arg session: a Session as returned by create_session.
+    :return a Session that can be used to read from the database.
+    """
+    return _create_read_session(session.session_factory.kw['bind'])
+
+
+def _create_read_session(engine):
+    """ Create a read-only Session object bound to the provided engine,
+    see create_read_session. """
+    factory = sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False)
+    if engine.dialect.name == 'postgresql':
+        event.listen(factory, 'after_begin', _set_read_only)
+    return scoped_session(factory)
+
+
+def _set_read_only(session, transaction, connection):
+    """ Declare the transaction starting as a read-only one. """
+    connection.execute(text('SET TRANSACTION READ ONLY'))
+
+
+def get_session_options(config):
+    """ Return the arguments of create_session configuring the pool of
+    connections according to the configuration of the application.
+
+    :arg config: the configuration of the flask application, relying on
+        the keys DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+        DB_POOL_RECYCLE, DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT.
+    """
+    return dict(
+        pool_size=config.get('DB_POOL_SIZE'),
+        max_overflow=config.get('DB_MAX_OVERFLOW'),
+        pool_timeout=config.get('DB_POOL_TIMEOUT'),
+        pool_recycle=int(config.get('DB_POOL_RECYCLE', 3600)),
+        pool_pre_ping=bool(config.get('DB_POOL_PRE_PING', False)),
+        statement_timeout=config.get('DB_STATEMENT_TIMEOUT'),
+    )
+
+
 def get_calendars(session):
     """ Retrieve the list of Calendar from the database. """
     return Calendar.get_all(session)
@@ -225,7 +324,7 @@ def get_week_of_location(session, location, year=None, month=None, day=None):
         on the current utc date of based on the information specified.
     """
     week_start = get_start_week(year, month, day)
-    week = Week(session, None, week_start, location)
+    week = Week(session, None, week_start, location, profile='week')
     return week
 
 
@@ -319,83 +418,107 @@ def format_full_day_meeting(meeting_list, week_start):
     return meetings
 
 
+def _round_to_slot(day, hour, week_start):
+    """ Return the index, in the week starting at week_start, of the slot
+    of 30 minutes the specified day and hour fall in, rounding the hour
+    to the closest half hour.
+    """
+    if hour.minute < 15:
+        minutes = 0
+    elif hour.minute <= 45:
+        minutes = 30
+    else:
+        minutes = 60
+    return (day - week_start).days * SLOTS_PER_DAY \
+        + (hour.hour * 60 + minutes) // 30
+
+
 def format_week_meeting(meeting_list, tzone, week_start):
     """ Return a dictionnary representing the meeting of the week in the
     appropriate format for the meeting provided in the meeting_list.
     """
-    meetings = {}
-    for hour in HOURS[:-1]:
-        for key in ['%sh00', '%sh30']:
-            key = key % (hour)
-            # pylint: disable=W0612
-            meetings[key] = [None for cnt2 in range(0, 7)]
-
-    week_start = pytz.timezone(tzone).localize(
-        datetime(week_start.year, week_start.month, week_start.day, 0, 0,))
-    fmt = '%Hh%M'
-    # week_start = convert_time(week_start, 'UTC', tzone)
+    meetings = dict((key, [None] * 7) for key in SLOT_KEYS)
+    week_slots = 7 * SLOTS_PER_DAY
+
     for meeting in meeting_list:
         meeting = convert_meeting_timezone(
             meeting, meeting.meeting_timezone, tzone)
-        start_delta = 0
-        if meeting.meeting_time_start.minute < 15:
-            start_delta = - meeting.meeting_time_start.minute
-        elif 15 <= meeting.meeting_time_start.minute <= 45:
-            start_delta = 30 - meeting.meeting_time_start.minute
-        elif meeting.meeting_time_start.minute > 45:
-            start_delta = 60 - meeting.meeting_time_start.minute
-
-        stop_delta = 0
-        if meeting.meeting_time_stop.minute < 15:
-            stop_delta = - meeting.meeting_time_stop.minute
-        elif 15 <= meeting.meeting_time_stop.minute <= 45:
-            stop_delta = 30 - meeting.meeting_time_stop.minute
-        elif meeting.meeting_time_stop.minute > 45:
-            stop_delta = 60 - meeting.meeting_time_stop.minute
-
-        startdt = datetime(
-            meeting.meeting_date.year,
-            meeting.meeting_date.month, meeting.meeting_date.day,
-            meeting.meeting_time_start.hour,
-            meeting.meeting_time_start.minute, 0
-        ) + timedelta(minutes=start_delta)
-        # Required to add the tz info, does not actually convert
-        startdt = convert_time(
-            startdt, meeting.meeting_timezone, meeting.meeting_timezone)
-
-        stopdt = datetime(
-            meeting.meeting_date_end.year,
-            meeting.meeting_date_end.month,
-            meeting.meeting_date_end.day,
-            meeting.meeting_time_stop.hour,
-            meeting.meeting_time_stop.minute, 0
-        ) + timedelta(minutes=stop_delta)
-        # Required to add the tz info
-        stopdt = convert_time(
-            stopdt, meeting.meeting_timezone, meeting.meeting_timezone)
-
-        if stopdt < startdt:  # pragma: no cover
-            stopdt = stopdt + timedelta(days=1)
-
-        t_time = startdt
-        while t_time < stopdt:
-            nweek = week_start + timedelta(days=7)
-            if t_time < week_start \
-                    or t_time >= nweek:  # pragma: no cover
-                # Skip meeting start or ending in another week
-                t_time = t_time + timedelta(minutes=30)
-                continue
-            day = t_time.weekday()
-            key = t_time.strftime(fmt)
-            if key in meetings:
-                if meetings[key][day]:
-                    meetings[key][day].append(meeting)
-                else:
-                    meetings[key][day] = [meeting]
-            t_time = t_time + timedelta(minutes=30)
+        start = _round_to_slot(
+            meeting.meeting_date, meeting.meeting_time_start, week_start)
+        stop = _round_to_slot(
+            meeting.meeting_date_end, meeting.meeting_time_stop, week_start)
+        if stop < start:  # pragma: no cover
+            stop = stop + SLOTS_PER_DAY
+
+        # Skip the part of the meeting starting or ending in another week
+        for slot in range(max(start, 0), min(stop, week_slots)):
+            day, slot = divmod(slot, SLOTS_PER_DAY)
+            row = meetings[SLOT_KEYS[slot]]
+            if row[day]:
+                row[day].append(meeting)
+            else:
+                row[day] = [meeting]
     return meetings
 
 
+def _dump_week_meetings(meetings):
+    """ Return the list of the fields shown in the week view of the
+    provided list of meetings, as tuples (None if there is no list).
+    """
+    if meetings is None:
+        return None
+    return [(meeting.meeting_id, meeting.meeting_name) for meeting in meetings]
+
+
+def _load_week_meetings(meetings):
+    """ Return the list of WeekMeeting corresponding to the list of
+    tuples returned by _dump_week_meetings.
+    """
+    if meetings is None:
+        return None
+    return [WeekMeeting(*meeting) for meeting in meetings]
+
+
+def get_week_grid(session, calendarobj, week_start, tzone):
+    """ Return the meetings of the specified calendar for the week
+    starting at week_start, formatted for the week view: a tuple with
+    the output of format_week_meeting and the one of
+    format_full_day_meeting, the meetings being WeekMeeting objects.
+    The result is cached for the current generation of the calendar,
+    the cache only holds the fields of the meetings and not the Meeting
+    objects, which are bound to the session of the request.
+
+    :arg session: the database session to use.
+    :arg calendarobj: the Calendar object of interest.
+    :arg week_start: the date of the first day of the week.
+    :arg tzone: the timezone in which the meetings are presented.
+    """
+    def _get_week_grid():
+        week = Week(session, calendarobj, week_start, profile='week')
+        meetings = format_week_meeting(week.meetings, tzone, week_start)
+        full_day_meetings = format_full_day_meeting(
+            week.full_day_meetings, week_start)
+        return (
+            dict(
+                (key, [_dump_week_meetings(day) for day in row])
+                for key, row in meetings.items()
+            ),
+            [_dump_week_meetings(day) for day in full_day_meetings],
+        )
+
+    meetings, full_day_meetings = cache.get_or_create(
+        calendarobj,
+        'week:%s:%s' % (week_start.isoformat(), tzone),
+        _get_week_grid)
+    return (
+        dict(
+            (key, [_load_week_meetings(day) for day in row])
+            for key, row in meetings.items()
+        ),
+        [_load_week_meetings(day) for day in full_day_meetings],
+    )
+
+
 def is_date_in_future(indate, start_time):
     """ Return whether the date is in the future or the past.
 
@@ -491,56 +614,55 @@ def agenda_is_free(
         meeting_date,
         meeting_date_end):
     """Check if there is already someting planned in this agenda at that
-    time on that day.
+    time on that day, including the occurrences of the recursive meetings.
 
     :arg session: the database session to use
     :arg calendar: the name of the calendar of interest.
     :arg meeting_date: the date of the meeting (as Datetime object)
     :arg meeting_date_end: the end date of the meeting (as Datetime
         object)
-    :arg time_start: the time at which the meeting starts (as int)
-    :arg time_stop: the time at which the meeting stops (as int)
     """
-    meetings = Meeting.get_overlaping_meetings(
+    start_utc = meeting_date.astimezone(pytz.utc).replace(tzinfo=None)
+    stop_utc = meeting_date_end.astimezone(pytz.utc).replace(tzinfo=None)
+    if Meeting.get_overlaping_single_meetings(
+            session, calendarobj, start_utc, stop_utc):
+        return False
+
+    # Start a day earlier to catch the occurrences running over midnight
+    meetings = Meeting.get_regular_meeting_by_date(
         session, calendarobj,
-        meeting_date.date(),
+        meeting_date.date() - timedelta(days=1),
         meeting_date_end.date())
-    agenda_free = True
 
-    for meeting in set(meetings):
-        meeting_start_date_time = datetime(
+    # The occurrences of a meeting share its timezone, resolve it once
+    zones = {}
+    for meeting in meetings:
+        tzone = zones.get(meeting.meeting_timezone)
+        if tzone is None:
+            tzone = zones[meeting.meeting_timezone] = get_timezone(
+                meeting.meeting_timezone)
+        meeting_start_date_time = tzone.localize(datetime(
             meeting.meeting_date.year,
             meeting.meeting_date.month,
             meeting.meeting_date.day,
             meeting.meeting_time_start.hour,
-            meeting.meeting_time_start.minute,
-            tzinfo=pytz.timezone(meeting.meeting_timezone))
+            meeting.meeting_time_start.minute))
 
-        meeting_stop_date_time = datetime(
+        meeting_stop_date_time = tzone.localize(datetime(
             meeting.meeting_date_end.year,
             meeting.meeting_date_end.month,
             meeting.meeting_date_end.day,
             meeting.meeting_time_stop.hour,
-            meeting.meeting_time_stop.minute,
-            tzinfo=pytz.timezone(meeting.meeting_timezone))
+            meeting.meeting_time_stop.minute))
 
-        if meeting_date <= meeting_start_date_time \
+        if meeting_date < meeting_stop_date_time \
                 and meeting_date_end > meeting_start_date_time:
-            agenda_free = False
-        elif meeting_date < meeting_stop_date_time \
-                and meeting_date_end >= meeting_stop_date_time:
-            agenda_free = False
-        elif meeting_date < meeting_start_date_time \
-                and meeting_date_end > meeting_stop_date_time:
-            agenda_free = False
-        elif meeting_date > meeting_start_date_time \
-                and meeting_date_end < meeting_stop_date_time:
-            agenda_free = False
+            return False
         elif meeting_date == meeting_start_date_time \
                 and meeting_date_end == meeting_stop_date_time:
-            agenda_free = False
+            return False
 
-    return agenda_free
+    return True
 
 
 def is_user_managing_in_calendar(session, calendar_name, fas_user):
@@ -580,18 +702,11 @@ def delete_recursive_meeting(
             or meeting.recursion_ends < del_date:
         return
 
-    meeting_date = meeting.meeting_date
-    meeting_date_end = meeting.meeting_date_end
-    cnt = 0
-    while meeting_date < del_date:
-        if meeting.recursion_ends < meeting_date + \
-                timedelta(days=meeting.recursion_frequency):
-            break
-        meeting_date = meeting.meeting_date + timedelta(
-            days=meeting.recursion_frequency * cnt)
-        meeting_date_end = meeting.meeting_date_end + timedelta(
-            days=meeting.recursion_frequency * cnt)
-        cnt = cnt + 1
+    cnt = recurrence.nearest_occurrence_index(meeting, del_date)
+    meeting_date = meeting.meeting_date + timedelta(
+        days=meeting.recursion_frequency * cnt)
+    meeting_date_end = meeting.meeting_date_end + timedelta(
+        days=meeting.recursion_frequency * cnt)
 
     if all_meetings:
         # If the meeting_date is before the meeting.meeting_date, just delete
@@ -646,7 +761,7 @@ def retrieve_meeting_to_remind(session, offset=30):
         to avoid sending twice the same reminder.
     """
     today = datetime.utcnow()
-    meetings = []
+    windows = {}
 
     for reminder_time in [12, 24, 48, 168]:
         # Retrieve meeting planned in less than X hours
@@ -660,11 +775,100 @@ def retrieve_meeting_to_remind(session, offset=30):
             end_date = datetime(
                 new_date.year, new_date.month, new_date.day, 23, 59)
 
-        meetings.extend(Meeting.get_meeting_with_reminder(
-            session, new_date.date(), new_date.time(), end_date.time(),
-            'H-%s' % reminder_time))
+        windows['H-%s' % reminder_time] = (new_date, end_date)
 
-    return meetings
+    return [
+        meeting
+        for meeting, _ in Meeting.get_meetings_to_remind(session, windows)
+    ]
+
+
+def fill_reminder_outbox(
+        session, now, horizon=timedelta(days=8),
+        catchup=timedelta(hours=24)):
+    """ Add to the reminder outbox the reminders to send in the coming
+    days which are not there yet. Returns the number of reminders added.
+
+    The reminders which should have been sent up to ``catchup`` ago are
+    added too, so they are sent late rather than never if the cron job
+    did not run for a while, as long as their meeting did not start.
+
+    :arg session: the database session to use.
+    :arg now: the current datetime, in UTC.
+    :kwarg horizon: a timedelta, how far ahead the reminders are added.
+    :kwarg catchup: a timedelta, how late the reminders may be sent.
+    """
+    windows = {}
+    for reminder_time in [12, 24, 48, 168]:
+        delta = timedelta(hours=reminder_time)
+        windows['H-%s' % reminder_time] = (
+            now - catchup + delta, now + horizon + delta)
+
+    existing = ReminderOutbox.get_keys(session, now)
+    reminders = []
+    for meeting, offset in Meeting.get_meetings_to_remind(
+            session, windows, profile='cron'):
+        delta = timedelta(hours=int(offset[2:]))
+        for _, meeting_start in meeting.get_occurrences_utc(
+                *windows[offset]):
+            key = (meeting.meeting_id, offset, meeting_start)
+            if meeting_start <= now or key in existing:
+                continue
+            existing.add(key)
+            reminders.append(dict(
+                meeting_id=meeting.meeting_id,
+                reminder_offset=offset,
+                occurrence_start=meeting_start,
+                send_at=meeting_start - delta,
+                next_attempt=meeting_start - delta,
+                status='pending',
+                attempts=0,
+            ))
+
+    for _ in range(3):
+        if not reminders:
+            return 0
+        try:
+            session.bulk_insert_mappings(ReminderOutbox, reminders)
+            session.commit()
+            return len(reminders)
+        except IntegrityError as err:
+            # Another job added some of the same reminders at the same
+            # time, add the others
+            session.rollback()
+            _log.info('Reminders already in the outbox: %s', err)
+            existing = ReminderOutbox.get_keys(session, now)
+            reminders = [
+                reminder for reminder in reminders
+                if (reminder['meeting_id'], reminder['reminder_offset'],
+                    reminder['occurrence_start']) not in existing
+            ]
+    _log.warning('Could not fill the reminder outbox')
+    return 0
+
+
+def get_outbox_meeting(entry):
+    """ Return the meeting, or the occurrence of the recursive meeting,
+    the provided reminder of the outbox is about, or None if the meeting
+    changed and the reminder is not to be sent anymore.
+
+    :arg entry: a ReminderOutbox object.
+    """
+    meeting = entry.meeting
+    if meeting is None or meeting.reminder is None \
+            or meeting.reminder.reminder_offset != entry.reminder_offset:
+        return None
+    occurrences = meeting.get_occurrences_utc(
+        entry.occurrence_start,
+        entry.occurrence_start + timedelta(minutes=1))
+    if not occurrences:
+        return None
+    if meeting.recursion_frequency and meeting.recursion_ends:
+        meeting_date = occurrences[0][0]
+        meeting = MeetingOccurrence(
+            meeting, meeting_date,
+            meeting_date + (meeting.meeting_date_end - meeting.meeting_date))
+    return meeting
 
 
 def add_meeting_to_vcal(ical, meeting, reminder=None):
@@ -707,13 +911,17 @@ def add_meeting_to_vcal(ical, meeting, reminder=None):
 
     if meeting.recursion_frequency and meeting.recursion_ends:
         newrule = rrule.rruleset()
-        freq = int(meeting.recursion_frequency / 7)
-        recursion_ends = datetime.combine(
-            meeting.recursion_ends, time(0)).replace(tzinfo=pytz.utc)
+        freq, interval = rrule.DAILY, meeting.recursion_frequency
+        if meeting.recursion_frequency % 7 == 0:
+            freq, interval = rrule.WEEKLY, meeting.recursion_frequency // 7
+        # The last occurrence starts on the day the recursion ends
+        recursion_ends = to_utc(
+            meeting.recursion_ends, start.value.time(),
+            meeting.meeting_timezone).replace(tzinfo=pytz.utc)
         newrule.rrule(
             rrule.rrule(
-                freq=rrule.WEEKLY,
-                interval=freq,
+                freq=freq,
+                interval=interval,
                 dtstart=start.value,
                 until=recursion_ends))
         entry.rruleset = newrule
@@ -775,12 +983,13 @@ def get_html_monthly_cal(
 
 
 def get_by_date(session, calendarobj, start_date, end_date, tzone='UTC',
-                extended=True, name=None):
+                extended=True, name=None, profile=None):
     """ Returns all the meetings in a given time period.
     Recurring meetings are expanded as if each was a single meeting.
 
     :arg session: the database session to use
-    :arg calendarobj: the calendar (object) of interest.
+    :arg calendarobj: the calendar (object) of interest, if None the
+        meetings of all the calendars are returned, sorted by calendar.
     :arg start_date: a Date object representing the beginning of the
         period
     :arg start_date: a Date object representing the ending of the period
@@ -788,19 +997,23 @@ def get_by_date(session, calendarobj, start_date, end_date, tzone='UTC',
         defaults to UTC.
     :kwarg name: Defaults to None, if set the meetings returned will be
             filtered for this string in their name.
+    :kwarg profile: the profile of the meetings to load, see
+        Meeting.load_options.
 
     """
     meetings_utc = Meeting.get_by_date(
         session, calendarobj, start_date, end_date, no_recursive=extended,
-        name=name)
+        name=name, profile=profile)
     if extended:
         meetings_utc.extend(
             Meeting.get_regular_meeting_by_date(
-                session, calendarobj, start_date, end_date, name=name))
+                session, calendarobj, start_date, end_date, name=name,
+                profile=profile))
     else:
         meetings_utc.extend(
             Meeting.get_active_regular_meeting_by_date(
-                session, calendarobj, start_date, name=name))
+                session, calendarobj, start_date, name=name,
+                end_date=end_date, profile=profile))
 
     meetings = list(set(meetings_utc))
     if tzone:
@@ -809,12 +1022,12 @@ def get_by_date(session, calendarobj, start_date, end_date, tzone='UTC',
                 meeting, meeting.meeting_timezone, tzone)
             for meeting in meetings
         ]
-    meetings.sort(key=operator.attrgetter('meeting_date'))
+    meetings.sort(key=operator.attrgetter('calendar_name', 'meeting_date'))
     return meetings
 
 
 def get_meetings_by_date_and_location(
-        session, calendar, start_date, end_date, location):
+        session, calendar, start_date, end_date, location, profile=None):
     """ Return a list of meetings which have or will occur in between
     the two provided dates.
 
@@ -825,14 +1038,18 @@ def get_meetings_by_date_and_location(
     :arg start_date: the date until which we would like to retrieve the
         meetings (this day is excluded from the selection).
     :arg location: the location in which the meetings occurs.
+    :kwarg profile: the profile of the meetings to load, see
+        Meeting.load_options.
     """
     calendar = Calendar.by_id(session, calendar)
     return Meeting.get_by_date_and_location(session, calendar, start_date,
-                                            end_date, location)
+                                            end_date, location,
+                                            profile=profile)
 
 
 def get_by_date_at_location(
-        session, location, start_date, end_date, tzone='UTC'):
+        session, location, start_date, end_date, tzone='UTC',
+        extended=True, profile=None):
     """ Returns all the meetings in a given time period at a given location.
     Recurring meetings are expanded as if each was a single meeting.
 
@@ -843,11 +1060,22 @@ def get_by_date_at_location(
     :arg start_date: a Date object representing the ending of the period
     :kwarg tzone: the timezone in which the meetings should be displayed
         defaults to UTC.
+    :kwarg extended: Defaults to True, if False the recursive meetings
+        are returned once instead of once per occurrence.
+    :kwarg profile: the profile of the meetings to load, see
+        Meeting.load_options.
     """
     meetings_utc = Meeting.get_by_date_at_location(
-        session, location, start_date, end_date, no_recursive=True)
-    meetings_utc.extend(Meeting.get_regular_meeting_by_date_at_location(
-        session, location, start_date, end_date))
+        session, location, start_date, end_date, no_recursive=extended,
+        profile=profile)
+    if extended:
+        meetings_utc.extend(Meeting.get_regular_meeting_by_date_at_location(
+            session, location, start_date, end_date, profile=profile))
+    else:
+        meetings_utc.extend(
+            Meeting.get_active_regular_meeting_by_date_at_location(
+                session, location, start_date, end_date=end_date,
+                profile=profile))
     meetings = list(set(meetings_utc))
     if tzone:
         meetings = [
@@ -859,38 +1087,26 @@ def get_by_date_at_location(
     return meetings
 
 
-# pylint: disable=R0913,R0914
-def add_meeting(
-        session, calendarobj, fas_user,
-        meeting_name, meeting_date, meeting_date_end,
-        meeting_time_start, meeting_time_stop, comanager,
-        meeting_information,
-        meeting_location, tzone,
-        frequency, end_repeats,
-        remind_when, reminder_from, remind_who,
-        full_day,
-        admin=False):
-    """ When a user wants to add a meeting to the database, we need to
-    perform a number of test first checking that the input is valid
-    and then add the desired meeting.
-    """
-    if not is_user_managing_in_calendar(
-            session,
-            calendarobj.calendar_name,
-            fas_user) and not admin:  # pragma: no cover
-        raise UserNotAllowed(
-            gettext(
-                'You are not allowed to add a meeting to this calendar'
-            )
-        )
+def get_meeting_datetimes(
+        meeting_date, meeting_date_end,
+        meeting_time_start, meeting_time_stop, full_day):
+    """ Check the dates and times of a meeting and return the tuple of the
+    datetimes at which it starts and stops.
 
+    :arg meeting_date: a date object, the day the meeting starts.
+    :arg meeting_date_end: a date object or None, the day the meeting
+        stops.
+    :arg meeting_time_start: a time object, the time the meeting starts.
+    :arg meeting_time_stop: a time object, the time the meeting stops.
+    :arg full_day: a boolean specifying if the meeting lasts all day(s).
+    :raises InvalidMeeting: if the meeting stops before it starts.
+    """
     if meeting_date_end is None:
         meeting_date_end = meeting_date
 
     if full_day:
         meeting_time_start = time(0, 0)
         meeting_time_stop = time(0, 0)
-        tzone = 'UTC'
 
     meeting_time_start = datetime(
         meeting_date.year, meeting_date.month, meeting_date.day,
@@ -924,6 +1140,41 @@ def add_meeting(
             )
         )
 
+    return meeting_time_start, meeting_time_stop
+
+
+# pylint: disable=R0913,R0914
+def add_meeting(
+        session, calendarobj, fas_user,
+        meeting_name, meeting_date, meeting_date_end,
+        meeting_time_start, meeting_time_stop, comanager,
+        meeting_information,
+        meeting_location, tzone,
+        frequency, end_repeats,
+        remind_when, reminder_from, remind_who,
+        full_day,
+        admin=False):
+    """ When a user wants to add a meeting to the database, we need to
+    perform a number of test first checking that the input is valid
+    and then add the desired meeting.
+    """
+    if not is_user_managing_in_calendar(
+            session,
+            calendarobj.calendar_name,
+            fas_user) and not admin:  # pragma: no cover
+        raise UserNotAllowed(
+            gettext(
+                'You are not allowed to add a meeting to this calendar'
+            )
+        )
+
+    if full_day:
+        tzone = 'UTC'
+
+    meeting_time_start, meeting_time_stop = get_meeting_datetimes(
+        meeting_date, meeting_date_end,
+        meeting_time_start, meeting_time_stop, full_day)
+
     reminder = None
     if remind_when and remind_who and reminder_from:
         remind_who = ','.join([
@@ -1166,110 +1417,422 @@ def clear_calendar(session, calendar):
     return Meeting.clear_from_calendar(session, calendar)
 
 
-def add_vcal_file(session, calendar, stream, fas_user, admin=False):
-    """ Add the meetings from the iCalendar stream provided into the calendar
-    specified.
+def iter_vcal_components(stream):
+    """ Yield the text of the components (VEVENT, VTODO...) of the provided
+    iCalendar stream one at a time, so the whole file never has to be
+    parsed at once.
+
+    The VTIMEZONE components are not yielded, they are parsed as they come
+    so that the timezones they define are known to vobject when parsing
+    the components relying on them.
+
+    :arg stream: the iCalendar file as a string or an iterable of lines,
+        ie: a file object.
     """
-    _log.info('Uploading a vCal file')
-    # Build a dict with all the common timezones storing for each their
-    # localize name and their offset (ie: CEST 2:00:00)
-    timezone_lookup = dict()
-    for tz in pytz.common_timezones:
-        name = pytz.timezone(tz).localize(datetime.now()).tzname()
-        offset = pytz.timezone(tz).localize(datetime.now()).utcoffset()
-        key = (name, offset)
-        if key in timezone_lookup:
-            timezone_lookup[key].append(tz)
-        else:
-            timezone_lookup[key] = [tz]
+    if isinstance(stream, six.binary_type):
+        stream = stream.decode('utf-8')
+    if isinstance(stream, six.string_types):
+        stream = stream.splitlines()
+
+    block = None
+    depth = 0
+    for line in stream:
+        if isinstance(line, six.binary_type):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r\n')
+        if line.upper().startswith('BEGIN:'):
+            depth += 1
+            if depth == 2:
+                block = []
+        if block is not None:
+            block.append(line)
+        if line.upper().startswith('END:'):
+            depth -= 1
+            if depth == 1 and block is not None:
+                component = '\r\n'.join(block) + '\r\n'
+                block = None
+                if component.upper().startswith('BEGIN:VTIMEZONE'):
+                    # Parsing the timezone in a calendar registers it
+                    vobject.readOne(
+                        'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n%s'
+                        'END:VCALENDAR\r\n' % component)
+                else:
+                    yield component
+
 
+def _get_vcal_timezone(meeting_date):
+    """ Return the name of the timezone of the provided datetime read from
+    an iCalendar file.
+    """
     major_timezones = {
         'CET': 'Europe/Paris',
         'CEST': 'Europe/Paris',
         'EDT': 'US/Eastern',
     }
 
-    if isinstance(stream, six.binary_type):
-        stream = stream.decode('utf-8')
+    tzinfo = meeting_date.tzinfo
+    if hasattr(tzinfo, 'zone'):
+        tzone = tzinfo.zone
+    elif meeting_date.tzname() == 'UTC':
+        tzone = 'UTC'
+    else:
+        tzone = str(tzinfo).split("'")[1]
+        # The identifiers of the timezones of the feeds of fedocal are
+        # prefixed, see ical_out
+        if tzone.startswith('fedocal_'):
+            tzone = tzone[len('fedocal_'):]
+        if '/' in tzone and tzone not in pytz.all_timezones_set:
+            tzone = '/'.join(tzone.rsplit('/', 2)[1:])
+
+    try:
+        get_timezone(tzone)
+        if not hasattr(tzinfo, 'zone') and tzone != 'UTC':
+            tzone = _get_vcal_zone_with_dst(meeting_date, tzone)
+    except pytz.UnknownTimeZoneError:
+        name = meeting_date.tzname()
+        key = (meeting_date.tzname(), meeting_date.utcoffset())
+        timezone_lookup = get_timezone_lookup()
+        if name in major_timezones:
+            tzone = major_timezones[name]
+        elif key in timezone_lookup:
+            tzone = timezone_lookup[key][0]
+        else:
+            tzone = meeting_date.tzname()
+    return tzone
 
-    meetings = vobject.readOne(stream)
-    for meeting in meetings.components():
-        if meeting.name == 'VTIMEZONE':
-            continue
-        meeting_name = ', '.join(
-            [el.value for el in meeting.contents.get('summary', [])])
-        meeting_description = ', '.join(
-            [el.value for el in meeting.contents.get('description', [])]
-        ) or None
 
-        tzone = 'UTC'
-        full_day = False
-        if meeting.contents.get('transp', False):
-            full_day = True
+def _get_vcal_zone_with_dst(meeting_date, tzone):
+    """ Return the name of a timezone having the same offsets as the
+    timezone of the provided datetime in winter and in summer, the
+    provided one if it does or if there is none.
 
-        meeting_date = meeting.dtstart.value
-        meeting_time_start = time(0, 0)
-        if isinstance(meeting_date, datetime):
-            tzinfo = meeting_date.tzinfo
-            if hasattr(tzinfo, 'zone'):
-                tzone = tzinfo.zone
-            elif meeting_date.tzname() == 'UTC':
-                tzone = 'UTC'
-            else:
-                tzone = str(tzinfo).split("'")[1]
-                if '/' in tzone:
-                    tzone = '/'.join(tzone.rsplit('/', 2)[1:])
-
-            try:
-                pytz.timezone(tzone)
-            except pytz.UnknownTimeZoneError:
-                name = meeting_date.tzname()
-                key = (meeting_date.tzname(), meeting_date.utcoffset())
-                if name in major_timezones:
-                    tzone = major_timezones[name]
-                elif key in timezone_lookup:
-                    tzone = timezone_lookup[key][0]
-                else:
-                    tzone = meeting_date.tzname()
-            meeting_time_start = meeting_date.time()
-            meeting_date = meeting_date.date()
+    The timezones of the feeds of fedocal are named after their
+    abbreviation, ie: EST for America/New_York, while pytz knows EST as
+    a timezone without daylight saving time.
+    """
+    tzinfo = meeting_date.tzinfo
+    year = meeting_date.year
+    candidates = None
+    matches = True
+    for month in (1, 7):
+        value = datetime(year, month, 1, 12, tzinfo=tzinfo)
+        offset = value.utcoffset()
+        if get_timezone(tzone).localize(
+                value.replace(tzinfo=None)).utcoffset() != offset:
+            matches = False
+        names = get_timezone_lookup().get((value.tzname(), offset), [])
+        if candidates is None:
+            candidates = list(names)
+        else:
+            candidates = [name for name in candidates if name in names]
+    if matches or not candidates:
+        return tzone
+    return candidates[0]
 
-        meeting_date_end = meeting_date
-        meeting_time_stop = time(0, 0)
-        if meeting.name == 'VEVENT':
-            meeting_date_end = meeting.dtend.value
+
+def _get_vcal_date(value, tzone):
+    """ Return the date, in the specified timezone, of the provided date
+    or datetime read from an iCalendar file.
+    """
+    if not isinstance(value, datetime):
+        return value
+    if value.tzinfo is not None:
+        value = value.astimezone(get_timezone(tzone))
+    return value.date()
+
+
+def get_vcal_recursion(
+        rule, meeting_date, meeting_time_start, tzone, tzinfo=None):
+    """ Return the tuple of the recursion_frequency and of the
+    recursion_ends of the meeting corresponding to the provided RRULE, or
+    (None, None) if the rule cannot be expressed as a number of days in
+    between occurrences or if it has a single occurrence.
+
+    :arg rule: the value of the RRULE (ie: 'FREQ=WEEKLY;UNTIL=...').
+    :arg meeting_date: a date object, the day of the first occurrence.
+    :arg meeting_time_start: a time object, the time of the occurrences.
+    :arg tzone: the name of the timezone of the meeting.
+    :kwarg tzinfo: the tzinfo of the DTSTART of the event, in which the
+        UNTIL of the rule is read rather than in ``tzone``. The name of
+        the timezone may only approximate it, ie: the timezones of the
+        feeds of fedocal are named after their abbreviation.
+    """
+    parts = dict(
+        part.split('=', 1) for part in rule.upper().split(';') if '=' in part)
+    days = {'DAILY': 1, 'WEEKLY': 7}.get(parts.pop('FREQ', None))
+    interval = int(parts.pop('INTERVAL', 1))
+    byday = parts.pop('BYDAY', None)
+    parts.pop('WKST', None)
+    until = parts.pop('UNTIL', None)
+    count = parts.pop('COUNT', None)
+
+    weekday = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU'][
+        meeting_date.weekday()]
+    if not days or parts or not (until or count) \
+            or (byday and byday != weekday):
+        _log.info('Unsupported recurrence rule: %s', rule)
+        return None, None
+
+    frequency = days * interval
+    if count:
+        last = int(count) - 1
+    else:
+        if len(until) == 8:
+            until_day = datetime.strptime(until, '%Y%m%d').date()
         else:
-            full_day = True
+            value = datetime.strptime(until.rstrip('Z'), '%Y%m%dT%H%M%S')
+            if until.endswith('Z'):
+                value = pytz.utc.localize(value).astimezone(
+                    tzinfo or get_timezone(tzone)).replace(tzinfo=None)
+            until_day = value.date()
+            if value.time() < meeting_time_start:
+                until_day = until_day - timedelta(days=1)
+        last = recurrence.last_occurrence_index(
+            meeting_date, frequency, until_day)
+
+    if last < 1:
+        return None, None
+    return frequency, meeting_date + timedelta(days=frequency * last)
+
+
+def split_meeting_series(meeting, dates):
+    """ Return the list of the meetings, as dictionnaries of their
+    columns, making up the provided recursive meeting once the occurrences
+    happening on the specified dates are removed from it.
+
+    fedocal does not store exceptions to the recursions: the series is
+    split into the series of the occurrences in between two exceptions.
+
+    :arg meeting: the dictionnary of the columns of a recursive meeting.
+    :arg dates: a list of date objects.
+    """
+    frequency = meeting['recursion_frequency']
+    last = recurrence.last_occurrence_index(
+        meeting['meeting_date'], frequency, meeting['recursion_ends'])
+    excluded = sorted(set(
+        (day - meeting['meeting_date']).days // frequency
+        for day in dates
+        if meeting['meeting_date'] <= day <= meeting['recursion_ends']
+        and (day - meeting['meeting_date']).days % frequency == 0
+    ))
+
+    bounds = []
+    first = 0
+    for cnt in excluded + [last + 1]:
+        if cnt > first:
+            bounds.append((first, cnt - 1))
+        first = cnt + 1
+
+    meetings = []
+    for first, last in bounds:
+        delta = timedelta(days=frequency * first)
+        part = dict(meeting)
+        part['meeting_date'] = meeting['meeting_date'] + delta
+        part['meeting_date_end'] = meeting['meeting_date_end'] + delta
+        part['recursion_ends'] = meeting['meeting_date'] + timedelta(
+            days=frequency * last)
+        if first == last:
+            part['recursion_frequency'] = None
+            part['recursion_ends'] = None
+        _set_vcal_utc(part)
+        meetings.append(part)
+    return meetings
 
-        if isinstance(meeting_date_end, datetime):
-            meeting_time_stop = meeting_date_end.time()
-            meeting_date_end = meeting_date_end.date()
 
-        _log.info('Add meeting: {} - Start: {}:{} - End:   {}:{}'.format(
-            meeting_name, meeting_date, meeting_time_start,
-            meeting_date_end, meeting_time_stop
-        ))
+def _set_vcal_utc(meeting):
+    """ Set the start and the end in UTC of the provided meeting, as the
+    bulk inserts skip Meeting.update_utc.
+    """
+    try:
+        meeting['meeting_start_utc'] = to_utc(
+            meeting['meeting_date'], meeting['meeting_time_start'],
+            meeting['meeting_timezone'])
+        meeting['meeting_stop_utc'] = to_utc(
+            meeting['meeting_date_end'], meeting['meeting_time_stop'],
+            meeting['meeting_timezone'])
+    except pytz.UnknownTimeZoneError:
+        raise InvalidMeeting(
+            gettext(
+                'Unknown timezone: %(tzone)s',
+                tzone=meeting['meeting_timezone']))
+
+
+def get_vcal_meeting(meeting, calendar):
+    """ Return the dictionnary of the columns of the meeting corresponding
+    to the provided component of an iCalendar file, ready to be inserted
+    in the specified calendar.
+
+    :arg meeting: a vobject component (VEVENT, VTODO...).
+    :arg calendar: the Calendar object the meeting is added to.
+    :raises InvalidMeeting: if the component does not describe a valid
+        meeting.
+    """
+    meeting_name = ', '.join(
+        [el.value for el in meeting.contents.get('summary', [])])
+    meeting_description = ', '.join(
+        [el.value for el in meeting.contents.get('description', [])]
+    ) or None
+
+    tzone = 'UTC'
+    full_day = False
+    if meeting.contents.get('transp', False):
+        full_day = True
+
+    meeting_date = meeting.dtstart.value
+    meeting_time_start = time(0, 0)
+    tzinfo = None
+    if isinstance(meeting_date, datetime):
+        tzone = _get_vcal_timezone(meeting_date)
+        tzinfo = meeting_date.tzinfo
+        meeting_time_start = meeting_date.time()
+        meeting_date = meeting_date.date()
+
+    meeting_date_end = meeting_date
+    meeting_time_stop = time(0, 0)
+    if meeting.name == 'VEVENT':
+        meeting_date_end = meeting.dtend.value
+    else:
+        full_day = True
+
+    if isinstance(meeting_date_end, datetime):
+        meeting_time_stop = meeting_date_end.time()
+        meeting_date_end = meeting_date_end.date()
+
+    if full_day:
+        tzone = 'UTC'
+        tzinfo = None
+
+    meeting_time_start, meeting_time_stop = get_meeting_datetimes(
+        meeting_date, meeting_date_end,
+        meeting_time_start, meeting_time_stop, full_day)
 
-        add_meeting(
+    output = dict(
+        meeting_name=meeting_name,
+        meeting_date=meeting_time_start.date(),
+        meeting_date_end=meeting_time_stop.date(),
+        meeting_time_start=meeting_time_start.time(),
+        meeting_time_stop=meeting_time_stop.time(),
+        meeting_timezone=tzone,
+        meeting_information=meeting_description,
+        calendar_name=calendar.calendar_name,
+        reminder_id=None,
+        meeting_location=None,
+        recursion_frequency=None,
+        recursion_ends=None,
+        full_day=full_day,
+    )
+    _set_vcal_utc(output)
+
+    if 'rrule' in meeting.contents:
+        frequency, ends = get_vcal_recursion(
+            meeting.rrule.value, output['meeting_date'],
+            output['meeting_time_start'], tzone, tzinfo=tzinfo)
+        output['recursion_frequency'] = frequency
+        output['recursion_ends'] = ends
+
+    return output
+
+
+def add_vcal_file(session, calendar, stream, fas_user, admin=False):
+    """ Add the meetings from the iCalendar stream provided into the calendar
+    specified.
+
+    All the events are checked before any of them is added: if some are
+    invalid, an InvalidMeeting exception listing them is raised and the
+    calendar is left untouched. The meetings and the links to their
+    manager are then inserted in bulk, in a single transaction.
+
+    The events repeating every few days or weeks are added as a single
+    recursive meeting, split where occurrences are excluded (EXDATE) or
+    modified (RECURRENCE-ID). Only the first occurrence of the events
+    whose recurrence rule cannot be expressed that way is added.
+
+    Returns the number of meetings added.
+    """
+    _log.info('Uploading a vCal file')
+    if not is_user_managing_in_calendar(
             session,
-            calendarobj=calendar,
-            fas_user=fas_user,
-            meeting_name=meeting_name,
-            meeting_date=meeting_date,
-            meeting_date_end=meeting_date_end,
-            meeting_time_start=meeting_time_start,
-            meeting_time_stop=meeting_time_stop,
-            comanager=fas_user.username,
-            meeting_information=meeting_description,
-            meeting_location=None,
-            tzone=tzone,
-            frequency=None,
-            end_repeats=None,
-            remind_when=None,
-            reminder_from=None,
-            remind_who=None,
-            full_day=full_day,
-            admin=admin)
+            calendar.calendar_name,
+            fas_user) and not admin:  # pragma: no cover
+        raise UserNotAllowed(
+            gettext(
+                'You are not allowed to add a meeting to this calendar'
+            )
+        )
+
+    meetings = []
+    series = []
+    overrides = {}
+    errors = []
+    for cnt, component in enumerate(iter_vcal_components(stream)):
+        try:
+            meeting = vobject.readOne(component)
+            row = get_vcal_meeting(meeting, calendar)
+            uid = None
+            if 'uid' in meeting.contents:
+                uid = meeting.uid.value
+            # The modified occurrences of a series are meetings of their
+            # own, removed from the series
+            if 'recurrence-id' in meeting.contents:
+                overrides.setdefault(uid, []).append(
+                    meeting.recurrence_id.value)
+            if row['recursion_frequency']:
+                exdates = [
+                    value
+                    for exdate in meeting.contents.get('exdate', [])
+                    for value in exdate.value
+                ]
+                series.append((row, uid, exdates))
+            else:
+                meetings.append(row)
+        except (FedocalException, vobject.base.VObjectError,
+                AttributeError, LookupError, ValueError) as err:
+            errors.append(
+                gettext('event %(cnt)s: %(error)s', cnt=cnt + 1, error=err))
+
+    if errors:
+        raise InvalidMeeting(
+            gettext(
+                'Could not import the iCalendar file, %(errors)s',
+                errors='; '.join(errors)))
+
+    for row, uid, exdates in series:
+        dates = [
+            _get_vcal_date(value, row['meeting_timezone'])
+            for value in exdates + overrides.get(uid, [])
+        ]
+        meetings.extend(split_meeting_series(row, dates))
+
+    _log.info('Adding %s meetings to %s', len(meetings), calendar)
+    if not meetings:
+        return 0
+
+    username = User.get_or_create(session, fas_user.username).username
+    # All the meetings have the same manager, the order in which their
+    # identifiers are returned does not matter
+    if session.get_bind().dialect.insert_executemany_returning:
+        meeting_ids = session.scalars(
+            insert(Meeting).returning(Meeting.meeting_id), meetings)
+    else:
+        # The database (ie: MySQL) cannot return the identifiers of the
+        # rows inserted at once, let the ORM insert them
+        objects = [
+            Meeting(**dict(
+                (key, value) for key, value in row.items()
+                if key not in ('meeting_start_utc', 'meeting_stop_utc')))
+            for row in meetings
+        ]
+        session.add_all(objects)
+        session.flush()
+        meeting_ids = [obj.meeting_id for obj in objects]
+    session.bulk_insert_mappings(MeetingsUsers, [
+        dict(meeting_id=meeting_id, username=username)
+        for meeting_id in meeting_ids
+    ])
+    # The bulk inserts skip the session events
+    calendar.bump_generation()
+    session.commit()
+    return len(meetings)
 
 
 def update_date_rec_meeting(meeting, action='last', date_limit=None):
@@ -1283,15 +1846,12 @@ def update_date_rec_meeting(meeting, action='last', date_limit=None):
         date_limit = meeting.meeting_date
 
     if meeting.recursion_frequency and meeting.recursion_ends:
-        meetingobj = Meeting.copy(meeting)
-        delta = timedelta(days=meetingobj.recursion_frequency)
-        while meetingobj.meeting_date < date_limit:
-            if meetingobj.recursion_ends < meetingobj.meeting_date + \
-                    delta:  # pragma: no cover
-                break
-            meetingobj.meeting_date = meetingobj.meeting_date + delta
-            meetingobj.meeting_date_end = meetingobj.meeting_date_end + delta
-        meetingobj.meeting_manager_user = meeting.meeting_manager_user
+        delta = timedelta(days=meeting.recursion_frequency)
+        cnt = recurrence.nearest_occurrence_index(meeting, date_limit)
+        meetingobj = MeetingOccurrence(
+            meeting,
+            meeting.meeting_date + delta * cnt,
+            meeting.meeting_date_end + delta * cnt)
 
         if action == 'closest':
             last_date = meetingobj.meeting_date - delta
@@ -1336,19 +1896,26 @@ def get_days_of_month_location(session, loc_name, year, month, tzone=None):
         - timedelta(days=1)
 
     meetings = get_by_date_at_location(
-        session, loc_name, start_date, end_date, tzone)
+        session, loc_name, start_date, end_date, tzone, profile='week')
     return __get_days(meetings)
 
 
 def get_days_of_month_calendar(session, calendar, year, month, tzone=None):
     """ Return the list of days having a meeting on the specified month.
+    The result is cached for the current generation of the calendar.
     """
 
-    start_date = datetime(year, month, 1).date()
-    end_date = start_date \
-        + relativedelta(months=+1) \
-        - timedelta(days=1)
+    def _get_days_of_month():
+        start_date = datetime(year, month, 1).date()
+        end_date = start_date \
+            + relativedelta(months=+1) \
+            - timedelta(days=1)
 
-    meetings = get_by_date(
-        session, calendar, start_date, end_date, tzone)
-    return __get_days(meetings)
+        meetings = get_by_date(
+            session, calendar, start_date, end_date, tzone, profile='week')
+        return __get_days(meetings)
+
+    return cache.get_or_create(
+        calendar,
+        'month:%04d-%02d:%s' % (year, month, tzone),
+        _get_days_of_month)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+"""
+cache - Cache of the computed views of the calendars.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+The entries are grouped per calendar and their keys contain the
+generation of the calendar, which the database bumps every time the
+calendar or one of its meetings changes. The entries of the previous
+generations are then never read again and expire on their own.
+
+Two backends are available:
+  - MemoryCache: an in-process LRU cache with a time-to-live,
+  - SharedCache: relies on a memcached-like client (providing the get,
+    set and delete methods of python-memcached), shared by all the
+    processes. A MemoryCache can stand in for the client.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import collections
+import logging
+import threading
+import time
+
+_log = logging.getLogger(__name__)
+
+
+class NullCache(object):
+    """ Backend used when the cache is disabled, nothing is ever stored.
+    """
+
+    def get(self, key):
+        """ Return the value stored for this key or None. """
+        return None
+
+    def set(self, key, value, time=0):
+        """ Store the value for this key for ``time`` seconds (0 meaning
+        the default time-to-live of the backend). """
+        pass
+
+    def delete(self, key):
+        """ Remove the value stored for this key. """
+        pass
+
+    def stats(self):
+        """ Return a dictionnary describing the backend. """
+        return {'backend': self.__class__.__name__}
+
+
+class MemoryCache(NullCache):
+    """ In-process LRU cache whose entries expire after a given time. """
+
+    def __init__(self, maxsize=512, ttl=300):
+        """ Constructor instanciating the defaults values.
+
+        :kwarg maxsize: the maximum number of entries kept.
+        :kwarg ttl: the default number of seconds the entries are kept.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the value stored for this key or None. """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] < _now():
+                del self._data[key]
+                item = None
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, time=0):
+        """ Store the value for this key for ``time`` seconds (0 meaning
+        the default time-to-live of the cache). """
+        expires = _now() + (time or self.ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """ Remove the value stored for this key. """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        """ Return a dictionnary describing the backend and its size. """
+        output = super(MemoryCache, self).stats()
+        output['size'] = len(self._data)
+        return output
+
+
+class SharedCache(NullCache):
+    """ Cache stored in a memcached-like server shared by all the
+    processes of the application. """
+
+    def __init__(self, client, ttl=300, prefix='fedocal'):
+        """ Constructor instanciating the defaults values.
+
+        :arg client: the client to the shared cache, providing the get,
+            set(key, value, time) and delete methods.
+        :kwarg ttl: the default number of seconds the entries are kept.
+        :kwarg prefix: string prepended to all the keys.
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        """ Return the value stored for this key or None. """
+        try:
+            value = self.client.get('%s:%s' % (self.prefix, key))
+        except Exception as err:  # pragma: no cover
+            _log.warning('Could not read from the cache: %s', err)
+            value = None
+        return value
+
+    def set(self, key, value, time=0):
+        """ Store the value for this key for ``time`` seconds (0 meaning
+        the default time-to-live of the cache). """
+        try:
+            self.client.set(
+                '%s:%s' % (self.prefix, key), value, time=time or self.ttl)
+        except Exception as err:  # pragma: no cover
+            _log.warning('Could not write to the cache: %s', err)
+
+    def delete(self, key):
+        """ Remove the value stored for this key. """
+        try:
+            self.client.delete('%s:%s' % (self.prefix, key))
+        except Exception as err:  # pragma: no cover
+            _log.warning('Could not delete from the cache: %s', err)
+
+
+def _now():
+    """ Return the current time in seconds since the epoch. """
+    return time.time()
+
+
+_BACKEND = NullCache()
+_STATS = {'hits': 0, 'misses': 0}
+
+
+def configure(config):
+    """ Set up the cache according to the configuration of the
+    application.
+
+    :arg config: the configuration of the flask application, relying on
+        the keys CACHE_BACKEND (None, 'memory' or 'memcached'),
+        CACHE_TTL, CACHE_SIZE and CACHE_SERVERS.
+    """
+    backend = config.get('CACHE_BACKEND')
+    ttl = int(config.get('CACHE_TTL', 300))
+    if not backend:
+        set_backend(NullCache())
+    elif backend == 'memory':
+        set_backend(MemoryCache(
+            maxsize=int(config.get('CACHE_SIZE', 512)), ttl=ttl))
+    elif backend == 'memcached':
+        import memcache
+        set_backend(SharedCache(
+            memcache.Client(config.get('CACHE_SERVERS', ['127.0.0.1:11211'])),
+            ttl=ttl))
+    else:
+        raise ValueError('Unknown cache backend: %s' % backend)
+
+
+def set_backend(backend):
+    """ Replace the backend used to cache the information and reset the
+    statistics. """
+    global _BACKEND
+    _BACKEND = backend
+    _STATS.update(hits=0, misses=0)
+
+
+def get_backend():
+    """ Return the backend currently used. """
+    return _BACKEND
+
+
+def get_or_create(calendarobj, key, creator):
+    """ Return the value cached for the specified key in the specified
+    calendar, calling creator() to compute and store it if needed.
+
+    :arg calendarobj: the Calendar object the value depends on.
+    :arg key: a string identifying the value in the calendar.
+    :arg creator: a function without argument returning the value, it
+        must only hold plain data (no object bound to a database session)
+        since it is shared between the requests.
+    """
+    if type(_BACKEND) is NullCache:
+        _STATS['misses'] += 1
+        return creator()
+    fullkey = 'calendar:%s:%s:%s' % (
+        calendarobj.calendar_name, calendarobj.calendar_generation, key)
+    value = _BACKEND.get(fullkey)
+    if value is None:
+        _STATS['misses'] += 1
+        value = creator()
+        _BACKEND.set(fullkey, value)
+    else:
+        _STATS['hits'] += 1
+    return value
+
+
+def stats():
+    """ Return the hits and misses of the cache along with the
+    information about its backend. """
+    output = _BACKEND.stats()
+    output.update(_STATS)
+    return output
@@ -3,41 +3,108 @@
   :Author: Ralph Bean <rbean@redhat.com>
   :Author: Pierre-Yves Chibon <pingou@pingoured.fr>
 
+The messages are published from a background thread when a queue is
+configured (see fedocal.fedocallib.publisher), directly otherwise.
+
 """
 from __future__ import unicode_literals, absolute_import
 
 import logging
 
 import fedora_messaging.api
-from fedora_messaging.exceptions import PublishReturned, ConnectionException
+from fedora_messaging.exceptions import (
+    ConnectionException, NoFreeChannels, PublishReturned, PublishTimeout)
 
 import fedocal_messages
 import fedocal_messages.messages as schema
 
+from fedocal.fedocallib import publisher
+
 
 _log = logging.getLogger(__name__)
 
+_PUBLISHER = None
 
-def publish(topic, msg):  # pragma: no cover
+
+def send(topic, msg):
+    """ Publish the message on fedora-messaging, raise
+    publisher.BrokerUnavailable if the broker cannot be reached or does
+    not answer in time. """
     _log.debug('Publishing a message for %s: %s', topic, msg)
-    try:
+    msg_cls = fedocal_messages.get_message_object_from_topic(
+        'fedocal.%s' % topic
+    )
 
-        msg_cls = fedocal_messages.get_message_object_from_topic(
-            'fedocal.%s' % topic
+    if not hasattr(msg_cls, "app_name") is False:
+        _log.warning(
+            "fedocal is about to send a message that has no schemas: %s",
+            topic
         )
 
-        if not hasattr(msg_cls, "app_name") is False:
-            _log.warning(
-                "fedocal is about to send a message that has no schemas: %s",
-                topic
-            )
-
-        message = msg_cls(body=msg)
+    message = msg_cls(body=msg)
+    try:
         fedora_messaging.api.publish(message)
         _log.debug("Sent to fedora_messaging")
     except PublishReturned as e:
         _log.exception(
             'Fedora Messaging broker rejected message %s: %s',
             message.id, e)
-    except ConnectionException as e:
-        _log.exception('Error sending message %s: %s', message.id, e)
+    except (ConnectionException, NoFreeChannels, PublishTimeout) as e:
+        raise publisher.BrokerUnavailable(
+            'Error sending message %s: %s' % (message.id, e))
+
+
+def configure(config):
+    """ Set up the publishing of the messages according to the
+    configuration of the application.
+
+    :arg config: the configuration of the flask application, relying on
+        the keys PUBLISH_QUEUE_SIZE (0 to publish the messages directly),
+        PUBLISH_BATCH_SIZE, PUBLISH_SPOOL, PUBLISH_RETRY_DELAY and
+        PUBLISH_MAX_RETRY_DELAY.
+    """
+    global _PUBLISHER
+    if _PUBLISHER is not None:
+        _PUBLISHER.close()
+    maxsize = int(config.get('PUBLISH_QUEUE_SIZE', 0))
+    if not maxsize:
+        _PUBLISHER = None
+        return
+    spool = None
+    if config.get('PUBLISH_SPOOL'):
+        spool = publisher.SqliteSpool(config['PUBLISH_SPOOL'])
+    _PUBLISHER = publisher.Publisher(
+        send,
+        spool=spool,
+        maxsize=maxsize,
+        batch_size=int(config.get('PUBLISH_BATCH_SIZE', 50)),
+        retry_delay=int(config.get('PUBLISH_RETRY_DELAY', 5)),
+        max_retry_delay=int(config.get('PUBLISH_MAX_RETRY_DELAY', 300)),
+    )
+
+
+def publish(topic, msg):
+    """ Publish the message, from the background thread if a queue is
+    configured. """
+    if _PUBLISHER is not None:
+        _PUBLISHER.publish(topic, msg)
+        return
+    try:
+        send(topic, msg)
+    except publisher.BrokerUnavailable as e:
+        _log.exception(e)
+
+
+def flush(timeout=None):
+    """ Wait until the queued messages are published or spooled, return
+    False if they are not within ``timeout`` seconds. """
+    if _PUBLISHER is None:
+        return True
+    return _PUBLISHER.flush(timeout)
+
+
+def stats():
+    """ Return the statistics of the publishing queue. """
+    if _PUBLISHER is None:
+        return {'queue': None}
+    return _PUBLISHER.stats()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+feeds - Assembly of the iCalendar feeds from pre-rendered fragments.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+Each meeting is rendered once into its VEVENT text, along with the
+VTIMEZONE blocks it relies on. The fragments are stored keyed by the
+identifier of the meeting and a fingerprint of all the information they
+are built from, so a meeting is only rendered again once it changed and
+the entries of its previous versions simply expire.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import hashlib
+
+import vobject
+
+import fedocal.fedocallib as fedocallib
+from fedocal.fedocallib import cache
+
+# The fragments only depend on their key, they can be kept in each
+# process whatever cache backend is configured.
+FRAGMENTS = cache.MemoryCache(maxsize=20000, ttl=24 * 3600)
+
+_HEADER = None
+_FOOTER = 'END:VCALENDAR\r\n'
+
+
+def _get_header():
+    """ Return the lines starting a VCALENDAR, as serialized by vobject.
+    """
+    global _HEADER
+    if _HEADER is None:
+        output = vobject.iCalendar().serialize()
+        _HEADER = output[:-len(_FOOTER)]
+    return _HEADER
+
+
+def _fingerprint(meeting, reminder, tzid_prefix):
+    """ Return a string identifying the version of the specified meeting
+    as rendered in a feed.
+    """
+    info = (
+        meeting.meeting_name,
+        meeting.meeting_information,
+        meeting.meeting_manager,
+        meeting.meeting_location,
+        meeting.meeting_timezone,
+        meeting.meeting_date,
+        meeting.meeting_date_end,
+        meeting.meeting_time_start,
+        meeting.meeting_time_stop,
+        meeting.full_day,
+        meeting.recursion_frequency,
+        meeting.recursion_ends,
+        meeting.calendar_name,
+        reminder,
+        tzid_prefix,
+    )
+    return hashlib.sha1(repr(info).encode('utf-8')).hexdigest()
+
+
+def _split_components(text):
+    """ Return the VTIMEZONE and VEVENT blocks of the provided serialized
+    VCALENDAR, as two lists of strings.
+    """
+    timezones = []
+    events = []
+    block = None
+    depth = 0
+    for line in text.splitlines(True):
+        if line.startswith('BEGIN:'):
+            depth += 1
+            if depth == 2:
+                block = []
+        if block is not None:
+            block.append(line)
+        if line.startswith('END:'):
+            depth -= 1
+            if depth == 1:
+                component = ''.join(block)
+                if line.startswith('END:VTIMEZONE'):
+                    timezones.append(component)
+                else:
+                    events.append(component)
+                block = None
+    return timezones, events
+
+
+def _render_meeting(meeting, reminder, tzid_prefix):
+    """ Render the specified meeting and return the tuple of the
+    VTIMEZONE blocks it relies on and of its VEVENT block.
+    """
+    ical = vobject.iCalendar()
+    fedocallib.add_meeting_to_vcal(ical, meeting, reminder=reminder)
+    output = ical.serialize()
+    if tzid_prefix:
+        output = output.replace('TZID:', 'TZID:%s' % tzid_prefix)
+        output = output.replace('TZID=', 'TZID=%s' % tzid_prefix)
+    timezones, events = _split_components(output)
+    return tuple(timezones), ''.join(events)
+
+
+def get_meeting_fragment(meeting, reminder=None, tzid_prefix=''):
+    """ Return the pre-rendered fragment of the specified meeting: a
+    tuple of the VTIMEZONE blocks it relies on and of its VEVENT block.
+    The meeting is only rendered if it changed since it was last
+    rendered.
+
+    :arg meeting: a fedocal.model.Meeting object.
+    :kwarg reminder: None or a datetime.timedelta instance.
+    :kwarg tzid_prefix: string prepended to the identifiers of the
+        timezones.
+    """
+    key = 'vevent:%s:%s' % (
+        meeting.meeting_id, _fingerprint(meeting, reminder, tzid_prefix))
+    fragment = FRAGMENTS.get(key)
+    if fragment is None:
+        fragment = _render_meeting(meeting, reminder, tzid_prefix)
+        FRAGMENTS.set(key, fragment)
+    return fragment
+
+
+def iter_feed(meetings, reminder=None, tzid_prefix=''):
+    """ Yield the serialized iCalendar feed of the specified meetings one
+    component at a time: the header, the VTIMEZONE blocks, one VEVENT
+    per meeting and the footer, so the feed never has to be held
+    entirely in memory.
+
+    :arg meetings: a list of fedocal.model.Meeting objects.
+    :kwarg reminder: None or a datetime.timedelta instance.
+    :kwarg tzid_prefix: string prepended to the identifiers of the
+        timezones.
+    """
+    yield _get_header()
+
+    # The VTIMEZONE blocks come first, all the meetings of a timezone
+    # rely on the same ones.
+    timezones = set()
+    tzids = set()
+    for meeting in meetings:
+        if meeting.meeting_timezone in timezones:
+            continue
+        timezones.add(meeting.meeting_timezone)
+        meeting_timezones, _ = get_meeting_fragment(
+            meeting, reminder=reminder, tzid_prefix=tzid_prefix)
+        for timezone in meeting_timezones:
+            # Like vobject, only keep one VTIMEZONE per TZID
+            tzid = timezone.splitlines()[1]
+            if tzid not in tzids:
+                tzids.add(tzid)
+                yield timezone
+
+    for meeting in meetings:
+        yield get_meeting_fragment(
+            meeting, reminder=reminder, tzid_prefix=tzid_prefix)[1]
+
+    yield _FOOTER
+
+
+def build_feed(meetings, reminder=None, tzid_prefix=''):
+    """ Return the serialized iCalendar feed of the specified meetings,
+    assembled from their pre-rendered fragments.
+
+    :arg meetings: a list of fedocal.model.Meeting objects.
+    :kwarg reminder: None or a datetime.timedelta instance.
+    :kwarg tzid_prefix: string prepended to the identifiers of the
+        timezones.
+    """
+    return ''.join(
+        iter_feed(meetings, reminder=reminder, tzid_prefix=tzid_prefix))
@@ -16,34 +16,77 @@ license.
 """
 from __future__ import unicode_literals, absolute_import, print_function
 
+import itertools
 import operator
+import uuid
 
 from datetime import date
+from datetime import datetime
 from datetime import timedelta
 
+import pytz
 import six
 from sqlalchemy import (
     Boolean,
+    case,
     create_engine,
     Column,
     distinct,
     Date,
+    DateTime,
     Enum,
+    event,
     ForeignKey,
+    Index,
     Integer,
+    literal,
     String,
     Text,
     Time,
+    UniqueConstraint,
 )
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import column_property
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import lazyload
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm import raiseload
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import Session
 from sqlalchemy.sql import and_, or_
+from sqlalchemy.sql.expression import FunctionElement
 from sqlalchemy import func as safunc
+from sqlalchemy import inspect
+
+from fedocal.fedocallib import recurrence
+from fedocal.fedocallib.timezones import get_timezone
+from fedocal.fedocallib.serializer import MeetingSerializer
 
 BASE = declarative_base()
 
+# The relationships of the meetings to load for each of the paths reading
+# them, see Meeting.load_options. The other relationships are only loaded
+# when accessed, or raise an error if STRICT_LOADING is True.
+QUERY_PROFILES = {
+    # Week grid and days of the month of the calendars
+    'week': ('calendar',),
+    # Lists of meetings
+    'list': ('calendar',),
+    # iCal feeds, the managers are the organizers of the meetings
+    'ical': ('calendar', 'meeting_manager_user'),
+    # JSON API
+    'json': ('calendar', 'meeting_manager_user'),
+    # Selection of the reminders to add to the outbox
+    'cron': (),
+}
+# Profiles for which the description of the meetings is not loaded
+LIGHT_PROFILES = ('week', 'cron')
+STRICT_LOADING = False
+
 
 def create_tables(db_url, alembic_ini=None, debug=False):
     """ Creates the tables in the database using the information from the
@@ -96,6 +139,107 @@ def fill_default_status(session):
     session.commit()
 
 
+class DaysBetween(FunctionElement):
+    """ SQL expression returning the number of days in between two dates
+    (ie: ``stop - start``), as an integer.
+    """
+    type = Integer()
+    name = 'days_between'
+    inherit_cache = True
+
+    def __init__(self, start, stop):
+        """ Constructor instanciating the defaults values. """
+        start, stop = [
+            literal(item, type_=Date) if isinstance(item, date) else item
+            for item in (start, stop)
+        ]
+        super(DaysBetween, self).__init__(start, stop)
+
+
+@compiles(DaysBetween)
+def _days_between_default(element, compiler, **kw):
+    """ Dates substraction returns a number of days in PostgreSQL. """
+    start, stop = list(element.clauses)
+    return '(%s - %s)' % (compiler.process(stop, **kw),
+                          compiler.process(start, **kw))
+
+
+@compiles(DaysBetween, 'sqlite')
+def _days_between_sqlite(element, compiler, **kw):
+    """ SQLite stores the dates as text, rely on julianday. """
+    start, stop = list(element.clauses)
+    return 'CAST(julianday(%s) - julianday(%s) AS INTEGER)' % (
+        compiler.process(stop, **kw), compiler.process(start, **kw))
+
+
+@compiles(DaysBetween, 'mysql')
+def _days_between_mysql(element, compiler, **kw):
+    """ MySQL has a dedicated function for this. """
+    start, stop = list(element.clauses)
+    return 'DATEDIFF(%s, %s)' % (
+        compiler.process(stop, **kw), compiler.process(start, **kw))
+
+
+def to_utc(day, hour, tzone):
+    """ Return the naive datetime in UTC corresponding to the specified day
+    and hour in the specified timezone.
+
+    :arg day: a date object.
+    :arg hour: a time object.
+    :arg tzone: the name of the timezone in which day and hour are
+        expressed.
+    """
+    value = datetime(day.year, day.month, day.day, hour.hour, hour.minute)
+    if tzone != 'UTC':
+        value = get_timezone(tzone).localize(value).astimezone(
+            pytz.utc).replace(tzinfo=None)
+    return value
+
+
+def recursion_in_window(start_date=None, end_date=None):
+    """ Return the SQL condition restricting the recursive meetings to
+    those having at least one occurrence in between the two specified
+    dates (included).
+
+    This is the SQL counterpart of recurrence.occurrence_range: the
+    offset, in days, of the first occurrence happening on or after
+    start_date is computed using modular arithmetic and compared to the
+    end of the window and to the end of the recursion.
+
+    :kwarg start_date: the date from which to consider the occurrences,
+        defaults to the first occurrence of the meeting.
+    :kwarg end_date: the date until which to consider the occurrences,
+        defaults to the end of the recursion.
+    """
+    frequency = Meeting.recursion_frequency
+    if start_date is None:
+        offset = 0
+    else:
+        delta = DaysBetween(Meeting.meeting_date, start_date)
+        offset = case(
+            (Meeting.meeting_date >= start_date, 0),
+            else_=delta + (frequency - delta % frequency) % frequency
+        )
+
+    conditions = [
+        (Meeting.recursion_frequency != None),
+        (Meeting.recursion_ends != None),
+    ]
+    # Plain range conditions, which the indexes can use to narrow down
+    # the meetings on which to compute the offset
+    if start_date is not None:
+        conditions.append(Meeting.recursion_ends >= start_date)
+    if end_date is not None:
+        conditions.append(Meeting.meeting_date <= end_date)
+
+    conditions.append(
+        DaysBetween(Meeting.meeting_date, Meeting.recursion_ends) >= offset)
+    if end_date is not None:
+        conditions.append(
+            DaysBetween(Meeting.meeting_date, end_date) >= offset)
+    return and_(*conditions)
+
+
 class CalendarStatus(BASE):
     """ Calendar_status table.
 
@@ -141,6 +285,10 @@ class Calendar(BASE):
         ForeignKey('calendar_status.status', onupdate="cascade"),
         default='Enabled',
         nullable=False)
+    # Bumped every time the calendar or one of its meetings changes
+    calendar_generation = Column(
+        Integer, default=0, server_default='0', nullable=False)
+    calendar_updated = Column(DateTime, default=datetime.utcnow)
     meetings = relationship("Meeting", back_populates="calendar")
 
     def __init__(
@@ -180,6 +328,15 @@ class Calendar(BASE):
         """ Remove the object into the database. """
         session.delete(self)
 
+    def bump_generation(self):
+        """ Mark the calendar as changed, the new generation is written
+        to the database with the next flush of the session.
+        """
+        # Computed by the database so that concurrent transactions cannot
+        # end up with the same generation
+        self.calendar_generation = Calendar.calendar_generation + 1
+        self.calendar_updated = datetime.utcnow()
+
     @property
     def admin_groups(self):
         ''' Return the list of admin groups of this calendar. '''
@@ -235,6 +392,16 @@ class Calendar(BASE):
         """ Retrieve all the Calendar available."""
         return session.query(cls).order_by(cls.calendar_name).all()
 
+    @classmethod
+    def get_last_change(cls, session):
+        """ Return the number of calendars and the last time one of them
+        or one of their meetings changed.
+        """
+        return session.query(
+            safunc.count(cls.calendar_name),
+            safunc.max(cls.calendar_updated),
+        ).one()
+
     @classmethod
     def by_status(cls, session, status):
         """ Retrieve all the Calendar having a certain status. """
@@ -293,6 +460,11 @@ class MeetingsUsers(BASE):
     meeting = relationship("Meeting")
     user = relationship("User", backref="meetings")
 
+    # The primary key already covers the look-ups by username
+    __table_args__ = (
+        Index('ix_meetings_users_meeting_id', 'meeting_id'),
+    )
+
     def __repr__(self):
         """ Representation of the Reminder object when printed.
         """
@@ -332,10 +504,14 @@ class Meeting(BASE):
     __tablename__ = 'meetings'
     meeting_id = Column(Integer, primary_key=True)
     meeting_name = Column(String(200), nullable=False)
-    calendar_name = Column(
-        String(80),
-        ForeignKey('calendars.calendar_name', onupdate="cascade"),
-        nullable=False)
+    # Keep the previous calendar when the meeting is moved, its generation
+    # has to be bumped as well
+    calendar_name = column_property(
+        Column(
+            String(80),
+            ForeignKey('calendars.calendar_name', onupdate="cascade"),
+            nullable=False),
+        active_history=True)
     calendar = relationship("Calendar", lazy='joined', back_populates="meetings")
     # 5 person max (32 * 5) + 5 = 165
     meeting_manager_user = relationship('MeetingsUsers', lazy='joined')
@@ -356,6 +532,28 @@ class Meeting(BASE):
     recursion_frequency = Column(Integer, nullable=True, default=None)
     recursion_ends = Column(Date, nullable=True, default=None)
 
+    # Start and end of the (first occurrence of the) meeting in UTC, kept
+    # in sync with the columns above by update_utc
+    meeting_start_utc = Column(DateTime, nullable=True)
+    meeting_stop_utc = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            'ix_meetings_calendar_dates',
+            'calendar_name', 'meeting_date', 'meeting_date_end'),
+        Index(
+            'ix_meetings_location_date',
+            'meeting_location', 'meeting_date',
+            mysql_length={'meeting_location': 255}),
+        Index(
+            'ix_meetings_recursion',
+            'recursion_frequency', 'recursion_ends'),
+        Index(
+            'ix_meetings_calendar_start_utc',
+            'calendar_name', 'meeting_start_utc'),
+        Index('ix_meetings_start_utc', 'meeting_start_utc'),
+    )
+
     # pylint: disable=R0913
     def __init__(
             self, meeting_name,
@@ -390,21 +588,51 @@ class Meeting(BASE):
         """ Save the object into the database. """
         session.add(self)
 
+    def update_utc(self):
+        """ Compute the start and the end of the meeting in UTC from its
+        dates, times and timezone.
+        """
+        if self.meeting_date is None or self.meeting_time_start is None:
+            return
+        self.meeting_start_utc = to_utc(
+            self.meeting_date, self.meeting_time_start,
+            self.meeting_timezone or 'UTC')
+        self.meeting_stop_utc = to_utc(
+            self.meeting_date_end or self.meeting_date,
+            self.meeting_time_stop or self.meeting_time_start,
+            self.meeting_timezone or 'UTC')
+
     def to_json(self):
         """ Return a jsonify string of the object.
         """
+        return MeetingSerializer()(self)
+
+    def recursion_to_json(self):
+        """ Return the description of the recursion of the meeting, from
+        which the clients can expand its occurrences, or None if the
+        meeting is not recursive.
+
+        The ``rrule`` applies to ``dtstart``, which is expressed in the
+        timezone of the meeting, the ``UNTIL`` part being in UTC as
+        required by RFC 5545.
+        """
+        if not self.recursion_frequency or not self.recursion_ends:
+            return None
+        if self.recursion_frequency % 7 == 0:
+            rule = 'FREQ=WEEKLY;INTERVAL=%s' % (self.recursion_frequency // 7)
+        else:
+            rule = 'FREQ=DAILY;INTERVAL=%s' % self.recursion_frequency
+        until = to_utc(
+            self.recursion_ends, self.meeting_time_start,
+            self.meeting_timezone)
         return dict(
-            meeting_id=self.meeting_id,
-            meeting_name=self.meeting_name,
-            meeting_manager=self.meeting_manager,
-            meeting_date=self.meeting_date.strftime('%Y-%m-%d'),
-            meeting_date_end=self.meeting_date_end.strftime('%Y-%m-%d'),
-            meeting_time_start=self.meeting_time_start.strftime('%H:%M:%S'),
-            meeting_time_stop=self.meeting_time_stop.strftime('%H:%M:%S'),
-            meeting_timezone=self.meeting_timezone,
-            meeting_information=self.meeting_information,
-            meeting_location=self.meeting_location,
-            calendar_name=self.calendar_name
+            frequency=self.recursion_frequency,
+            ends=self.recursion_ends.strftime('%Y-%m-%d'),
+            dtstart=datetime.combine(
+                self.meeting_date, self.meeting_time_start
+            ).strftime('%Y-%m-%dT%H:%M:%S'),
+            rrule='%s;UNTIL=%s' % (rule, until.strftime('%Y%m%dT%H%M%SZ')),
+            exdate=[],
         )
 
     def add_manager(self, session, meeting_manager):
@@ -488,6 +716,43 @@ class Meeting(BASE):
         meeting.reminder = self.reminder
         return meeting
 
+    @classmethod
+    def load_options(cls, profile):
+        """ Return the loader options to use when querying the meetings
+        for the specified profile, see QUERY_PROFILES.
+
+        The calendar, of which there is one per meeting, is joined while
+        the managers and the reminder are loaded with one additional query
+        (SELECT ... IN) instead, joining them would repeat the meeting once
+        per manager in the rows returned.
+
+        :arg profile: one of the keys of QUERY_PROFILES or None to load
+            the meetings with their default (joined) relationships.
+        """
+        if profile is None:
+            return []
+        needed = QUERY_PROFILES[profile]
+        options = []
+        for name in ('calendar', 'meeting_manager_user', 'reminder'):
+            attr = getattr(cls, name)
+            if name == 'calendar' and name in needed:
+                options.append(joinedload(attr))
+            elif name in needed:
+                options.append(selectinload(attr))
+            elif STRICT_LOADING:
+                options.append(raiseload(attr, sql_only=True))
+            else:
+                options.append(lazyload(attr))
+        if profile in LIGHT_PROFILES:
+            options.append(load_only(
+                cls.meeting_id, cls.meeting_name, cls.calendar_name,
+                cls.meeting_date, cls.meeting_date_end,
+                cls.meeting_time_start, cls.meeting_time_stop,
+                cls.meeting_timezone, cls.meeting_location, cls.reminder_id,
+                cls.full_day, cls.recursion_frequency, cls.recursion_ends,
+                cls.meeting_start_utc, cls.meeting_stop_utc))
+        return options
+
     @classmethod
     def by_id(cls, session, identifier):
         """ Retrieve a Meeting object from the database based on its
@@ -500,10 +765,12 @@ class Meeting(BASE):
     def get_by_date(
             cls, session, calendar, start_date, stop_date,
             full_day=None, no_recursive=False,
-            name=None):
+            name=None, profile=None):
         """ Retrieve the list of meetings between two date.
         We include the start date and exclude the stop date.
 
+        :arg calendar: the Calendar object of interest, None to retrieve
+            the meetings of all the calendars.
         :kwarg full_day: Can be True, False or None.  True will
             restrict to only meetings which take up the full day.  False will
             only select meetings which do not take the full day.  None will
@@ -513,12 +780,12 @@ class Meeting(BASE):
             Default to False, if True recursive meetings will be excluded.
         :kwarg name: Defaults to None, if set the meetings returned will be
             filtered for this string in their name.
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
 
         """
         query = session.query(
             cls
-        ).filter(
-            Meeting.calendar == calendar
         ).filter(
             or_(
                 and_(
@@ -539,6 +806,8 @@ class Meeting(BASE):
             Meeting.meeting_time_start,
             Meeting.meeting_name)
 
+        if calendar is not None:
+            query = query.filter(Meeting.calendar == calendar)
         if full_day is not None:
             query = query.filter(Meeting.full_day == full_day)
         if no_recursive:
@@ -555,16 +824,22 @@ class Meeting(BASE):
                 Meeting.meeting_name.ilike('%%%s%%' % name)
             )
 
-        return query.all()
+        return query.options(*cls.load_options(profile)).all()
 
     # pylint: disable=R0913
     @classmethod
     def get_by_date_and_location(
-            cls, session, calendar, start_date, stop_date, location):
+            cls, session, calendar, start_date, stop_date, location,
+            profile=None):
         """ Retrieve the list of meetings in a location between two date.
         We include the start date and exclude the stop date.
+
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
         """
-        return session.query(cls).filter(
+        return session.query(cls).options(
+            *cls.load_options(profile)
+        ).filter(
             and_(
                 (Meeting.calendar == calendar),
                 (Meeting.meeting_date >= start_date),
@@ -580,7 +855,7 @@ class Meeting(BASE):
     @classmethod
     def get_by_date_at_location(
             cls, session, location, start_date, stop_date, full_day=None,
-            no_recursive=False):
+            no_recursive=False, profile=None):
         """ Retrieve the list of meetings between two date at a specific
         location.
         We include the start date and exclude the stop date.
@@ -589,6 +864,8 @@ class Meeting(BASE):
             restrict to only meetings which take up the full day.  False will
             only select meetings which do not take the full day.  None will
             not restrict.  Default to None
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
         """
         query = session.query(
             cls
@@ -619,50 +896,55 @@ class Meeting(BASE):
         if no_recursive:
             query = query.filter(Meeting.recursion_frequency == None)
 
-        return query.all()
+        return query.options(*cls.load_options(profile)).all()
 
     @classmethod
     def get_overlaping_meetings(
-            cls, session, calendar, start_date, stop_date):
+            cls, session, calendar, start_date, stop_date,
+            no_recursive=False):
         """ Retrieve the list of meetings overlaping with the date
-        provided.
+        provided, ie: starting before stop_date and ending after
+        start_date (both included).
+
+        :kwarg no_recursive: a boolean specifying whether the list of
+            meetings returned should exclude recursive meetings.
+            Default to False, if True recursive meetings will be excluded.
         """
-        # new meeting including others
-        query1 = session.query(cls).filter(
-            and_(
-                (Meeting.calendar == calendar),
-                (Meeting.meeting_date >= start_date),
-                (Meeting.meeting_date_end <= stop_date),
-            ))
-        # new meeting included in another
-        query2 = session.query(cls).filter(
-            and_(
-                (Meeting.calendar == calendar),
-                (Meeting.meeting_date <= start_date),
-                (Meeting.meeting_date_end >= stop_date),
-            ))
-        # new meeting end included in another
-        query3 = session.query(cls).filter(
-            and_(
-                (Meeting.calendar == calendar),
-                (Meeting.meeting_date >= stop_date),
-                (Meeting.meeting_date_end <= stop_date),
-            ))
-        # new meeting start included in another
-        query4 = session.query(cls).filter(
+        query = session.query(cls).filter(
             and_(
                 (Meeting.calendar == calendar),
-                (Meeting.meeting_date >= start_date),
-                (Meeting.meeting_date_end <= start_date),
-            ))
-
-        query = query1.union(query2).union(query3).union(query4).order_by(
+                (Meeting.meeting_date <= stop_date),
+                (Meeting.meeting_date_end >= start_date),
+            )
+        ).order_by(
             Meeting.meeting_date,
             Meeting.meeting_time_start,
             Meeting.meeting_name
         )
 
-        return list(set(query.all()))
+        if no_recursive:
+            query = query.filter(Meeting.recursion_frequency == None)
+
+        return query.all()
+
+    @classmethod
+    def get_overlaping_single_meetings(
+            cls, session, calendar, start_utc, stop_utc):
+        """ Retrieve the list of non-recursive meetings of the calendar
+        taking place, at least partly, in between the two specified naive
+        UTC datetimes.
+        """
+        return session.query(cls).filter(
+            and_(
+                (Meeting.calendar == calendar),
+                (Meeting.meeting_start_utc < stop_utc),
+                (Meeting.meeting_stop_utc > start_utc),
+                (Meeting.recursion_frequency == None),
+            )
+        ).order_by(
+            Meeting.meeting_start_utc,
+            Meeting.meeting_name
+        ).all()
 
     @classmethod
     def get_at_date(cls, session, calendar, meeting_date, full_day=None):
@@ -690,7 +972,8 @@ class Meeting(BASE):
 
     @classmethod
     def get_active_regular_meeting(
-            cls, session, calendar, start_date, end_date, full_day=None):
+            cls, session, calendar, start_date, end_date, full_day=None,
+            profile=None):
         """ Retrieve the list of recursive meetings occuring before the
         end_date in the specified calendar.
 
@@ -698,14 +981,13 @@ class Meeting(BASE):
             restrict to only meetings which take up the full day.  False will
             only select meetings which do not take the full day.  None will
             not restrict.  Default to None
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
         """
         meetings = session.query(cls).filter(
             and_(
-                (Meeting.meeting_date <= end_date),
-                (Meeting.recursion_ends >= start_date),
                 (Meeting.calendar == calendar),
-                (Meeting.recursion_frequency != None),
-                (Meeting.recursion_ends != None),
+                recursion_in_window(start_date, end_date),
             )
         ).order_by(
             Meeting.meeting_date,
@@ -715,11 +997,12 @@ class Meeting(BASE):
 
         if full_day is not None:
             meetings = meetings.filter(Meeting.full_day == full_day)
-        return meetings.all()
+        return meetings.options(*cls.load_options(profile)).all()
 
     @classmethod
     def get_active_regular_meeting_at_location(
-            cls, session, location, start_date, end_date, full_day=None):
+            cls, session, location, start_date, end_date, full_day=None,
+            profile=None):
         """ Retrieve the list of recursive meetings occuring before the
         end_date at the specified location.
 
@@ -727,14 +1010,13 @@ class Meeting(BASE):
             restrict to only meetings which take up the full day.  False will
             only select meetings which do not take the full day.  None will
             not restrict.  Default to None
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
         """
         meetings = session.query(cls).filter(
             and_(
-                (Meeting.meeting_date <= end_date),
-                (Meeting.recursion_ends >= start_date),
                 (Meeting.meeting_location == location),
-                (Meeting.recursion_frequency != None),
-                (Meeting.recursion_ends != None),
+                recursion_in_window(start_date, end_date),
             )
         ).order_by(
             Meeting.meeting_date,
@@ -744,7 +1026,7 @@ class Meeting(BASE):
 
         if full_day is not None:
             meetings = meetings.filter(Meeting.full_day == full_day)
-        return meetings.all()
+        return meetings.options(*cls.load_options(profile)).all()
 
     @classmethod
     def get_regular_meeting_at_date(
@@ -771,9 +1053,11 @@ class Meeting(BASE):
 
     @classmethod
     def get_active_regular_meeting_by_date(
-            cls, session, calendar, start_date, full_day=None, name=None):
+            cls, session, calendar, start_date, full_day=None, name=None,
+            end_date=None, profile=None):
         """ Retrieve the list of recursive meetings occuring after the
-        start_date in the specified calendar.
+        start_date in the specified calendar (or in all the calendars if
+        calendar is None).
 
         :kwarg full_day: Can be True, False or None.  True will
             restrict to only meetings which take up the full day.  False will
@@ -781,21 +1065,22 @@ class Meeting(BASE):
             not restrict.  Default to None
         :kwarg name: Defaults to None, if set the meetings returned will be
             filtered for this string in their name.
+        :kwarg end_date: Defaults to None, if set only the meetings having
+            at least one occurrence in between start_date and end_date are
+            returned.
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
 
         """
         meetings = session.query(cls).filter(
-            and_(
-                (Meeting.recursion_ends >= start_date),
-                (Meeting.recursion_ends >= Meeting.meeting_date),
-                (Meeting.calendar == calendar),
-                (Meeting.recursion_frequency != None),
-                (Meeting.recursion_ends != None),
-            )
+            recursion_in_window(start_date, end_date)
         ).order_by(
             Meeting.meeting_date,
             Meeting.meeting_time_start,
             Meeting.meeting_name
         )
+        if calendar is not None:
+            meetings = meetings.filter(Meeting.calendar == calendar)
         # Apparently the API allows option that are not used
         if full_day is not None:  # pragma: no cover
             meetings = meetings.filter(Meeting.full_day == full_day)
@@ -805,11 +1090,12 @@ class Meeting(BASE):
                 Meeting.meeting_name.ilike('%%%s%%' % name)
             )
 
-        return meetings.all()
+        return meetings.options(*cls.load_options(profile)).all()
 
     @classmethod
     def get_active_regular_meeting_by_date_at_location(
-            cls, session, location, start_date, full_day=None):
+            cls, session, location, start_date, full_day=None,
+            end_date=None, profile=None):
         """ Retrieve the list of recursive meetings occuring after the
         start_date in the specified location.
 
@@ -817,13 +1103,16 @@ class Meeting(BASE):
             restrict to only meetings which take up the full day.  False will
             only select meetings which do not take the full day.  None will
             not restrict.  Default to None
+        :kwarg end_date: Defaults to None, if set only the meetings having
+            at least one occurrence in between start_date and end_date are
+            returned.
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
         """
         meetings = session.query(cls).filter(
             and_(
-                (Meeting.recursion_ends >= start_date),
                 (Meeting.meeting_location == location),
-                (Meeting.recursion_frequency != None),
-                (Meeting.recursion_ends != None),
+                recursion_in_window(start_date, end_date),
             )
         ).order_by(
             Meeting.meeting_date,
@@ -833,14 +1122,15 @@ class Meeting(BASE):
         # Apparently the API allows option that are not used
         if full_day is not None:  # pragma: no cover
             meetings = meetings.filter(Meeting.full_day == full_day)
-        return meetings.all()
+        return meetings.options(*cls.load_options(profile)).all()
 
     @classmethod
     def get_regular_meeting_by_date(
             cls, session, calendar, start_date, end_date, full_day=None,
-            name=None):
+            name=None, profile=None):
         """ Retrieve the list of recursive meetings happening in between
-        the two specified dates.
+        the two specified dates in the specified calendar (or in all the
+        calendars if calendar is None).
 
         :kwarg full_day: Can be True, False or None.  True will
             restrict to only meetings which take up the full day.  False will
@@ -848,11 +1138,14 @@ class Meeting(BASE):
             not restrict.  Default to None
         :kwarg name: Defaults to None, if set the meetings returned will be
             filtered for this string in their name.
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
 
         """
         meetings = cls.expand_regular_meetings(
             cls.get_active_regular_meeting_by_date(
-                session, calendar, start_date, full_day, name=name),
+                session, calendar, start_date, full_day, name=name,
+                end_date=end_date, profile=profile),
             end_date=end_date, start_date=start_date)
         meetings.sort(key=operator.attrgetter(
             'meeting_date', 'meeting_time_start', 'meeting_name'))
@@ -860,7 +1153,8 @@ class Meeting(BASE):
 
     @classmethod
     def get_regular_meeting_by_date_at_location(
-            cls, session, location, start_date, end_date, full_day=None):
+            cls, session, location, start_date, end_date, full_day=None,
+            profile=None):
         """ Retrieve the list of recursive meetings happening in between
         the two specified dates at a specific location.
 
@@ -868,10 +1162,13 @@ class Meeting(BASE):
             restrict to only meetings which take up the full day.  False will
             only select meetings which do not take the full day.  None will
             not restrict.  Default to None
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
         """
         meetings = cls.expand_regular_meetings(
             cls.get_active_regular_meeting_by_date_at_location(
-                session, location, start_date, full_day),
+                session, location, start_date, full_day,
+                end_date=end_date, profile=profile),
             end_date=end_date, start_date=start_date)
         meetings.sort(key=operator.attrgetter(
             'meeting_date', 'meeting_time_start', 'meeting_name'))
@@ -949,44 +1246,105 @@ class Meeting(BASE):
 
         return meetings
 
+    def get_occurrences_utc(self, start_utc, stop_utc):
+        """ Return the list of the occurrences of the meeting starting in
+        between the two provided datetimes, in UTC, as tuples of the day
+        of the occurrence in the timezone of the meeting and of its start
+        in UTC.
+
+        :arg start_utc: the datetime, in UTC, from which the occurrences
+            are considered (included).
+        :arg stop_utc: the datetime, in UTC, until which the occurrences
+            are considered (excluded).
+        """
+        if not (self.recursion_frequency and self.recursion_ends):
+            meeting_start = self.meeting_start_utc or to_utc(
+                self.meeting_date, self.meeting_time_start,
+                self.meeting_timezone)
+            if start_utc <= meeting_start < stop_utc:
+                return [(self.meeting_date, meeting_start)]
+            return []
+
+        # The UTC offset of the timezone of the meeting may move its
+        # occurrences to the day before or after
+        one_day = timedelta(days=1)
+        output = []
+        for _, meeting_date, _ in recurrence.iter_occurrences(
+                self, start_utc.date() - one_day, stop_utc.date() + one_day):
+            meeting_start = to_utc(
+                meeting_date, self.meeting_time_start, self.meeting_timezone)
+            if start_utc <= meeting_start < stop_utc:
+                output.append((meeting_date, meeting_start))
+        return output
+
     @classmethod
     def get_meeting_with_reminder(
             cls, session, start_date, start_time, stop_time, offset):
         """ Retrieve the list of meetings with a reminder set in
         <offset> hours for the given day and at the specified hour.
+        The day and the hours are expressed in UTC.
+        """
+        windows = {offset: (
+            datetime.combine(start_date, start_time),
+            datetime.combine(start_date, stop_time))}
+        return [
+            meeting
+            for meeting, _ in cls.get_meetings_to_remind(session, windows)
+        ]
+
+    @classmethod
+    def get_meetings_to_remind(cls, session, windows, profile=None):
+        """ Retrieve, in a single query, the meetings having a reminder due
+        in the provided windows.
+
+        :arg session: the database session to use.
+        :arg windows: a dictionnary associating the offsets of the
+            reminders (ie: 'H-12') to the tuple of the datetimes, in UTC,
+            in between which the meetings with such a reminder start.
+        :kwarg profile: the profile of the meetings to load, see
+            Meeting.load_options.
+        :return a list of tuples (meeting, offset) sorted by date.
         """
-        reminders = session.query(Reminder.reminder_id).filter(
-            Reminder.reminder_offset == offset).all()
-        reminders = [int(item.reminder_id) for item in reminders]
-        if not reminders:
+        one_day = timedelta(days=1)
+        conditions = []
+        for offset, (start_utc, stop_utc) in windows.items():
+            # The UTC offset of the timezone of the recursive meetings
+            # may move their occurrences to the day before or after
+            conditions.append(and_(
+                (Reminder.reminder_offset == offset),
+                or_(
+                    and_(
+                        (Meeting.meeting_start_utc >= start_utc),
+                        (Meeting.meeting_start_utc < stop_utc),
+                        (Meeting.recursion_frequency == None)),
+                    recursion_in_window(
+                        start_utc.date() - one_day,
+                        stop_utc.date() + one_day))))
+        if not conditions:
             return []
-        meetings = session.query(cls).filter(
-            and_(
-                (Meeting.meeting_date == start_date),
-                (Meeting.meeting_time_start >= start_time),
-                (Meeting.meeting_time_start < stop_time),
-                (Meeting.reminder_id.in_(reminders)))).all()
 
-        # Add recursive meetings
-        recursive_meetings = session.query(cls).filter(
-            and_(
-                (Meeting.meeting_time_start >= start_time),
-                (Meeting.meeting_time_start < stop_time),
-                (Meeting.recursion_frequency != None),
-                (Meeting.recursion_ends >= start_date),
-                (Meeting.reminder_id.in_(reminders)))).all()
-        for meeting in recursive_meetings:
-            meeting_date = meeting.meeting_date
-            while meeting_date <= meeting.recursion_ends:
-                if meeting_date == start_date:
-                    if meeting not in meetings:
-                        meetings.append(meeting)
-                    break
-                meeting_date = meeting_date + timedelta(
-                    days=meeting.recursion_frequency)
-        meetings.sort(key=operator.attrgetter(
-            'meeting_date', 'meeting_time_start', 'meeting_name'))
-        return meetings
+        query = session.query(
+            cls, Reminder.reminder_offset
+        ).join(
+            Reminder, Meeting.reminder_id == Reminder.reminder_id
+        ).filter(
+            or_(*conditions)
+        ).options(
+            *cls.load_options(profile)
+        )
+
+        output = []
+        for meeting, offset in query.all():
+            start_utc, stop_utc = windows[offset]
+            if meeting.recursion_frequency \
+                    and not meeting.get_occurrences_utc(start_utc, stop_utc):
+                continue
+            output.append((meeting, offset))
+
+        output.sort(key=lambda item: (
+            item[0].meeting_date, item[0].meeting_time_start,
+            item[0].meeting_name))
+        return output
 
     @staticmethod
     def expand_regular_meetings(
@@ -994,6 +1352,8 @@ class Meeting(BASE):
         """ For a given list of meetings, go through all of them and if
         the meeting is recursive, expand the recursion as if they were
         all different meetings.
+        Each occurrence is returned as a MeetingOccurrence pointing to the
+        recursive Meeting it originates from.
         The end_date keyword argument allows to stop the process earlier
         allowing to have all recursive meeting up to a certain time
         point.
@@ -1002,39 +1362,13 @@ class Meeting(BASE):
         """
         meetings = []
         for meeting in meetings_in:
-            if not end_date:  # pragma: no cover
-                end_date = meeting.recursion_ends
             if meeting.recursion_frequency and meeting.recursion_ends:
-                meeting_date = meeting.meeting_date
-                cnt = 0
-                while meeting_date <= end_date and \
-                        meeting_date <= meeting.recursion_ends:
-                    recmeeting = meeting.copy()
-                    recmeeting.meeting_id = meeting.meeting_id
-                    recmeeting.meeting_manager_user = \
-                        meeting.meeting_manager_user
-                    recmeeting.calendar = meeting.calendar
-                    if start_date \
-                            and meeting_date >= start_date:
-                        recmeeting.meeting_date = \
-                            meeting.meeting_date + timedelta(
-                                days=meeting.recursion_frequency * cnt)
-                        recmeeting.meeting_date_end = \
-                            meeting.meeting_date_end + timedelta(
-                                days=meeting.recursion_frequency * cnt)
-                        meetings.append(recmeeting)
-                    elif not start_date:
-                        recmeeting.meeting_date = \
-                            meeting.meeting_date + timedelta(
-                                days=meeting.recursion_frequency * cnt)
-                        recmeeting.meeting_date_end = \
-                            meeting.meeting_date_end + timedelta(
-                                days=meeting.recursion_frequency * cnt)
-                        meetings.append(recmeeting)
-
-                    cnt = cnt + 1
-                    meeting_date = meeting.meeting_date + timedelta(
-                        days=meeting.recursion_frequency * cnt)
+                for _, meeting_date, meeting_date_end in \
+                        recurrence.iter_occurrences(
+                            meeting, start_date=start_date,
+                            end_date=end_date):
+                    meetings.append(MeetingOccurrence(
+                        meeting, meeting_date, meeting_date_end))
             else:
                 meetings.append(meeting)
         meetings.sort(key=operator.attrgetter(
@@ -1105,7 +1439,176 @@ class Meeting(BASE):
             cls.calendar == calendar
         )
 
-        return query.delete()
+        output = query.delete()
+        calendar.bump_generation()
+        return output
+
+
+class MeetingOccurrence(object):
+    """ A single occurrence of a recursive meeting.
+
+    This is a light-weight read-only view on a Meeting object which only
+    stores the date and time of the occurrence. All the other attributes
+    are read from the Meeting it originates from, thus expanding a
+    recursion does not create any SQLAlchemy object.
+    """
+
+    __slots__ = (
+        'meeting', 'meeting_date', 'meeting_date_end',
+        'meeting_time_start', 'meeting_time_stop')
+
+    def __init__(
+            self, meeting, meeting_date, meeting_date_end,
+            meeting_time_start=None, meeting_time_stop=None):
+        """ Constructor instanciating the defaults values. """
+        if isinstance(meeting, MeetingOccurrence):
+            meeting = meeting.meeting
+        self.meeting = meeting
+        self.meeting_date = meeting_date
+        self.meeting_date_end = meeting_date_end
+        self.meeting_time_start = meeting_time_start \
+            or meeting.meeting_time_start
+        self.meeting_time_stop = meeting_time_stop \
+            or meeting.meeting_time_stop
+
+    def __getattr__(self, name):
+        """ Read all the attributes not specific to this occurrence from
+        the Meeting object.
+        """
+        if name == 'meeting' or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.meeting, name)
+
+    def __repr__(self):
+        """ Representation of the MeetingOccurrence object when printed.
+        """
+        return "<MeetingOccurrence('%s' - '%s', '%s', '%s')>" % (
+            self.meeting_id, self.calendar, self.meeting_name,
+            self.meeting_date)
+
+    def to_json(self):
+        """ Return a jsonify string of the occurrence.
+        """
+        return Meeting.to_json(self)
+
+    def copy(self, meeting=None):
+        """ Materialize this occurrence into a Meeting object, see
+        Meeting.copy.
+        """
+        return self.materialize(meeting)
+
+    def materialize(self, meeting=None):
+        """ Return a Meeting object holding the information of this
+        occurrence, for when the occurrence has to be modified.
+
+        :kwarg meeting: a Meeting object to update
+        """
+        meeting = self.meeting.copy(meeting)
+        meeting.meeting_id = self.meeting.meeting_id
+        meeting.meeting_manager_user = self.meeting.meeting_manager_user
+        meeting.meeting_date = self.meeting_date
+        meeting.meeting_date_end = self.meeting_date_end
+        meeting.meeting_time_start = self.meeting_time_start
+        meeting.meeting_time_stop = self.meeting_time_stop
+        return meeting
+
+
+class LocalizedMeeting(object):
+    """ A read-only view on a meeting (or on an occurrence of a recursive
+    meeting) whose dates and times are expressed in another timezone than
+    the one of the meeting.
+
+    Only the converted dates and times are stored, all the other
+    attributes are read from the Meeting object it originates from,
+    which is thus never modified.
+    """
+
+    __slots__ = (
+        'meeting', 'meeting_date', 'meeting_date_end',
+        'meeting_time_start', 'meeting_time_stop')
+
+    def __init__(
+            self, meeting, meeting_date, meeting_date_end,
+            meeting_time_start, meeting_time_stop):
+        """ Constructor instanciating the defaults values. """
+        while isinstance(meeting, (MeetingOccurrence, LocalizedMeeting)):
+            meeting = meeting.meeting
+        for name, value in [
+                ('meeting', meeting),
+                ('meeting_date', meeting_date),
+                ('meeting_date_end', meeting_date_end),
+                ('meeting_time_start', meeting_time_start),
+                ('meeting_time_stop', meeting_time_stop)]:
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        """ Read all the attributes not converted from the Meeting object.
+        """
+        if name == 'meeting' or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.meeting, name)
+
+    def __setattr__(self, name, value):
+        """ Prevent any change to the object. """
+        raise AttributeError(
+            'LocalizedMeeting objects are read-only, cannot set %s' % name)
+
+    def __reduce__(self):
+        """ Allow copying and pickling the object despite it being
+        read-only.
+        """
+        return (LocalizedMeeting, (
+            self.meeting, self.meeting_date, self.meeting_date_end,
+            self.meeting_time_start, self.meeting_time_stop))
+
+    def __repr__(self):
+        """ Representation of the LocalizedMeeting object when printed.
+        """
+        return "<LocalizedMeeting('%s' - '%s', '%s', '%s')>" % (
+            self.meeting_id, self.calendar, self.meeting_name,
+            self.meeting_date)
+
+    def to_json(self):
+        """ Return a jsonify string of the converted meeting.
+        """
+        return Meeting.to_json(self)
+
+
+@event.listens_for(Meeting, 'before_insert')
+@event.listens_for(Meeting, 'before_update')
+def _meeting_update_utc(mapper, connection, target):
+    """ Keep the UTC start and end of the meetings in sync with their
+    dates, times and timezone whenever they are written to the database.
+    """
+    target.update_utc()
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_calendar_generation(session, flush_context, instances):
+    """ Bump the generation of the calendars which are edited or whose
+    meetings or meeting managers are added, edited or removed, in the same
+    transaction as the change itself.
+    """
+    names = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, Meeting):
+            names.add(obj.calendar_name)
+            names.update(inspect(obj).attrs.calendar_name.history.deleted)
+        elif isinstance(obj, MeetingsUsers) and obj.meeting:
+            names.add(obj.meeting.calendar_name)
+        elif isinstance(obj, Calendar) and obj in session.dirty:
+            names.add(obj.calendar_name)
+
+    for name in names:
+        if not name:
+            continue
+        calendar = session.get(Calendar, name)
+        if calendar is None or calendar in session.new \
+                or calendar in session.deleted:
+            continue
+        calendar.bump_generation()
 
 
 class Reminder(BASE):
@@ -1152,6 +1655,166 @@ class Reminder(BASE):
         return session.query(cls).get(identifier)
 
 
+class ReminderOutbox(BASE):
+    """ Reminder_outbox table.
+
+    Store the reminders to send in the coming days, one per occurrence of
+    the meetings, and whether they were sent. The cron jobs claim the
+    reminders due for a limited time (the lease) before sending them, so
+    several of them can send the reminders in parallel and each reminder
+    is only sent once, unless a job dies in between sending it and
+    recording it.
+    """
+
+    __tablename__ = 'reminder_outbox'
+    outbox_id = Column(Integer, primary_key=True)
+    meeting_id = Column(
+        Integer,
+        ForeignKey(
+            'meetings.meeting_id', onupdate='cascade', ondelete='cascade'),
+        nullable=False)
+    reminder_offset = Column(String(10), nullable=False)
+    # Start, in UTC, of the occurrence of the meeting to remind
+    occurrence_start = Column(DateTime, nullable=False)
+    send_at = Column(DateTime, nullable=False)
+    # One of: pending, sent, failed, cancelled
+    status = Column(String(20), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt = Column(DateTime, nullable=False)
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    meeting = relationship("Meeting")
+
+    __table_args__ = (
+        UniqueConstraint(
+            'meeting_id', 'reminder_offset', 'occurrence_start',
+            name='uq_reminder_outbox_occurrence'),
+        Index('ix_reminder_outbox_status', 'status', 'next_attempt'),
+    )
+
+    def __repr__(self):
+        """ Representation of the ReminderOutbox object when printed.
+        """
+        return "<ReminderOutbox('%s', '%s', '%s', '%s')>" % (
+            self.meeting_id, self.reminder_offset, self.occurrence_start,
+            self.status)
+
+    @classmethod
+    def get_keys(cls, session, start_utc):
+        """ Return the set of the tuples (meeting_id, reminder_offset,
+        occurrence_start) of the reminders of the occurrences starting
+        after the provided datetime, in UTC.
+        """
+        query = session.query(
+            cls.meeting_id, cls.reminder_offset, cls.occurrence_start
+        ).filter(
+            cls.occurrence_start > start_utc
+        )
+        return set(tuple(row) for row in query.all())
+
+    @classmethod
+    def claim(cls, session, worker, now, lease, limit=100):
+        """ Claim, for the duration of the lease, the reminders due at the
+        provided time which are not claimed by another worker, and return
+        them.
+
+        The reminders are claimed with a single UPDATE checking that they
+        are still available, so two workers never claim the same reminder.
+
+        :arg session: the database session to use.
+        :arg worker: a string identifying the worker.
+        :arg now: the current datetime, in UTC.
+        :arg lease: a timedelta, the time the worker has to send the
+            reminders before they can be claimed by another worker.
+        :kwarg limit: the maximum number of reminders claimed.
+        """
+        available = and_(
+            (cls.status == 'pending'),
+            (cls.next_attempt <= now),
+            or_(
+                (cls.lease_expires == None),
+                (cls.lease_expires < now)))
+        ids = [
+            row.outbox_id
+            for row in session.query(cls.outbox_id).filter(
+                available
+            ).order_by(
+                cls.send_at
+            ).limit(limit).all()
+        ]
+        if not ids:
+            return []
+
+        token = '%s:%s' % (worker[:60], uuid.uuid4().hex)
+        session.query(cls).filter(
+            cls.outbox_id.in_(ids)
+        ).filter(
+            available
+        ).update(
+            {cls.lease_owner: token, cls.lease_expires: now + lease},
+            synchronize_session=False)
+        session.commit()
+
+        entries = session.query(cls).filter(
+            cls.lease_owner == token
+        ).order_by(
+            cls.send_at
+        ).all()
+        # Keep the token aside, lease_owner is reloaded from the database
+        # after each commit and might by then be another worker's
+        for entry in entries:
+            entry.lease_token = token
+        return entries
+
+    def _release(self, session, **values):
+        """ Update the reminder and release its lease, provided the lease
+        is still held by its worker. Returns whether it was.
+        """
+        values.update(lease_owner=None, lease_expires=None)
+        updated = session.query(ReminderOutbox).filter(
+            ReminderOutbox.outbox_id == self.outbox_id
+        ).filter(
+            ReminderOutbox.lease_owner == getattr(self, 'lease_token', None)
+        ).update(values, synchronize_session=False)
+        session.commit()
+        session.expire(self)
+        return updated == 1
+
+    def mark_sent(self, session, now):
+        """ Record that the reminder was sent. """
+        return self._release(session, status='sent', sent_at=now)
+
+    def mark_cancelled(self, session):
+        """ Record that the reminder is not to be sent, as its meeting
+        changed since it was added. """
+        return self._release(session, status='cancelled')
+
+    def mark_failed(self, session, now, error, retry_delay, max_attempts):
+        """ Record that the reminder could not be sent, it is then tried
+        again after a delay doubling at each attempt or, after
+        max_attempts attempts, marked as failed.
+
+        :arg session: the database session to use.
+        :arg now: the current datetime, in UTC.
+        :arg error: the error raised when sending the reminder.
+        :arg retry_delay: a timedelta, the delay before the first retry.
+        :arg max_attempts: the maximum number of attempts.
+        """
+        attempts = self.attempts + 1
+        status = 'pending'
+        if attempts >= max_attempts:
+            status = 'failed'
+        return self._release(
+            session,
+            status=status,
+            attempts=attempts,
+            next_attempt=now + retry_delay * 2 ** (attempts - 1),
+            last_error='%s' % error)
+
+
 if __name__ == '__main__':  # pragma: no cover
     import os
     import ConfigParser
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+pool - Configuration and statistics of the pools of connections to the
+        database.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+_log = logging.getLogger(__name__)
+
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool keeping track of the time spent waiting for a
+    connection. """
+
+    def __init__(self, *args, **kwargs):
+        """ Constructor instanciating the defaults values. """
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self._timings_lock = threading.Lock()
+        self.timings = dict(
+            checkouts=0, timeouts=0, wait_total=0.0, wait_max=0.0)
+
+    def connect(self):
+        """ Return a connection of the pool, see QueuePool.connect. """
+        start = time.time()
+        timeout = False
+        try:
+            return super(TimedQueuePool, self).connect()
+        except PoolTimeoutError:
+            timeout = True
+            raise
+        finally:
+            wait = time.time() - start
+            with self._timings_lock:
+                self.timings['checkouts'] += 1
+                self.timings['timeouts'] += timeout
+                self.timings['wait_total'] += wait
+                self.timings['wait_max'] = max(
+                    self.timings['wait_max'], wait)
+
+
+def get_engine_options(db_url, pool_size=None, max_overflow=None,
+                       pool_timeout=None):
+    """ Return the arguments of create_engine configuring the pool of
+    connections to the specified database.
+
+    SQLite relies on the default pools of SQLAlchemy, the sizes of the pool
+    are then ignored.
+    """
+    if make_url(db_url).get_backend_name() == 'sqlite':
+        return {}
+    options = dict(poolclass=TimedQueuePool)
+    if pool_size is not None:
+        options['pool_size'] = int(pool_size)
+    if max_overflow is not None:
+        options['max_overflow'] = int(max_overflow)
+    if pool_timeout is not None:
+        options['pool_timeout'] = int(pool_timeout)
+    return options
+
+
+def set_statement_timeout(engine, timeout):
+    """ Make the database cancel the statements of the connections of the
+    engine running for more than ``timeout`` seconds.
+
+    Only PostgreSQL and MySQL support it, the timeout is ignored with the
+    other databases.
+    """
+    milliseconds = int(float(timeout) * 1000)
+    if engine.dialect.name == 'postgresql':
+        statement = 'SET statement_timeout = %d' % milliseconds
+    elif engine.dialect.name == 'mysql':
+        statement = 'SET SESSION max_execution_time = %d' % milliseconds
+    else:
+        _log.info(
+            'Statement timeout not supported by %s', engine.dialect.name)
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_timeout(dbapi_connection, connection_record):
+        """ Set the timeout on every new connection. """
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+        # Do not let the rollback at the checkin undo the setting
+        dbapi_connection.commit()
+
+
+def get_pool_stats(session):
+    """ Return a dictionnary describing the pool of connections used by
+    the provided session, with the number of connections checked out and
+    the time spent waiting for one when the pool is a TimedQueuePool.
+    """
+    pool = session.get_bind().pool
+    output = {
+        'pool': pool.__class__.__name__,
+        'status': pool.status(),
+    }
+    if isinstance(pool, TimedQueuePool):
+        with pool._timings_lock:
+            output.update(pool.timings)
+        output.update(
+            size=pool.size(),
+            checkedout=pool.checkedout(),
+            overflow=pool.overflow(),
+            wait_avg=(
+                output['wait_total'] / output['checkouts']
+                if output['checkouts'] else 0.0),
+        )
+    return output
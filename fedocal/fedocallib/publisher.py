@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+"""
+publisher - Queue of the messages to publish on the message bus.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+The messages are put in a bounded in-process queue and published in
+batches by a background thread, so the web requests and the cron job
+never wait for the broker.
+
+When the broker cannot be reached, the messages are written to a spool
+(in memory or in a SQLite file surviving restarts) and the thread tries
+again, with an increasing delay, to publish them in order before the new
+ones. The messages of the spool are delivered at least once: a process
+stopped between publishing a message and removing it from the spool
+publishes it again.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import atexit
+import collections
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+_log = logging.getLogger(__name__)
+
+
+class BrokerUnavailable(Exception):
+    """ Exception raised by the function sending the messages when the
+    broker cannot be reached, the message is then spooled and sent again
+    later. """
+    pass
+
+
+class MemorySpool(object):
+    """ Spool keeping at most ``maxsize`` messages in memory, they are
+    lost when the process stops. """
+
+    def __init__(self, maxsize=10000):
+        """ Constructor instanciating the defaults values.
+
+        :kwarg maxsize: the maximum number of messages kept, the oldest
+            ones are dropped first.
+        """
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def add(self, items):
+        """ Add the provided (topic, msg, created) tuples to the spool. """
+        with self._lock:
+            for item in items:
+                self._next += 1
+                self._data[self._next] = item
+            while len(self._data) > self.maxsize:
+                _log.warning(
+                    'Spool full, dropping a message: %s',
+                    self._data.popitem(last=False)[1][0])
+
+    def peek(self, count):
+        """ Return the ``count`` oldest messages of the spool as
+        (identifier, topic, msg, created) tuples. """
+        with self._lock:
+            return [
+                (key,) + tuple(item)
+                for key, item in list(self._data.items())[:count]
+            ]
+
+    def remove(self, identifiers):
+        """ Remove the messages with the provided identifiers. """
+        with self._lock:
+            for key in identifiers:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteSpool(object):
+    """ Spool stored in a SQLite file, shared by all the processes using
+    the same file. """
+
+    def __init__(self, path):
+        """ Constructor instanciating the defaults values.
+
+        :arg path: the path to the SQLite file, created if needed.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS messages ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'topic TEXT NOT NULL, '
+                'body TEXT NOT NULL, '
+                'created REAL NOT NULL)')
+
+    def _connect(self):
+        """ Return a new connection to the SQLite file. """
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, items):
+        """ Add the provided (topic, msg, created) tuples to the spool. """
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT INTO messages (topic, body, created) '
+                        'VALUES (?, ?, ?)',
+                        [
+                            (topic, json.dumps(msg), created)
+                            for topic, msg, created in items
+                        ])
+            finally:
+                conn.close()
+
+    def peek(self, count):
+        """ Return the ``count`` oldest messages of the spool as
+        (identifier, topic, msg, created) tuples. """
+        with self._lock:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    'SELECT id, topic, body, created FROM messages '
+                    'ORDER BY id LIMIT ?', (count,)).fetchall()
+            finally:
+                conn.close()
+        return [
+            (key, topic, json.loads(body), created)
+            for key, topic, body, created in rows
+        ]
+
+    def remove(self, identifiers):
+        """ Remove the messages with the provided identifiers. """
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        'DELETE FROM messages WHERE id = ?',
+                        [(key,) for key in identifiers])
+            finally:
+                conn.close()
+
+    def __len__(self):
+        with self._lock:
+            conn = self._connect()
+            try:
+                return conn.execute(
+                    'SELECT COUNT(*) FROM messages').fetchone()[0]
+            finally:
+                conn.close()
+
+
+class Publisher(object):
+    """ Publish the messages from a background thread, see the module
+    documentation. """
+
+    def __init__(self, send, spool=None, maxsize=1000, batch_size=50,
+                 retry_delay=5, max_retry_delay=300):
+        """ Constructor instanciating the defaults values.
+
+        :arg send: the function publishing a message, called with the
+            topic and the content of the message. It raises
+            BrokerUnavailable if the broker cannot be reached, any other
+            exception means the message is invalid and it is dropped.
+        :kwarg spool: the spool in which the messages are kept while the
+            broker is unavailable, defaults to a MemorySpool.
+        :kwarg maxsize: the maximum number of messages in the queue, the
+            messages published when it is full go to the spool.
+        :kwarg batch_size: the maximum number of messages taken at once
+            from the queue or the spool.
+        :kwarg retry_delay: the number of seconds to wait before trying
+            to reach the broker again, doubled at each failure.
+        :kwarg max_retry_delay: the maximum number of seconds to wait
+            before trying to reach the broker again.
+        """
+        self.send = send
+        self.spool = spool if spool is not None else MemorySpool()
+        self.maxsize = maxsize
+        self.batch_size = max(1, batch_size)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._queue = queue.Queue(maxsize)
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._delay = retry_delay
+        self._retry_at = 0
+        self._stats = dict(
+            published=0, failed=0, spooled=0, replayed=0, batches=0)
+        self._latency = dict(total=0.0, max=0.0, last=0.0, send=0.0)
+        atexit.register(self.close)
+
+    def _start(self):
+        """ Start the background thread if it is not running in this
+        process, the thread does not survive a fork. """
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = queue.Queue(self.maxsize)
+                self._pending = 0
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='fedocal-publisher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def publish(self, topic, msg):
+        """ Queue the provided message, it is written to the spool if the
+        queue is full. This never blocks on the broker. """
+        if self._closed:
+            self.spool.add([(topic, msg, _now())])
+            return
+        self._start()
+        with self._cond:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((topic, msg, _now()))
+        except queue.Full:
+            _log.warning('Publishing queue full, spooling: %s', topic)
+            self._spool([(topic, msg, _now())])
+            self._done(1)
+
+    def flush(self, timeout=None):
+        """ Wait until all the queued messages are either published or
+        spooled, return True if it is the case within ``timeout``
+        seconds. """
+        if self._spool_size():
+            self._start()
+        end = None if timeout is None else _now() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if end is None else end - _now()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=5):
+        """ Stop the background thread, the messages still in the queue
+        are written to the spool. """
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if items:
+            self._spool(items)
+            self._done(len(items))
+
+    def stats(self):
+        """ Return a dictionnary with the number of messages in the queue
+        and the spool and the publishing statistics, the latencies are
+        the number of seconds between queuing a message and publishing
+        it. """
+        output = dict(self._stats)
+        output.update(
+            queue=self._queue.qsize(),
+            spool=self._spool_size(),
+            latency_last=self._latency['last'],
+            latency_max=self._latency['max'],
+            latency_avg=(
+                self._latency['total'] / self._stats['published']
+                if self._stats['published'] else 0.0),
+            send_avg=(
+                self._latency['send'] / self._stats['published']
+                if self._stats['published'] else 0.0),
+        )
+        return output
+
+    def _run(self):
+        """ Main loop of the background thread. """
+        while not self._closed:
+            spooled = self._spool_size()
+            if spooled:
+                timeout = min(1, max(0.01, self._retry_at - _now()))
+            else:
+                timeout = 1
+            batch = self._next_batch(timeout)
+            try:
+                if spooled or (batch and self._retry_at > _now()):
+                    # Keep the order: new messages go after the spooled
+                    # ones
+                    if batch:
+                        self._spool(batch)
+                        self._done(len(batch))
+                        batch = []
+                    if self._retry_at <= _now():
+                        self._replay()
+                elif batch:
+                    self._publish_batch(batch)
+            except Exception:  # pragma: no cover
+                _log.exception('Error in the publishing thread')
+                self._done(len(batch))
+
+    def _next_batch(self, timeout):
+        """ Return up to batch_size messages from the queue, waiting at
+        most ``timeout`` seconds for the first one. """
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _publish_batch(self, batch):
+        """ Publish the provided messages, spooling them from the first
+        one which could not reach the broker. """
+        self._stats['batches'] += 1
+        for cnt, (topic, msg, created) in enumerate(batch):
+            try:
+                self._send(topic, msg, created)
+            except BrokerUnavailable as err:
+                _log.warning('Broker unavailable, spooling: %s', err)
+                self._spool(batch[cnt:])
+                self._done(len(batch) - cnt)
+                self._backoff()
+                return
+            self._done(1)
+
+    def _replay(self):
+        """ Publish the messages of the spool, oldest first, until it is
+        empty or the broker cannot be reached. """
+        while True:
+            items = self.spool.peek(self.batch_size)
+            if not items:
+                self._delay = self.retry_delay
+                return
+            self._stats['batches'] += 1
+            sent = []
+            try:
+                for key, topic, msg, created in items:
+                    self._send(topic, msg, created)
+                    sent.append(key)
+            except BrokerUnavailable as err:
+                _log.warning('Broker still unavailable: %s', err)
+                self._backoff()
+                return
+            finally:
+                self.spool.remove(sent)
+                self._stats['replayed'] += len(sent)
+
+    def _send(self, topic, msg, created):
+        """ Publish a message and update the statistics, the invalid
+        messages are logged and dropped. """
+        start = _now()
+        try:
+            self.send(topic, msg)
+        except BrokerUnavailable:
+            raise
+        except Exception:
+            _log.exception('Could not publish a message for %s', topic)
+            self._stats['failed'] += 1
+            return
+        end = _now()
+        self._stats['published'] += 1
+        latency = end - created
+        self._latency['last'] = latency
+        self._latency['total'] += latency
+        self._latency['max'] = max(self._latency['max'], latency)
+        self._latency['send'] += end - start
+
+    def _spool(self, items):
+        """ Write the provided (topic, msg, created) tuples to the spool.
+        """
+        self.spool.add(items)
+        self._stats['spooled'] += len(items)
+
+    def _spool_size(self):
+        """ Return the number of messages in the spool. """
+        try:
+            return len(self.spool)
+        except sqlite3.Error as err:  # pragma: no cover
+            _log.warning('Could not read the spool: %s', err)
+            return 0
+
+    def _backoff(self):
+        """ Wait longer before the next attempt to reach the broker. """
+        self._retry_at = _now() + self._delay
+        self._delay = min(self._delay * 2, self.max_retry_delay)
+
+    def _done(self, count):
+        """ Mark ``count`` queued messages as published or spooled. """
+        with self._cond:
+            self._pending = max(0, self._pending - count)
+            self._cond.notify_all()
+
+
+def _now():
+    """ Return the current time in seconds since the epoch. """
+    return time.time()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+recurrence - Closed-form computation of the occurrences of a recursive
+             meeting.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+A recursive meeting occurs every ``recursion_frequency`` days starting at
+its ``meeting_date`` and until its ``recursion_ends`` (included). The
+occurrence number ``n`` thus takes place at:
+
+    meeting_date + n * recursion_frequency
+
+The functions below compute the indexes of the occurrences falling in a
+given window directly, so that their cost only depends on the size of the
+window and not on how long ago the series started.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+from datetime import timedelta
+
+
+def first_occurrence_index(meeting_date, frequency, start_date):
+    """ Return the index of the first occurrence happening on or after
+    the specified start_date.
+
+    :arg meeting_date: the date of the first occurrence of the series.
+    :arg frequency: the number of days in between two occurrences.
+    :arg start_date: the date from which we look for occurrences.
+    :return the index (starting at 0) of the first occurrence whose date
+        is greater or equal to start_date, ie:
+        ``ceil((start_date - meeting_date) / frequency)``.
+    """
+    delta = (start_date - meeting_date).days
+    if delta <= 0:
+        return 0
+    return -(-delta // frequency)
+
+
+def last_occurrence_index(meeting_date, frequency, end_date):
+    """ Return the index of the last occurrence happening on or before
+    the specified end_date.
+
+    :arg meeting_date: the date of the first occurrence of the series.
+    :arg frequency: the number of days in between two occurrences.
+    :arg end_date: the date until which we look for occurrences.
+    :return the index of the last occurrence whose date is lower or equal
+        to end_date, ie: ``floor((end_date - meeting_date) / frequency)``.
+        This index is negative if the series starts after end_date.
+    """
+    return (end_date - meeting_date).days // frequency
+
+
+def occurrence_range(meeting, start_date=None, end_date=None):
+    """ Return the range of the indexes of the occurrences of the provided
+    recursive meeting happening in between the two specified dates
+    (included).
+
+    :arg meeting: a Meeting object with a recursion_frequency and a
+        recursion_ends set.
+    :kwarg start_date: the date from which to consider the occurrences,
+        defaults to the first occurrence of the meeting.
+    :kwarg end_date: the date until which to consider the occurrences,
+        defaults to the end of the recursion.
+    """
+    frequency = meeting.recursion_frequency
+    first = 0
+    if start_date:
+        first = first_occurrence_index(
+            meeting.meeting_date, frequency, start_date)
+    last = last_occurrence_index(
+        meeting.meeting_date, frequency, meeting.recursion_ends)
+    if end_date and end_date < meeting.recursion_ends:
+        last = last_occurrence_index(
+            meeting.meeting_date, frequency, end_date)
+    return range(first, last + 1)
+
+
+def iter_occurrences(meeting, start_date=None, end_date=None):
+    """ Yield for each occurrence of the provided recursive meeting
+    happening in between the two specified dates (included) a tuple
+    ``(index, meeting_date, meeting_date_end)``.
+
+    :arg meeting: a Meeting object with a recursion_frequency and a
+        recursion_ends set.
+    :kwarg start_date: the date from which to consider the occurrences.
+    :kwarg end_date: the date until which to consider the occurrences.
+    """
+    for cnt in occurrence_range(meeting, start_date, end_date):
+        delta = timedelta(days=meeting.recursion_frequency * cnt)
+        yield (
+            cnt,
+            meeting.meeting_date + delta,
+            meeting.meeting_date_end + delta,
+        )
+
+
+def nearest_occurrence_index(meeting, date_limit):
+    """ Return the index of the first occurrence of the provided recursive
+    meeting happening on or after date_limit, bounded by the last
+    occurrence of the series.
+
+    :arg meeting: a Meeting object with a recursion_frequency and a
+        recursion_ends set.
+    :arg date_limit: the date from which to look for the next occurrence.
+    """
+    frequency = meeting.recursion_frequency
+    cnt = min(
+        first_occurrence_index(meeting.meeting_date, frequency, date_limit),
+        last_occurrence_index(
+            meeting.meeting_date, frequency, meeting.recursion_ends)
+    )
+    return max(cnt, 0)
+
+
+def is_occurrence(meeting, day):
+    """ Return whether the provided recursive meeting has an occurrence
+    starting on the specified day.
+
+    :arg meeting: a Meeting object with a recursion_frequency and a
+        recursion_ends set.
+    :arg day: the date to check.
+    """
+    if day < meeting.meeting_date or day > meeting.recursion_ends:
+        return False
+    return (day - meeting.meeting_date).days \
+        % meeting.recursion_frequency == 0
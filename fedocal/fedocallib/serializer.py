@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+serializer - Serialization of the meetings to JSON for the API.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+
+The occurrences of a recursive meeting only differ by their dates and
+times, so the MeetingSerializer computes the other fields (including the
+sorted list of the managers) once per meeting and the dates and times
+once per value.
+
+The JSON is produced by orjson when it is installed, by the json module
+of the standard library otherwise, and iterencode yields the list of the
+meetings by chunks so that large responses are sent while they are being
+serialized.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_log = logging.getLogger(__name__)
+
+# Number of items serialized in each chunk yielded by iterencode
+CHUNK_SIZE = 200
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def configure(config):
+    """ Select the JSON backend according to the JSON_BACKEND key of the
+    provided configuration: 'orjson', 'json' or 'auto' (the default) to
+    use orjson when it is installed.
+    """
+    global BACKEND
+    backend = config.get('JSON_BACKEND') or 'auto'
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'json'
+    elif backend == 'orjson' and orjson is None:  # pragma: no cover
+        _log.warning('orjson is not installed, using json instead')
+        backend = 'json'
+    elif backend not in ('orjson', 'json'):
+        raise ValueError('Invalid JSON_BACKEND: %s' % backend)
+    BACKEND = backend
+
+
+def dumps(obj):
+    """ Return the JSON representation of the provided object as a
+    string, using the configured backend. """
+    if BACKEND == 'orjson':
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
+
+
+def iterencode(output, key, items, chunk_size=CHUNK_SIZE):
+    """ Yield the JSON representation of the provided dictionnary in which
+    ``key`` is set to the list of the provided items, serializing
+    ``chunk_size`` items at a time.
+
+    :arg output: the dictionnary holding the other keys of the object.
+    :arg key: the key of the list of items, added last to the object.
+    :arg items: an iterable of the objects to put in the list.
+    :kwarg chunk_size: the number of items serialized in each chunk.
+    """
+    head = dumps(output)[:-1]
+    if output:
+        head += ', '
+    yield '%s%s: [' % (head, dumps(key))
+
+    separator = ''
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield separator + dumps(chunk)[1:-1]
+            separator = ', '
+            chunk = []
+    if chunk:
+        yield separator + dumps(chunk)[1:-1]
+    yield ']}'
+
+
+def format_date(value):
+    """ Return the provided date as YYYY-MM-DD. """
+    return value.isoformat()
+
+
+def format_time(value):
+    """ Return the provided time as HH:MM:SS. """
+    return '%02d:%02d:%02d' % (value.hour, value.minute, value.second)
+
+
+class MeetingSerializer(object):
+    """ Return the JSON representation (as a dictionnary) of the meetings,
+    their occurrences or their localized versions, see the module
+    documentation.
+
+    The cache is never invalidated, a serializer is meant to be used for a
+    single response.
+    """
+
+    def __init__(self, recursion=False):
+        """ Constructor instanciating the defaults values.
+
+        :kwarg recursion: whether to add to the meetings the description
+            of their recursion, see Meeting.recursion_to_json.
+        """
+        self.recursion = recursion
+        self._meetings = {}
+        self._dates = {}
+        self._times = {}
+
+    def __call__(self, meeting):
+        """ Return the JSON representation of the provided meeting. """
+        shared = self._meetings.get(meeting.meeting_id)
+        if shared is None:
+            shared = (
+                meeting.meeting_name,
+                meeting.meeting_manager,
+                meeting.meeting_timezone,
+                meeting.meeting_information,
+                meeting.meeting_location,
+                meeting.calendar_name,
+                meeting.recursion_to_json() if self.recursion else None,
+            )
+            if meeting.meeting_id is not None:
+                self._meetings[meeting.meeting_id] = shared
+
+        output = dict(
+            meeting_id=meeting.meeting_id,
+            meeting_name=shared[0],
+            meeting_manager=shared[1],
+            meeting_date=self._date(meeting.meeting_date),
+            meeting_date_end=self._date(meeting.meeting_date_end),
+            meeting_time_start=self._time(meeting.meeting_time_start),
+            meeting_time_stop=self._time(meeting.meeting_time_stop),
+            meeting_timezone=shared[2],
+            meeting_information=shared[3],
+            meeting_location=shared[4],
+            calendar_name=shared[5],
+        )
+        if self.recursion:
+            output['recursion'] = shared[6]
+        return output
+
+    def _date(self, value):
+        """ Return the formatted date, from the cache if possible. """
+        output = self._dates.get(value)
+        if output is None:
+            output = self._dates[value] = format_date(value)
+        return output
+
+    def _time(self, value):
+        """ Return the formatted time, from the cache if possible. """
+        output = self._times.get(value)
+        if output is None:
+            output = self._times[value] = format_time(value)
+        return output
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+timezones - Cached access to the timezone objects.
+
+Copyright (C) 2012-2014 Pierre-Yves Chibon
+Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or (at
+your option) any later version.
+See http://www.gnu.org/copyleft/gpl.html  for the full text of the
+license.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+from datetime import datetime
+from functools import lru_cache
+
+import pytz
+
+
+@lru_cache(maxsize=256)
+def get_timezone(tzone):
+    """ Return the pytz timezone object corresponding to the provided
+    timezone name.
+
+    The result is cached as this is called for every meeting displayed.
+
+    :arg tzone: the name of the timezone (ie: 'Europe/Paris').
+    :raises pytz.UnknownTimeZoneError: if the timezone is not known.
+    """
+    return pytz.timezone(tzone)
+
+
+def localize(timeobj, tzone):
+    """ Attach the provided timezone to the provided naive datetime,
+    without converting it.
+
+    :arg timeobj: a naive datetime object.
+    :arg tzone: the name of the timezone in which timeobj is expressed.
+    """
+    return get_timezone(tzone).localize(timeobj)
+
+
+@lru_cache(maxsize=1)
+def get_timezone_lookup():
+    """ Return a dictionnary associating the abbreviated name and the
+    offset of the common timezones (ie: ('CEST', 2:00:00)) to the list of
+    the names of the timezones using them.
+
+    Both the winter and the summer names of the timezones are included,
+    the dictionnary is built once per process.
+    """
+    timezone_lookup = dict()
+    for tz in pytz.common_timezones:
+        timezone = pytz.timezone(tz)
+        for month in (1, 7):
+            value = timezone.localize(datetime(2014, month, 1))
+            key = (value.tzname(), value.utcoffset())
+            timezone_lookup.setdefault(key, [])
+            if tz not in timezone_lookup[key]:
+                timezone_lookup[key].append(tz)
+    return timezone_lookup
@@ -30,7 +30,7 @@ class Week(object):
     """
 
     def __init__(self, session, calendar=None, start_date=None,
-                 location=None):
+                 location=None, profile=None):
         """ Constructor, instanciate a week object for a given calendar.
 
         One of calendar or location should be specified!
@@ -38,6 +38,8 @@ class Week(object):
         :kwarg calendar, the name of the calendar to use.
         :kwarg start_date, the starting date of the week.
         :kwarg location, the name of the location of the meetings.
+        :kwarg profile, the profile of the meetings to load, see
+            Meeting.load_options.
 
         """
         if not calendar and not location:
@@ -47,6 +49,7 @@ class Week(object):
         self.session = session
         self.calendar = calendar
         self.location = location
+        self.profile = profile
         self.start_date = start_date
         self.stop_date = start_date + timedelta(days=6)
         self.meetings = []
@@ -60,27 +63,28 @@ class Week(object):
         if self.calendar:
             self.meetings = Meeting.get_by_date(
                 self.session, self.calendar,
-                self.start_date, self.stop_date, full_day=False)
+                self.start_date, self.stop_date, full_day=False,
+                profile=self.profile)
 
             meetings = Meeting.get_active_regular_meeting(
                 self.session, self.calendar,
-                self.start_date, self.stop_date, full_day=False)
+                self.start_date, self.stop_date, full_day=False,
+                profile=self.profile)
         else:
             self.meetings = Meeting.get_by_date_at_location(
                 self.session, self.location,
-                self.start_date, self.stop_date, full_day=False)
+                self.start_date, self.stop_date, full_day=False,
+                profile=self.profile)
 
             meetings = Meeting.get_active_regular_meeting_at_location(
                 self.session, self.location,
-                self.start_date, self.stop_date, full_day=False)
+                self.start_date, self.stop_date, full_day=False,
+                profile=self.profile)
 
+        # The expansion below only keeps the occurrences of this week
         for meeting in meetings:
-            for delta in range(0, 7):
-                day = self.start_date + timedelta(days=delta)
-                if ((meeting.meeting_date - day).days %
-                        meeting.recursion_frequency) == 0:
-                    if meeting not in self.meetings:
-                        self.meetings.append(meeting)
+            if meeting not in self.meetings:
+                self.meetings.append(meeting)
         # Expand the regular meetings so that they appear as meeting
         self.meetings = Meeting.expand_regular_meetings(
             self.meetings,
@@ -95,27 +99,28 @@ class Week(object):
         if self.calendar:
             self.full_day_meetings = Meeting.get_by_date(
                 self.session, self.calendar, self.start_date,
-                self.stop_date, full_day=True)
+                self.stop_date, full_day=True,
+                profile=self.profile)
 
             meetings = Meeting.get_active_regular_meeting(
                 self.session, self.calendar,
-                self.start_date, self.stop_date, full_day=True)
+                self.start_date, self.stop_date, full_day=True,
+                profile=self.profile)
         else:
             self.full_day_meetings = Meeting.get_by_date_at_location(
                 self.session, self.location, self.start_date,
-                self.stop_date, full_day=True)
+                self.stop_date, full_day=True,
+                profile=self.profile)
 
             meetings = Meeting.get_active_regular_meeting_at_location(
                 self.session, self.location,
-                self.start_date, self.stop_date, full_day=True)
+                self.start_date, self.stop_date, full_day=True,
+                profile=self.profile)
 
+        # The expansion below only keeps the occurrences of this week
         for meeting in meetings:
-            for delta in range(0, 7):
-                day = self.start_date + timedelta(days=delta)
-                if ((meeting.meeting_date - day).days %
-                        meeting.recursion_frequency) == 0:
-                    if meeting not in self.full_day_meetings:
-                        self.full_day_meetings.append(meeting)
+            if meeting not in self.full_day_meetings:
+                self.full_day_meetings.append(meeting)
         # Expand the regular meetings so that they appear as meeting
         self.full_day_meetings = Meeting.expand_regular_meetings(
             self.full_day_meetings, end_date=self.stop_date,
@@ -28,10 +28,14 @@ each meeting that asked for it.
 """
 from __future__ import unicode_literals, absolute_import
 
+import os
 import smtplib
+import socket
+import time
 import warnings
 import logging
 
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 
 import fedocal
@@ -40,30 +44,85 @@ import fedocal.fedocallib.fedmsgshim as fedmsg
 
 _log = logging.getLogger(__name__)
 
-def fedmsg_publish(meeting, meeting_id):
-    """ Publish the meeting.reminder messages on fedora-messaging.
+# Duration, in seconds, of the steps of the last run of send_reminder
+LAST_RUN = {}
+
+
+class Mailer(object):
+    """ Send all the emails of a run of the cron job over a single
+    connection to the SMTP server, opened with the first email and opened
+    again if the server closes it.
+    """
+
+    def __init__(self, server):
+        """ Constructor instanciating the defaults values.
+
+        :arg server: the address of the SMTP server.
+        """
+        self.server = server
+        self.smtp = None
+        self.connections = 0
+
+    def sendmail(self, from_email, to_emails, msg):
+        """ Send the provided email, see smtplib.SMTP.sendmail. """
+        for attempt in range(2):
+            if self.smtp is None:
+                self.smtp = smtplib.SMTP(self.server)
+                self.connections += 1
+            try:
+                return self.smtp.sendmail(from_email, to_emails, msg)
+            except smtplib.SMTPServerDisconnected:
+                self.smtp = None
+                if attempt:
+                    raise
+
+    def quit(self):
+        """ Close the connection to the SMTP server, if one was opened. """
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except smtplib.SMTPException as err:
+                _log.warning('Could not close the SMTP connection: %s', err)
+            self.smtp = None
+
+
+def get_reminder_message(meeting, meeting_id):
+    """ Return the meeting.reminder message of the provided meeting.
     :arg meeting: a Meeting object from fedocallib.model
     :arg meeting_id: an int representing the meeting identifier in the
         database
     """
-    _log.info('Publishing a message for meeting: %s', meeting)
-    print('Publishing a message for meeting: %s' % meeting)
-
     meeting_dict = meeting.to_json()
     meeting_dict['meeting_id'] = meeting_id
 
-    message = dict(
+    return dict(
         meeting=meeting_dict,
         calendar=meeting.calendar.to_json()
     )
-    fedmsg.publish(topic='meeting.reminder', msg=message)
 
 
-def send_reminder_meeting(meeting, meeting_id):
+def publish_messages(messages):
+    """ Publish the provided meeting.reminder messages on fedora-messaging.
+
+    The messages are queued and published from the background thread of
+    fedmsgshim, unless PUBLISH_QUEUE_SIZE is 0.
+
+    :arg messages: a list of messages as returned by get_reminder_message.
+    """
+    for message in messages:
+        try:
+            fedmsg.publish(topic='meeting.reminder', msg=message)
+        except Exception as err:
+            _log.error('Could not publish a reminder: %s', err)
+
+
+def send_reminder_meeting(meeting, meeting_id, smtp=None):
     """ This function sends the actual reminder of a given meeting.
     :arg meeting: a Meeting object from fedocallib.model
     :arg meeting_id: an int representing the meeting identifier in the
         database
+    :kwarg smtp: the connection to the SMTP server to use, a new one is
+        opened and closed if None
     """
     if not meeting.reminder_id:
         return
@@ -112,32 +171,118 @@ Please note:
 
     # Send the message via our own SMTP server, but don't include the
     # envelope header.
-    smtp = smtplib.SMTP(fedocal.APP.config['SMTP_SERVER'])
+    own_smtp = smtp is None
+    if own_smtp:
+        smtp = smtplib.SMTP(fedocal.APP.config['SMTP_SERVER'])
     smtp.sendmail(
         from_email,
         meeting.reminder.reminder_to.split(','),
         msg.as_string())
-    smtp.quit()
+    if own_smtp:
+        smtp.quit()
     return msg
 
 
-def send_reminder():
+def send_reminder(worker=None):
     """ Retrieve all the meeting for which we should send a reminder and
     do it.
+
+    The reminders of the coming days are first added to the outbox, then
+    the ones due are claimed and sent. Several jobs may run at the same
+    time, each reminder is only claimed by one of them. The reminders
+    which could not be sent are tried again by the next runs.
+
+    The emails are all sent over the same connection to the SMTP server
+    and the messages are then published in parallel. The duration of each
+    step is logged and kept in LAST_RUN.
+
+    :kwarg worker: a string identifying this job, defaults to the host
+        name and the process identifier.
     """
-    db_url = fedocal.APP.config['DB_URL']
-    session = fedocallib.create_session(db_url)
-    meetings = fedocallib.retrieve_meeting_to_remind(
-        session, offset=int(fedocal.APP.config['CRON_FREQUENCY']))
+    start = time.time()
+    config = fedocal.APP.config
+    worker = worker or '%s:%s' % (socket.gethostname(), os.getpid())
+    db_url = config['DB_URL']
+    session = fedocallib.create_session(
+        db_url, **fedocallib.get_session_options(config))
+    now = datetime.utcnow()
+    added = fedocallib.fill_reminder_outbox(
+        session, now,
+        horizon=timedelta(days=int(config.get('REMINDER_HORIZON', 8))),
+        catchup=timedelta(hours=int(config.get('REMINDER_CATCHUP', 24))))
+    selected = time.time()
+
+    lease = timedelta(seconds=int(config.get('REMINDER_LEASE', 300)))
+    retry_delay = timedelta(
+        seconds=int(config.get('REMINDER_RETRY_DELAY', 300)))
+    max_attempts = int(config.get('REMINDER_MAX_ATTEMPTS', 5))
 
     msgs = []
-    for meeting in meetings:
-        meeting_id = meeting.meeting_id
-        meeting = fedocallib.update_date_rec_meeting(meeting, action='next')
-        _log.info("Processing meeting: %s", meeting)
-        print("Processing meeting: %s" % meeting)
-        msgs.append(send_reminder_meeting(meeting, meeting_id))
-        fedmsg_publish(meeting, meeting_id)
+    messages = []
+    counts = dict(sent=0, failed=0, cancelled=0)
+    mailer = Mailer(config['SMTP_SERVER'])
+    try:
+        entries = fedocallib.ReminderOutbox.claim(
+            session, worker, now, lease)
+        while entries:
+            for entry in entries:
+                meeting_id = entry.meeting_id
+                # Whatever goes wrong with a reminder, it is marked as
+                # failed so it does not block the following ones
+                try:
+                    meeting = fedocallib.get_outbox_meeting(entry)
+                    if meeting is None:
+                        _log.info(
+                            "Meeting changed, not reminding: %s", entry)
+                        entry.mark_cancelled(session)
+                        counts['cancelled'] += 1
+                        continue
+                    _log.info("Processing meeting: %s", meeting)
+                    print("Processing meeting: %s" % meeting)
+                    msg = send_reminder_meeting(
+                        meeting, meeting_id, smtp=mailer)
+                    message = get_reminder_message(meeting, meeting_id)
+                except Exception as err:
+                    _log.exception(
+                        "Could not send the reminder: %s", entry)
+                    session.rollback()
+                    entry.mark_failed(
+                        session, datetime.utcnow(), err, retry_delay,
+                        max_attempts)
+                    counts['failed'] += 1
+                    continue
+                messages.append(message)
+                entry.mark_sent(session, datetime.utcnow())
+                msgs.append(msg)
+                counts['sent'] += 1
+            entries = fedocallib.ReminderOutbox.claim(
+                session, worker, now, lease)
+    finally:
+        mailer.quit()
+    sent = time.time()
+
+    publish_messages(messages)
+    # The queued messages must be published or spooled before we exit
+    if not fedmsg.flush(timeout=60):
+        _log.warning('Some messages are still queued: %s', fedmsg.stats())
+    published = time.time()
+
+    LAST_RUN.clear()
+    LAST_RUN.update(counts)
+    LAST_RUN.update(
+        added=added,
+        meetings=len(msgs),
+        smtp_connections=mailer.connections,
+        select=selected - start,
+        emails=sent - selected,
+        publish=published - sent,
+        total=published - start,
+    )
+    _log.info(
+        'Reminded %(meetings)s meetings in %(total).3fs (select: '
+        '%(select).3fs, emails: %(emails).3fs, publish: %(publish).3fs), '
+        '%(failed)s failed, %(cancelled)s cancelled, %(added)s added to '
+        'the outbox', LAST_RUN)
 
     return msgs
 
@@ -0,0 +1,239 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+ (c) 2012 - Copyright Pierre-Yves Chibon
+ Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+ Distributed under License GPLv3 or later
+ You can find a copy of this license on the website
+ http://www.gnu.org/licenses/gpl.html
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+ MA 02110-1301, USA.
+
+ fedocal.cache test script
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+from __future__ import unicode_literals, absolute_import, print_function
+
+import json
+import unittest
+import sys
+import os
+
+from datetime import time
+from datetime import timedelta
+
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import fedocal.fedocallib as fedocallib
+from fedocal.fedocallib import cache
+from fedocal.fedocallib import model
+from tests import Modeltests, TODAY, FakeUser
+
+
+class Cachetests(unittest.TestCase):
+    """ Cache tests. """
+
+    def tearDown(self):
+        """ Disable the cache again. """
+        cache.set_backend(cache.NullCache())
+
+    def test_memory_cache(self):
+        """ Test the MemoryCache backend. """
+        backend = cache.MemoryCache(maxsize=2, ttl=10)
+        self.assertEqual(backend.get('a'), None)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        self.assertEqual(backend.get('a'), 1)
+        # 'b' is the least recently used entry, it is evicted
+        backend.set('c', 3)
+        self.assertEqual(backend.get('b'), None)
+        self.assertEqual(backend.get('c'), 3)
+        backend.delete('c')
+        self.assertEqual(backend.get('c'), None)
+        self.assertEqual(
+            backend.stats(), {'backend': 'MemoryCache', 'size': 1})
+
+        # The entries expire
+        with patch('fedocal.fedocallib.cache._now') as now:
+            now.return_value = cache.time.time() + 11
+            self.assertEqual(backend.get('a'), None)
+
+    def test_shared_cache(self):
+        """ Test the SharedCache backend using a MemoryCache as client. """
+        client = cache.MemoryCache()
+        backend = cache.SharedCache(client, prefix='test')
+        backend.set('a', 1)
+        self.assertEqual(client.get('test:a'), 1)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertEqual(backend.get('b'), None)
+        backend.delete('a')
+        self.assertEqual(backend.get('a'), None)
+        self.assertEqual(backend.stats(), {'backend': 'SharedCache'})
+
+    def test_configure(self):
+        """ Test the configure function. """
+        cache.configure({})
+        self.assertEqual(type(cache.get_backend()), cache.NullCache)
+        cache.configure({'CACHE_BACKEND': 'memory', 'CACHE_SIZE': 10})
+        self.assertEqual(type(cache.get_backend()), cache.MemoryCache)
+        self.assertEqual(cache.get_backend().maxsize, 10)
+        self.assertRaises(
+            ValueError, cache.configure, {'CACHE_BACKEND': 'foo'})
+
+    def test_get_or_create(self):
+        """ Test the get_or_create function. """
+        calls = []
+
+        def _creator():
+            calls.append(1)
+            return len(calls)
+
+        cal = model.Calendar('cal', 'contact', 'description')
+        cal.calendar_generation = 0
+        cal2 = model.Calendar('cal2', 'contact', 'description')
+        cal2.calendar_generation = 0
+
+        # Disabled cache
+        self.assertEqual(cache.get_or_create(cal, 'key', _creator), 1)
+        self.assertEqual(cache.get_or_create(cal, 'key', _creator), 2)
+        self.assertEqual(
+            cache.stats(), {'backend': 'NullCache', 'hits': 0, 'misses': 2})
+
+        cache.set_backend(cache.SharedCache(cache.MemoryCache()))
+        self.assertEqual(cache.get_or_create(cal, 'key', _creator), 3)
+        self.assertEqual(cache.get_or_create(cal, 'key', _creator), 3)
+        self.assertEqual(cache.get_or_create(cal2, 'key', _creator), 4)
+        self.assertEqual(
+            cache.stats(),
+            {'backend': 'SharedCache', 'hits': 1, 'misses': 2})
+
+        # A new generation of the calendar invalidates its entries
+        cal.calendar_generation = 1
+        self.assertEqual(cache.get_or_create(cal, 'key', _creator), 5)
+        self.assertEqual(cache.get_or_create(cal2, 'key', _creator), 4)
+
+
+class CacheFedocallibtests(Modeltests):
+    """ Tests of the cached views of the calendars. """
+
+    def setUp(self):
+        """ Set up the database and enable the cache. """
+        super(CacheFedocallibtests, self).setUp()
+        cache.set_backend(cache.MemoryCache())
+        from .test_meeting import Meetingtests
+        meeting = Meetingtests('test_init_meeting')
+        meeting.session = self.session
+        meeting.test_init_meeting()
+
+    def tearDown(self):
+        """ Disable the cache again. """
+        cache.set_backend(cache.NullCache())
+        super(CacheFedocallibtests, self).tearDown()
+
+    def test_get_week_grid(self):
+        """ Test the get_week_grid function is invalidated when a meeting
+        of the calendar changes. """
+        calendarobj = model.Calendar.by_id(self.session, 'test_calendar')
+        week_start = fedocallib.get_start_week(
+            TODAY.year, TODAY.month, TODAY.day)
+
+        def _names():
+            meetings, _ = fedocallib.get_week_grid(
+                self.session, calendarobj, week_start, 'UTC')
+            return set(
+                meet.meeting_name
+                for row in meetings.values()
+                for day in row if day
+                for meet in day)
+
+        names = _names()
+        self.assertTrue('Fedora-fr-test-meeting' in names)
+        self.assertEqual(_names(), names)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # Only the fields shown are cached, not the Meeting objects
+        cached = list(cache._BACKEND._data.values())
+        self.assertEqual(len(cached), 1)
+        json.dumps(cached[0][1])
+        meetings, _ = fedocallib.get_week_grid(
+            self.session, calendarobj, week_start, 'UTC')
+        meeting = [
+            meet
+            for row in meetings.values()
+            for day in row if day
+            for meet in day][0]
+        self.assertTrue(isinstance(meeting, fedocallib.WeekMeeting))
+
+        # Adding a meeting invalidates the week
+        fedocallib.add_meeting(
+            session=self.session,
+            calendarobj=calendarobj,
+            fas_user=FakeUser(['fi-apprentice'], username='pingou'),
+            meeting_name='Cached meeting',
+            meeting_date=week_start,
+            meeting_date_end=None,
+            meeting_time_start=time(12, 0),
+            meeting_time_stop=time(13, 0),
+            comanager=None,
+            meeting_information='',
+            meeting_location=None,
+            tzone='UTC',
+            frequency=None,
+            end_repeats=None,
+            remind_when=None,
+            reminder_from=None,
+            remind_who=None,
+            full_day=False,
+            admin=True)
+        self.assertTrue('Cached meeting' in _names())
+
+        # Clearing the calendar invalidates the week
+        fedocallib.clear_calendar(self.session, calendarobj)
+        self.session.commit()
+        self.assertEqual(_names(), set())
+
+    def test_get_days_of_month_calendar(self):
+        """ Test the get_days_of_month_calendar function is invalidated
+        when a recursive meeting is deleted. """
+        calendarobj = model.Calendar.by_id(self.session, 'test_calendar')
+        day = TODAY + timedelta(days=10)
+        days = fedocallib.get_days_of_month_calendar(
+            self.session, calendarobj, day.year, day.month, 'UTC')
+        self.assertTrue(day.day in days)
+
+        meeting = model.Meeting.by_id(self.session, 7)
+        fedocallib.delete_recursive_meeting(
+            self.session, meeting, del_date=TODAY, all_meetings=True)
+        hits = cache.stats()['hits']
+        days = fedocallib.get_days_of_month_calendar(
+            self.session, calendarobj, day.year, day.month, 'UTC')
+        self.assertEqual(cache.stats()['hits'], hits)
+
+        cache.set_backend(cache.NullCache())
+        self.assertEqual(
+            fedocallib.get_days_of_month_calendar(
+                self.session, calendarobj, day.year, day.month, 'UTC'),
+            days)
+
+if __name__ == '__main__':
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(Cachetests)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
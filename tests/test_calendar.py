@@ -193,6 +193,82 @@ class Calendartests(Modeltests):
         obj = model.Calendar.by_id(self.session, 'test_calendar')
         self.assertEqual(obj, None)
 
+    def test_calendar_generation(self):
+        """ Test the generation of the calendars is bumped when they or
+        their meetings change. """
+        from datetime import date, time
+        self.test_init_calendar()
+
+        def _generations():
+            self.session.expire_all()
+            return dict(
+                (cal.calendar_name, cal.calendar_generation)
+                for cal in model.Calendar.get_all(self.session))
+
+        start = _generations()
+        self.assertEqual(set(start.values()), set([0]))
+        calendar = model.Calendar.by_id(self.session, 'test_calendar')
+        updated = calendar.calendar_updated
+        self.assertNotEqual(updated, None)
+
+        # Adding a meeting
+        meeting = model.Meeting(
+            meeting_name='Test generation',
+            meeting_date=date(2014, 6, 2),
+            meeting_date_end=date(2014, 6, 2),
+            meeting_time_start=time(10, 0),
+            meeting_time_stop=time(11, 0),
+            meeting_information='',
+            calendar_name='test_calendar')
+        meeting.save(self.session)
+        self.session.commit()
+        generations = _generations()
+        self.assertEqual(generations['test_calendar'], 1)
+        self.assertEqual(generations['test_calendar2'], 0)
+        calendar = model.Calendar.by_id(self.session, 'test_calendar')
+        self.assertTrue(calendar.calendar_updated >= updated)
+
+        # Adding a manager
+        meeting = model.Meeting.by_id(self.session, meeting.meeting_id)
+        meeting.add_manager(self.session, 'pingou')
+        self.session.commit()
+        generation = _generations()['test_calendar']
+        self.assertTrue(generation > 1)
+
+        # Saving without any change
+        meeting = model.Meeting.by_id(self.session, meeting.meeting_id)
+        meeting.save(self.session)
+        self.session.commit()
+        self.assertEqual(_generations()['test_calendar'], generation)
+
+        # Moving the meeting to another calendar
+        meeting.calendar_name = 'test_calendar2'
+        self.session.commit()
+        generations = _generations()
+        self.assertEqual(generations['test_calendar'], generation + 1)
+        self.assertEqual(generations['test_calendar2'], 1)
+
+        # Editing the calendar
+        calendar = model.Calendar.by_id(self.session, 'test_calendar')
+        calendar.calendar_description = 'New description'
+        self.session.commit()
+        self.assertEqual(_generations()['test_calendar'], generation + 2)
+
+        # Clearing the calendar
+        calendar = model.Calendar.by_id(self.session, 'test_calendar2')
+        model.Meeting.clear_from_calendar(self.session, calendar)
+        self.session.commit()
+        self.assertEqual(_generations()['test_calendar2'], 2)
+
+    def test_get_last_change(self):
+        """ Test the Calendar get_last_change function. """
+        self.assertEqual(
+            tuple(model.Calendar.get_last_change(self.session)), (0, None))
+        self.test_init_calendar()
+        count, last_change = model.Calendar.get_last_change(self.session)
+        self.assertEqual(count, 5)
+        self.assertNotEqual(last_change, None)
+
 
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(Calendartests)
@@ -30,6 +30,7 @@
 from __future__ import unicode_literals, absolute_import, print_function
 
 import logging
+import smtplib
 import unittest
 import sys
 import os
@@ -66,6 +67,23 @@ class FakeSMTP(object):
         pass
 
 
+class RecordingSMTP(object):
+    """ SMTP connection keeping the emails sent. """
+
+    def __init__(self):
+        self.mails = []
+        self.closed = 0
+        self.disconnected = False
+
+    def sendmail(self, from_email, to_emails, msg):
+        if self.disconnected:
+            raise smtplib.SMTPServerDisconnected('Connection closed')
+        self.mails.append((from_email, to_emails, msg))
+
+    def quit(self):
+        self.closed += 1
+
+
 # pylint: disable=C0103
 class Crontests(Modeltests):
     """ Cron tests. """
@@ -278,6 +296,202 @@ class Crontests(Modeltests):
         self.assertEqual(msgs[0]['From'], 'pingou@fp.o')
 
 
+    @patch('fedocal_cron.fedmsg.publish')
+    @patch('fedocal_cron.smtplib.SMTP')
+    def test_reminders_batch(self, smtp_mock, publish_mock):
+        """ Test the cron job sends all the reminders of a run over a
+        single SMTP connection and publishes all the messages.
+        """
+        smtp = RecordingSMTP()
+        smtp_mock.return_value = smtp
+
+        date_sa = datetime.utcnow() + timedelta(hours=12)
+        date_so = datetime.utcnow() + timedelta(hours=13)
+        for cnt in range(5):
+            remobj = model.Reminder(
+                'H-12', 'pingou@fp.o', 'list%s@lists.fp.o' % cnt,
+                'Come to our test meeting')
+            remobj.save(self.session)
+            self.session.flush()
+            obj = model.Meeting(
+                meeting_name='Test meeting %s' % cnt,
+                meeting_date=date_sa.date(),
+                meeting_date_end=date_so.date(),
+                meeting_time_start=date_sa.time(),
+                meeting_time_stop=date_so.time(),
+                meeting_information='This is a test meeting with reminder',
+                calendar_name='test_calendar',
+                reminder_id=remobj.reminder_id)
+            obj.save(self.session)
+            obj.add_manager(self.session, ['pingou'])
+        self.session.commit()
+
+        msgs = fedocal_cron.send_reminder()
+
+        self.assertEqual(len(msgs), 5)
+        self.assertEqual(smtp_mock.call_count, 1)
+        self.assertEqual(
+            sorted(mail[1] for mail in smtp.mails),
+            [['list%s@lists.fp.o' % cnt] for cnt in range(5)])
+        self.assertEqual(smtp.closed, 1)
+
+        self.assertEqual(publish_mock.call_count, 5)
+        self.assertEqual(
+            sorted(
+                call[1]['msg']['meeting']['meeting_name']
+                for call in publish_mock.call_args_list),
+            ['Test meeting %s' % cnt for cnt in range(5)])
+
+        self.assertEqual(fedocal_cron.LAST_RUN['meetings'], 5)
+        self.assertEqual(fedocal_cron.LAST_RUN['smtp_connections'], 1)
+        for step in ['select', 'emails', 'publish', 'total']:
+            self.assertTrue(fedocal_cron.LAST_RUN[step] >= 0)
+
+    @patch('fedocal_cron.smtplib.SMTP')
+    def test_mailer_reconnect(self, smtp_mock):
+        """ Test the Mailer opens a new connection when the SMTP server
+        closed the previous one.
+        """
+        disconnected = RecordingSMTP()
+        disconnected.disconnected = True
+        smtp = RecordingSMTP()
+        smtp_mock.side_effect = [disconnected, smtp]
+
+        mailer = fedocal_cron.Mailer('localhost')
+        mailer.sendmail('pingou@fp.o', ['list@fp.o'], 'message')
+        mailer.sendmail('pingou@fp.o', ['list2@fp.o'], 'message')
+        mailer.quit()
+
+        self.assertEqual(mailer.connections, 2)
+        self.assertEqual(
+            smtp.mails,
+            [('pingou@fp.o', ['list@fp.o'], 'message'),
+             ('pingou@fp.o', ['list2@fp.o'], 'message')])
+        self.assertEqual(smtp.closed, 1)
+
+    def _add_meeting_with_reminder(self):
+        """ Add a meeting with a reminder to send now. """
+        date_sa = datetime.utcnow() + timedelta(hours=12)
+        date_so = datetime.utcnow() + timedelta(hours=13)
+        remobj = model.Reminder(
+            'H-12', 'pingou@fp.o', 'list@lists.fp.o',
+            'Come to our test meeting')
+        remobj.save(self.session)
+        self.session.flush()
+        obj = model.Meeting(
+            meeting_name='Test meeting',
+            meeting_date=date_sa.date(),
+            meeting_date_end=date_so.date(),
+            meeting_time_start=date_sa.time(),
+            meeting_time_stop=date_so.time(),
+            meeting_information='This is a test meeting with reminder',
+            calendar_name='test_calendar',
+            reminder_id=remobj.reminder_id)
+        obj.save(self.session)
+        obj.add_manager(self.session, ['pingou'])
+        self.session.commit()
+        return obj
+
+    @patch('fedocal_cron.fedmsg.publish')
+    @patch('fedocal_cron.smtplib.SMTP')
+    def test_reminders_sent_once(self, smtp_mock, publish_mock):
+        """ Test the reminders are only sent once whatever the number of
+        runs of the cron job.
+        """
+        smtp = RecordingSMTP()
+        smtp_mock.return_value = smtp
+        self._add_meeting_with_reminder()
+
+        msgs = fedocal_cron.send_reminder()
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(fedocal_cron.LAST_RUN['added'], 1)
+
+        msgs = fedocal_cron.send_reminder()
+        self.assertEqual(len(msgs), 0)
+        self.assertEqual(fedocal_cron.LAST_RUN['added'], 0)
+        self.assertEqual(len(smtp.mails), 1)
+        self.assertEqual(publish_mock.call_count, 1)
+
+        entry = self.session.query(model.ReminderOutbox).one()
+        self.assertEqual(entry.status, 'sent')
+        self.assertEqual(entry.attempts, 0)
+
+    @patch('fedocal_cron.fedmsg.publish')
+    @patch('fedocal_cron.smtplib.SMTP')
+    def test_reminders_retried(self, smtp_mock, publish_mock):
+        """ Test the reminders which could not be sent are tried again by
+        the next runs.
+        """
+        smtp_mock.side_effect = smtplib.SMTPConnectError(
+            421, 'Service not available')
+        self._add_meeting_with_reminder()
+
+        msgs = fedocal_cron.send_reminder()
+        self.assertEqual(len(msgs), 0)
+        self.assertEqual(fedocal_cron.LAST_RUN['failed'], 1)
+        self.assertEqual(publish_mock.call_count, 0)
+
+        entry = self.session.query(model.ReminderOutbox).one()
+        self.assertEqual(entry.status, 'pending')
+        self.assertEqual(entry.attempts, 1)
+        self.assertTrue(entry.next_attempt > datetime.utcnow())
+        self.assertTrue(entry.last_error.startswith('(421'))
+
+        # Once the retry is due, the reminder is sent
+        entry.next_attempt = datetime.utcnow() - timedelta(minutes=1)
+        self.session.commit()
+        smtp = RecordingSMTP()
+        smtp_mock.side_effect = None
+        smtp_mock.return_value = smtp
+
+        msgs = fedocal_cron.send_reminder()
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(len(smtp.mails), 1)
+        self.session.expire_all()
+        entry = self.session.query(model.ReminderOutbox).one()
+        self.assertEqual(entry.status, 'sent')
+        self.assertEqual(entry.attempts, 1)
+
+    @patch('fedocal_cron.fedmsg.publish')
+    @patch('fedocal_cron.smtplib.SMTP')
+    def test_reminder_error_does_not_block(self, smtp_mock, publish_mock):
+        """ Test a reminder failing with an unexpected error is marked as
+        failed and the following reminders are still sent.
+        """
+        smtp = RecordingSMTP()
+        smtp_mock.return_value = smtp
+        broken = self._add_meeting_with_reminder()
+        broken_id = broken.meeting_id
+        self._add_meeting_with_reminder()
+        send_reminder_meeting = fedocal_cron.send_reminder_meeting
+
+        def send(meeting, meeting_id, smtp=None):
+            if meeting_id == broken_id:
+                raise IndexError('list index out of range')
+            return send_reminder_meeting(meeting, meeting_id, smtp=smtp)
+
+        with patch('fedocal_cron.send_reminder_meeting', side_effect=send):
+            msgs = fedocal_cron.send_reminder()
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(len(smtp.mails), 1)
+        self.assertEqual(publish_mock.call_count, 1)
+        self.assertEqual(fedocal_cron.LAST_RUN['failed'], 1)
+
+        self.session.expire_all()
+        entries = dict(
+            (entry.meeting_id, entry)
+            for entry in self.session.query(model.ReminderOutbox))
+        self.assertEqual(entries[broken_id].status, 'pending')
+        self.assertEqual(entries[broken_id].attempts, 1)
+        self.assertEqual(
+            entries[broken_id].last_error, 'list index out of range')
+        self.assertEqual(entries[broken_id].lease_owner, None)
+        self.assertEqual(
+            [entry.status for key, entry in entries.items()
+             if key != broken_id],
+            ['sent'])
+
+
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(Crontests)
     unittest.TextTestRunner(verbosity=2).run(SUITE)
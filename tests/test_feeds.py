@@ -0,0 +1,144 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+ (c) 2012 - Copyright Pierre-Yves Chibon
+ Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+ Distributed under License GPLv3 or later
+ You can find a copy of this license on the website
+ http://www.gnu.org/licenses/gpl.html
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+ MA 02110-1301, USA.
+
+ fedocal.feeds test script
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import unittest
+import sys
+import os
+
+from datetime import timedelta
+from unittest.mock import patch
+
+import vobject
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import fedocal.fedocallib as fedocallib
+from fedocal.fedocallib import feeds
+from fedocal.fedocallib import model
+from tests import Modeltests
+
+
+def _normalize(output):
+    """ Drop the lines generated differently at every serialization. """
+    return [
+        line for line in output.splitlines()
+        if not line.startswith(('UID:', 'DTSTAMP:'))]
+
+
+class Feedstests(Modeltests):
+    """ Feeds tests. """
+
+    def setUp(self):
+        """ Set up the database and the meetings. """
+        super(Feedstests, self).setUp()
+        feeds.FRAGMENTS = feeds.cache.MemoryCache()
+        from .test_meeting import Meetingtests
+        meeting = Meetingtests('test_init_meeting')
+        meeting.session = self.session
+        meeting.test_init_meeting()
+
+    def test_build_feed(self):
+        """ Test the build_feed function returns the same feed as
+        serializing the whole calendar with vobject. """
+        meetings = self.session.query(model.Meeting).order_by(
+            model.Meeting.meeting_id).all()
+        # Have the feed rely on several timezones
+        meetings[0].meeting_timezone = 'Europe/Paris'
+        meetings[1].meeting_timezone = 'America/New_York'
+        reminder = timedelta(minutes=-60)
+
+        for prefix in ['', 'fedocal_']:
+            ical = vobject.iCalendar()
+            fedocallib.add_meetings_to_vcal(ical, meetings, reminder=reminder)
+            expected = ical.serialize()
+            expected = expected.replace('TZID:', 'TZID:%s' % prefix)
+            expected = expected.replace('TZID=', 'TZID=%s' % prefix)
+
+            output = feeds.build_feed(
+                meetings, reminder=reminder, tzid_prefix=prefix)
+            self.assertEqual(_normalize(output), _normalize(expected))
+            self.assertEqual(output.count('BEGIN:VTIMEZONE'), 2)
+
+        output = feeds.build_feed([])
+        self.assertEqual(
+            output,
+            'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'
+            'PRODID:-//PYVOBJECT//NONSGML Version 0.9.9//EN\r\n'
+            'END:VCALENDAR\r\n')
+
+    def test_iter_feed(self):
+        """ Test the iter_feed function yields the feed one component at
+        a time. """
+        meetings = self.session.query(model.Meeting).order_by(
+            model.Meeting.meeting_id).all()
+        meetings[0].meeting_timezone = 'Europe/Paris'
+        meetings[1].meeting_timezone = 'Europe/Paris'
+
+        chunks = list(feeds.iter_feed(meetings, tzid_prefix='fedocal_'))
+        # header, one VTIMEZONE, one VEVENT per meeting and footer
+        self.assertEqual(len(chunks), len(meetings) + 3)
+        self.assertTrue(chunks[0].startswith('BEGIN:VCALENDAR'))
+        self.assertTrue(chunks[1].startswith('BEGIN:VTIMEZONE'))
+        self.assertIn('TZID:fedocal_CET', chunks[1])
+        for chunk in chunks[2:-1]:
+            self.assertTrue(chunk.startswith('BEGIN:VEVENT'))
+            self.assertTrue(chunk.endswith('END:VEVENT\r\n'))
+        self.assertIn('TZID=fedocal_CET', chunks[2])
+        self.assertEqual(chunks[-1], 'END:VCALENDAR\r\n')
+
+    def test_get_meeting_fragment(self):
+        """ Test the get_meeting_fragment function only renders the
+        meetings which changed. """
+        meetings = self.session.query(model.Meeting).order_by(
+            model.Meeting.meeting_id).all()
+        with patch(
+                'fedocal.fedocallib.feeds._render_meeting',
+                wraps=feeds._render_meeting) as render:
+            feeds.build_feed(meetings)
+            self.assertEqual(render.call_count, len(meetings))
+
+            output = feeds.build_feed(meetings)
+            self.assertEqual(render.call_count, len(meetings))
+
+            meetings[0].meeting_name = 'Renamed meeting'
+            new_output = feeds.build_feed(meetings)
+            self.assertEqual(render.call_count, len(meetings) + 1)
+            self.assertNotEqual(new_output, output)
+            self.assertIn('SUMMARY:Renamed meeting', new_output)
+
+            # The reminder is part of the fragment
+            feeds.build_feed(meetings, reminder=timedelta(minutes=-5))
+            self.assertEqual(render.call_count, 2 * len(meetings) + 1)
+
+
+if __name__ == '__main__':
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(Feedstests)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
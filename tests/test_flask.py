@@ -109,6 +109,7 @@ class Flasktests(Modeltests):
         fedocal.APP.logger.handlers = []
         fedocal.APP.logger.setLevel(logging.CRITICAL)
         fedocal.SESSION = self.session
+        fedocal.READ_SESSION = self.session
         self.app = fedocal.APP.test_client()
 
     def test_index_empty(self):
@@ -371,6 +372,75 @@ class Flasktests(Modeltests):
         output = self.app.get('/ical/foorbar/')
         self.assertEqual(output.status_code, 404)
 
+    def test_ical_out_etag(self):
+        """ Test the ical_out function answers 304 when the calendar did
+        not change. """
+        self.__setup_db()
+
+        output = self.app.get('/ical/test_calendar/')
+        self.assertEqual(output.status_code, 200)
+        self.assertIn('BEGIN:VCALENDAR', output.get_data(as_text=True))
+        etag = output.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertNotEqual(output.headers.get('Last-Modified'), None)
+
+        output = self.app.get(
+            '/ical/test_calendar/', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 304)
+        self.assertEqual(output.get_data(as_text=True), '')
+        self.assertEqual(output.headers['ETag'], etag)
+
+        # The arguments are part of the ETag
+        output = self.app.get(
+            '/ical/test_calendar/?reminder_delta=5',
+            headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 200)
+        self.assertIn('BEGIN:VALARM', output.get_data(as_text=True))
+
+        # Any change to the calendar changes the ETag
+        meeting = model.Meeting.by_id(self.session, 1)
+        meeting.meeting_name = 'Renamed meeting'
+        self.session.commit()
+        output = self.app.get(
+            '/ical/test_calendar/', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 200)
+        self.assertIn(
+            'SUMMARY:Renamed meeting', output.get_data(as_text=True))
+        self.assertNotEqual(output.headers['ETag'], etag)
+
+    def test_calendar_etag(self):
+        """ Test the calendar and calendar_list functions answer 304 when
+        nothing changed. """
+        self.__setup_db()
+
+        for url in ['/test_calendar/', '/list/test_calendar/']:
+            output = self.app.get(url)
+            self.assertEqual(output.status_code, 200)
+            etag = output.headers['ETag']
+
+            output = self.app.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(output.status_code, 304)
+
+            # The timezone is part of the ETag
+            output = self.app.get(
+                url + '?tzone=Europe/Paris', headers={'If-None-Match': etag})
+            self.assertEqual(output.status_code, 200)
+
+            # So is the user
+            user = FakeUser(['packager'], username='kevin')
+            with user_set(fedocal.APP, user):
+                output = self.app.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(output.status_code, 200)
+
+            # Adding a calendar changes the menu of all the pages
+            calendar = model.Calendar(
+                'new_calendar_%s' % url.count('list'), 'contact',
+                'description')
+            calendar.save(self.session)
+            self.session.commit()
+            output = self.app.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(output.status_code, 200)
+
     def test_location_list(self):
         """ Test the calendar_list function. """
         self.__setup_db()
@@ -44,7 +44,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(
 import fedocal
 import fedocal.api
 import fedocal.fedocallib as fedocallib
-from tests import Modeltests, TODAY
+from tests import Modeltests, FakeUser, user_set, TODAY
 
 
 # pylint: disable=E1103
@@ -67,6 +67,7 @@ class FlaskApitests(Modeltests):
 
         fedocal.APP.config['TESTING'] = True
         fedocal.SESSION = self.session
+        fedocal.READ_SESSION = self.session
         fedocal.api.SESSION = self.session
         self.app = fedocal.APP.test_client()
 
@@ -463,6 +464,161 @@ class FlaskApitests(Modeltests):
             self.assertEqual(
                 output_text, '"abcd"([\'{"locations": ["EMEA"]}\']);')
 
+    def test_api_date_callback(self):
+        """ Test the api_meetings function streaming the meetings as
+        the argument of the callback. """
+        self.__setup_db()
+
+        output = self.app.get(
+            '/api/meetings/?calendar=test_calendar&callback=abcd')
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(output.mimetype, 'application/javascript')
+        self.assertTrue(output.headers.get('ETag'))
+        output_text = output.get_data(as_text=True)
+        self.assertTrue(output_text.startswith('abcd({"arguments"'))
+        self.assertTrue(output_text.endswith(');'))
+        data = json.loads(output_text[len('abcd('):-len(');')])
+        self.assertTrue(len(data['meetings']) > 0)
+        self.assertEqual(
+            data['meetings'][0]['calendar_name'], 'test_calendar')
+
+    def test_api_date_etag(self):
+        """ Test the api_meetings function answers 304 when the calendar
+        did not change. """
+        self.__setup_db()
+
+        url = '/api/meetings/?calendar=test_calendar'
+        output = self.app.get(url)
+        self.assertEqual(output.status_code, 200)
+        etag = output.headers['ETag']
+
+        output = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 304)
+
+        output = self.app.get(
+            url + '&start=2013-05-04', headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 200)
+
+        # The 304 responses are not wrapped in the callback
+        url = '/api/meetings/?calendar=test_calendar&callback=abcd'
+        etag = self.app.get(url).headers['ETag']
+        output = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(output.status_code, 304)
+        self.assertEqual(output.get_data(as_text=True), '')
+        self.assertEqual(output.headers['ETag'], etag)
+
+        # No ETag without calendar
+        output = self.app.get('/api/meetings/')
+        self.assertEqual(output.status_code, 200)
+        self.assertEqual(output.headers.get('ETag'), None)
+
+    def test_api_date_no_expand(self):
+        """ Test the api_meetings function returning each recurring
+        meeting once. """
+        self.__setup_db()
+
+        end_date = TODAY + timedelta(days=30)
+        url = '/api/meetings/?calendar=test_calendar&start=%s&end=%s' % (
+            TODAY, end_date)
+
+        output = self.app.get(url)
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.get_data(as_text=True))
+        names = [meeting['meeting_name'] for meeting in data['meetings']]
+        self.assertEqual(names.count('Another test meeting'), 3)
+        self.assertEqual(names.count('Another test meeting2'), 3)
+        self.assertFalse('recursion' in data['meetings'][0])
+
+        output = self.app.get(url + '&expand=false')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.get_data(as_text=True))
+        meetings = dict(
+            (meeting['meeting_name'], meeting)
+            for meeting in data['meetings'])
+        self.assertEqual(len(meetings), len(data['meetings']))
+
+        meeting = meetings['Another test meeting']
+        self.assertEqual(
+            meeting['meeting_date'],
+            (TODAY + timedelta(days=10)).strftime('%Y-%m-%d'))
+        recursion_ends = TODAY + timedelta(days=90)
+        self.assertEqual(
+            meeting['recursion'],
+            {
+                'frequency': 7,
+                'ends': recursion_ends.strftime('%Y-%m-%d'),
+                'dtstart': '%sT02:00:00' % (TODAY + timedelta(days=10)),
+                'rrule': 'FREQ=WEEKLY;INTERVAL=1;UNTIL=%sT020000Z' % (
+                    recursion_ends.strftime('%Y%m%d')),
+                'exdate': [],
+            }
+        )
+        self.assertEqual(
+            meetings['Another test meeting2']['recursion']['rrule'][:22],
+            'FREQ=WEEKLY;INTERVAL=2')
+        self.assertEqual(meetings['test-meeting2']['recursion'], None)
+
+    def test_api_stats_restricted(self):
+        """ Test the statistics are only available to the admins unless
+        API_STATS is set. """
+        for url in ('/api/cache/', '/api/messages/', '/api/db/'):
+            output = self.app.get(url)
+            self.assertEqual(output.status_code, 403)
+            output = self.app.post(url)
+            self.assertEqual(output.status_code, 405)
+
+        user = FakeUser(['fi-apprentice', 'signed_fpca', 'packager'])
+        with user_set(fedocal.APP, user):
+            for url in ('/api/cache/', '/api/messages/', '/api/db/'):
+                output = self.app.get(url)
+                self.assertEqual(output.status_code, 200)
+
+    def test_api_cache(self):
+        """ Test the api_cache function. """
+        fedocal.APP.config['API_STATS'] = True
+        self.addCleanup(fedocal.APP.config.pop, 'API_STATS')
+        output = self.app.get('/api/cache/')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.get_data(as_text=True))
+        self.assertEqual(data['backend'], 'NullCache')
+
+        self.__setup_db()
+        fedocallib.cache.set_backend(fedocallib.cache.MemoryCache())
+        try:
+            for _ in range(2):
+                output = self.app.get('/test_calendar/')
+                self.assertEqual(output.status_code, 200)
+
+            output = self.app.get('/api/cache/')
+            data = json.loads(output.get_data(as_text=True))
+            # The week grid and the days of the month are cached
+            self.assertEqual(
+                data,
+                {'backend': 'MemoryCache', 'hits': 2, 'misses': 2,
+                 'size': 2})
+        finally:
+            fedocallib.cache.set_backend(fedocallib.cache.NullCache())
+
+    def test_api_messages(self):
+        """ Test the api_messages function. """
+        fedocal.APP.config['API_STATS'] = True
+        self.addCleanup(fedocal.APP.config.pop, 'API_STATS')
+        output = self.app.get('/api/messages/')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.get_data(as_text=True))
+        self.assertEqual(data, {'queue': None})
+
+    def test_api_db(self):
+        """ Test the api_db function. """
+        fedocal.APP.config['API_STATS'] = True
+        self.addCleanup(fedocal.APP.config.pop, 'API_STATS')
+        output = self.app.get('/api/db/')
+        self.assertEqual(output.status_code, 200)
+        data = json.loads(output.get_data(as_text=True))
+        self.assertEqual(data['replica'], None)
+        self.assertTrue('pool' in data['primary'])
+        self.assertTrue('status' in data['primary'])
+
 
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(FlaskApitests)
@@ -73,6 +73,7 @@ class ExtrasFlasktests(Modeltests):
         fedocal.APP.logger.handlers = []
         fedocal.APP.logger.setLevel(logging.CRITICAL)
         fedocal.SESSION = self.session
+        fedocal.READ_SESSION = self.session
         self.app = fedocal.APP.test_client()
 
     def test_start_date_edit_meeting_form(self):
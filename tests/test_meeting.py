@@ -32,9 +32,12 @@ import unittest
 import sys
 import os
 
+from datetime import datetime
 from datetime import time
 from datetime import timedelta
 
+from sqlalchemy import event
+
 sys.path.insert(0, os.path.join(os.path.dirname(
     os.path.abspath(__file__)), '..'))
 
@@ -43,6 +46,38 @@ from . import Modeltests, TODAY
 from .test_calendar import Calendartests
 
 
+def explain_queries(session, function, *args):
+    """ Call the specified function and return, for each SQL query it ran,
+    the query plan of the database as a string.
+    """
+    statements = []
+    engine = session.get_bind()
+
+    def capture(conn, cursor, statement, parameters, context, many):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        function(session, *args)
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    connection = session.connection()
+    if engine.dialect.name == 'postgresql':
+        # Forbid sequential scans so the plans do not depend on the
+        # (very small) size of the tables
+        connection.exec_driver_sql('SET enable_seqscan = off')
+        prefix = 'EXPLAIN '
+    else:
+        prefix = 'EXPLAIN QUERY PLAN '
+    plans = []
+    for statement, parameters in statements:
+        rows = connection.exec_driver_sql(
+            prefix + statement, parameters).fetchall()
+        plans.append('\n'.join('%s' % (row[-1],) for row in rows))
+    return plans
+
+
 # pylint: disable=R0904
 class Meetingtests(Modeltests):
     """ Meeting tests. """
@@ -789,6 +824,300 @@ class Meetingtests(Modeltests):
             self.assertEqual(meetings, [])
 
 
+    def test_get_active_regular_meeting_by_date_window(self):
+        """ Test the get_active_regular_meeting_by_date function only
+        returns the recursive meetings occuring in the window. """
+        self.test_init_meeting()
+        calendar = model.Calendar.by_id(self.session, 'test_calendar')
+
+        # Meeting #7 occurs every 7 days starting at TODAY + 10
+        for start, end, found in [
+                (11, 16, False), (11, 17, True), (10, 10, True),
+                (0, 9, False), (84, 90, True), (95, 120, False)]:
+            meetings = model.Meeting.get_active_regular_meeting_by_date(
+                self.session, calendar, TODAY + timedelta(days=start),
+                end_date=TODAY + timedelta(days=end))
+            ids = [meeting.meeting_id for meeting in meetings]
+            self.assertEqual(7 in ids, found, (start, end, ids))
+
+        # Without end_date, all the series still running are returned
+        meetings = model.Meeting.get_active_regular_meeting_by_date(
+            self.session, calendar, TODAY + timedelta(days=11))
+        self.assertTrue(7 in [meeting.meeting_id for meeting in meetings])
+
+    def test_get_by_date_uses_index(self):
+        """ Test the Meeting get_by_date function relies on an index. """
+        self.test_init_meeting()
+        calendar = model.Calendar.by_id(self.session, 'test_calendar')
+        plans = explain_queries(
+            self.session, model.Meeting.get_by_date, calendar,
+            TODAY, TODAY + timedelta(days=7))
+        self.assertEqual(len(plans), 1)
+        if self.session.get_bind().dialect.name == 'postgresql':
+            self.assertTrue('Seq Scan on meetings' not in plans[0])
+            self.assertTrue('ix_meetings_calendar_dates' in plans[0])
+        else:
+            self.assertTrue(
+                'SEARCH meetings USING INDEX ix_meetings_calendar_dates'
+                in plans[0], plans[0])
+
+    def test_get_active_regular_meeting_uses_index(self):
+        """ Test the Meeting get_active_regular_meeting function narrows
+        down the recursive meetings with an index. """
+        self.test_init_meeting()
+        calendar = model.Calendar.by_id(self.session, 'test_calendar')
+        plans = explain_queries(
+            self.session, model.Meeting.get_active_regular_meeting,
+            calendar, TODAY, TODAY + timedelta(days=7))
+        self.assertEqual(len(plans), 1)
+        if self.session.get_bind().dialect.name == 'postgresql':
+            self.assertTrue('Seq Scan on meetings' not in plans[0])
+        else:
+            self.assertTrue(
+                'SEARCH meetings USING INDEX ix_meetings_calendar_dates '
+                '(calendar_name=? AND meeting_date<?)' in plans[0],
+                plans[0])
+
+    def test_get_by_date_profiles(self):
+        """ Test the Meeting get_by_date function only loads the
+        information needed by the profile asked. """
+        from sqlalchemy import inspect
+        from sqlalchemy.exc import InvalidRequestError
+
+        self.test_init_meeting()
+        week_start = TODAY - timedelta(days=TODAY.weekday())
+        week_stop = TODAY + timedelta(days=6)
+
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, many):
+            statements.append(statement)
+
+        engine = self.session.get_bind()
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            self.session.expunge_all()
+            cal = model.Calendar.by_id(self.session, 'test_calendar')
+            del statements[:]
+            obj = model.Meeting.get_by_date(
+                self.session, cal, week_start, week_stop, profile='json')
+            self.assertEqual(len(obj), 3)
+            # The meetings with their calendar, then their managers
+            self.assertEqual(len(statements), 2)
+            self.assertTrue('calendars' in statements[0])
+            self.assertTrue('meetings_users' not in statements[0])
+            self.assertTrue('meetings_users' in statements[1])
+            self.assertEqual(obj[1].meeting_manager, ['pingou', 'shaiton'])
+            self.assertEqual(obj[1].calendar.calendar_name, 'test_calendar')
+            self.assertEqual(len(statements), 2)
+
+            self.session.expunge_all()
+            cal = model.Calendar.by_id(self.session, 'test_calendar')
+            obj = model.Meeting.get_by_date(
+                self.session, cal, week_start, week_stop, profile='week')
+            self.assertEqual(len(obj), 3)
+            unloaded = inspect(obj[1]).unloaded
+            self.assertTrue('meeting_information' in unloaded)
+            self.assertTrue('meeting_manager_user' in unloaded)
+            self.assertTrue('reminder' in unloaded)
+            self.assertFalse('meeting_name' in unloaded)
+            # Still available when accessed
+            self.assertEqual(
+                obj[1].meeting_information, 'This is a test meeting')
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+
+        model.STRICT_LOADING = True
+        try:
+            self.session.expunge_all()
+            cal = model.Calendar.by_id(self.session, 'test_calendar')
+            obj = model.Meeting.get_by_date(
+                self.session, cal, week_start, week_stop, profile='list')
+            self.assertEqual(obj[1].calendar.calendar_name, 'test_calendar')
+            self.assertRaises(
+                InvalidRequestError, getattr, obj[1], 'meeting_manager')
+        finally:
+            model.STRICT_LOADING = False
+
+    def test_get_past_meeting_of_user_uses_index(self):
+        """ Test the Meeting get_past_meeting_of_user function relies on
+        indexes. """
+        self.test_init_meeting()
+        plans = explain_queries(
+            self.session, model.Meeting.get_past_meeting_of_user,
+            'pingou', TODAY + timedelta(days=1))
+        self.assertEqual(len(plans), 1)
+        if self.session.get_bind().dialect.name == 'postgresql':
+            self.assertTrue('Seq Scan' not in plans[0], plans[0])
+        else:
+            self.assertTrue('SCAN meetings' not in plans[0], plans[0])
+            self.assertTrue(
+                'SEARCH meetings_users USING COVERING INDEX'
+                in plans[0], plans[0])
+            self.assertTrue(
+                'USING INDEX ix_meetings_users_meeting_id' in plans[0],
+                plans[0])
+
+    def test_get_overlaping_meetings(self):
+        """ Test the Meeting get_overlaping_meetings function. """
+        self.test_init_meeting()
+        calendar = model.Calendar.by_id(self.session, 'test_calendar')
+        meetings = model.Meeting.get_overlaping_meetings(
+            self.session, calendar,
+            TODAY + timedelta(days=10), TODAY + timedelta(days=12))
+        self.assertEqual(
+            [meeting.meeting_id for meeting in meetings], [14, 7, 2, 9, 10])
+
+        meetings = model.Meeting.get_overlaping_meetings(
+            self.session, calendar,
+            TODAY + timedelta(days=10), TODAY + timedelta(days=12),
+            no_recursive=True)
+        self.assertEqual(
+            [meeting.meeting_id for meeting in meetings], [2, 9])
+
+        meetings = model.Meeting.get_overlaping_meetings(
+            self.session, calendar,
+            TODAY + timedelta(days=13), TODAY + timedelta(days=19))
+        self.assertEqual(meetings, [])
+
+    def test_meeting_utc(self):
+        """ Test the UTC start and stop of the meetings are kept in sync
+        with their date, time and timezone. """
+        self.test_init_meeting()
+        meeting = model.Meeting.by_id(self.session, 1)
+        self.assertEqual(
+            meeting.meeting_start_utc,
+            datetime.combine(TODAY, time(19, 50)))
+        self.assertEqual(
+            meeting.meeting_stop_utc,
+            datetime.combine(TODAY, time(20, 50)))
+
+        meeting.meeting_timezone = 'Asia/Tokyo'
+        meeting.meeting_time_start = time(8, 0)
+        meeting.save(self.session)
+        self.session.commit()
+        meeting = model.Meeting.by_id(self.session, 1)
+        self.assertEqual(
+            meeting.meeting_start_utc,
+            datetime.combine(TODAY - timedelta(days=1), time(23, 0)))
+        self.assertEqual(
+            meeting.meeting_stop_utc,
+            datetime.combine(TODAY, time(11, 50)))
+
+    def test_get_meeting_with_reminder_timezone(self):
+        """ Test the Meeting get_meeting_with_reminder function relies on
+        the time in UTC of the meetings. """
+        self.test_init_meeting()
+        # Meeting #9 is at 11:00, once in Paris it starts at 09:00 UTC in
+        # the summer or 10:00 UTC in the winter
+        meeting = model.Meeting.by_id(self.session, 9)
+        meeting.meeting_timezone = 'Europe/Paris'
+        meeting.save(self.session)
+        self.session.commit()
+
+        day = TODAY + timedelta(days=11)
+        utc_start = meeting.meeting_start_utc
+        self.assertTrue(utc_start.time() in (time(9, 0), time(10, 0)))
+        meetings = model.Meeting.get_meeting_with_reminder(
+            self.session, day, time(11, 00), time(11, 30), 'H-12')
+        self.assertEqual(meetings, [])
+        meetings = model.Meeting.get_meeting_with_reminder(
+            self.session, day, utc_start.time(),
+            (utc_start + timedelta(minutes=30)).time(), 'H-12')
+        self.assertEqual(
+            [meet.meeting_id for meet in meetings], [9])
+
+    def test_get_meetings_to_remind(self):
+        """ Test the Meeting get_meetings_to_remind function retrieves the
+        meetings to remind for all the offsets in a single query. """
+        self.test_init_meeting()
+        meeting = model.Meeting.by_id(self.session, 9)
+        meeting.reminder.reminder_offset = 'H-24'
+        self.session.commit()
+
+        day = TODAY + timedelta(days=11)
+        day2 = TODAY + timedelta(days=19)
+        windows = {
+            'H-12': (datetime.combine(day2, time(10, 0)),
+                     datetime.combine(day2, time(10, 30))),
+            'H-24': (datetime.combine(day, time(11, 0)),
+                     datetime.combine(day, time(11, 30))),
+            'H-48': (datetime.combine(day, time(11, 0)),
+                     datetime.combine(day, time(11, 30))),
+        }
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = self.session.get_bind()
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            meetings = model.Meeting.get_meetings_to_remind(
+                self.session, windows)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(
+            [(meet.meeting_id, offset) for meet, offset in meetings],
+            [(9, 'H-24'), (10, 'H-12')])
+
+        self.assertEqual(
+            model.Meeting.get_meetings_to_remind(self.session, {}), [])
+
+    def test_expand_regular_meetings(self):
+        """ Test the Meeting expand_regular_meetings function. """
+        self.test_init_meeting()
+        meeting = model.Meeting.by_id(self.session, 7)
+        meetings = model.Meeting.expand_regular_meetings(
+            [meeting], start_date=TODAY, end_date=TODAY + timedelta(days=30))
+        self.assertEqual(len(meetings), 3)
+        for cnt, occurrence in enumerate(meetings):
+            self.assertTrue(
+                isinstance(occurrence, model.MeetingOccurrence))
+            self.assertEqual(
+                occurrence.meeting_date,
+                TODAY + timedelta(days=10 + 7 * cnt))
+            self.assertEqual(occurrence.meeting_id, 7)
+            self.assertEqual(occurrence.meeting_name, 'Another test meeting')
+            self.assertEqual(occurrence.meeting_manager, ['pingou'])
+            self.assertEqual(occurrence.calendar_name, 'test_calendar')
+        # The recursive meeting itself is left untouched
+        self.assertEqual(meeting.meeting_date, TODAY + timedelta(days=10))
+
+    def test_meeting_occurrence(self):
+        """ Test the MeetingOccurrence object. """
+        self.test_init_meeting()
+        meeting = model.Meeting.by_id(self.session, 7)
+        occurrence = model.MeetingOccurrence(
+            meeting,
+            TODAY + timedelta(days=17),
+            TODAY + timedelta(days=17))
+        self.assertFalse(hasattr(occurrence, '__dict__'))
+        self.assertEqual(occurrence.meeting_time_start, time(2, 00))
+
+        data = occurrence.to_json()
+        self.assertEqual(
+            data['meeting_date'], '%s' % (TODAY + timedelta(days=17)))
+        self.assertEqual(data['meeting_name'], 'Another test meeting')
+        self.assertEqual(data['meeting_manager'], ['pingou'])
+
+        # Occurrences of occurrences point to the original meeting
+        occurrence2 = model.MeetingOccurrence(
+            occurrence, TODAY + timedelta(days=24),
+            TODAY + timedelta(days=24))
+        self.assertTrue(occurrence2.meeting is meeting)
+
+        # Materializing an occurrence gives a Meeting at its date
+        obj = occurrence.materialize()
+        self.assertTrue(isinstance(obj, model.Meeting))
+        self.assertEqual(obj.meeting_date, TODAY + timedelta(days=17))
+        self.assertEqual(obj.meeting_name, 'Another test meeting')
+        self.assertEqual(obj.meeting_manager, ['pingou'])
+        self.assertEqual(meeting.meeting_date, TODAY + timedelta(days=10))
+
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(Meetingtests)
     unittest.TextTestRunner(verbosity=2).run(SUITE)
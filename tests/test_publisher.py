@@ -0,0 +1,223 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+ (c) 2012 - Copyright Pierre-Yves Chibon
+ Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+ Distributed under License GPLv3 or later
+ You can find a copy of this license on the website
+ http://www.gnu.org/licenses/gpl.html
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+ MA 02110-1301, USA.
+
+ fedocal.publisher test script
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from fedora_messaging.exceptions import PublishTimeout
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+from fedocal.fedocallib import fedmsgshim
+from fedocal.fedocallib import publisher
+
+
+class FakePublisher(object):
+    """ Record the messages published, failing while ``down`` is True.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.down = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, topic, msg):
+        self.release.wait(5)
+        if self.down:
+            raise publisher.BrokerUnavailable('Connection refused')
+        if msg.get('invalid'):
+            raise ValueError('No schema for this message')
+        self.messages.append((topic, msg))
+
+
+class Publishertests(unittest.TestCase):
+    """ Publisher tests. """
+
+    def setUp(self):
+        """ Create the fake broker and a folder for the spool. """
+        self.fake = FakePublisher()
+        self.path = tempfile.mkdtemp(prefix='fedocal-')
+        self.publishers = []
+
+    def tearDown(self):
+        """ Stop the publishers and remove the spool. """
+        self.fake.release.set()
+        for pub in self.publishers:
+            pub.close(timeout=1)
+        shutil.rmtree(self.path)
+
+    def _wait_for(self, condition):
+        """ Wait up to 5 seconds for the condition to be True. """
+        for _ in range(50):
+            if condition():
+                break
+            time.sleep(0.1)
+
+    def _publisher(self, **kwargs):
+        """ Return a Publisher using the fake broker. """
+        kwargs.setdefault('retry_delay', 0)
+        pub = publisher.Publisher(self.fake, **kwargs)
+        self.publishers.append(pub)
+        return pub
+
+    def test_publish(self):
+        """ Test the messages are published in order from the thread. """
+        pub = self._publisher()
+        for cnt in range(10):
+            pub.publish('meeting.new', {'id': cnt})
+        self.assertTrue(pub.flush(timeout=5))
+        self.assertEqual(
+            self.fake.messages,
+            [('meeting.new', {'id': cnt}) for cnt in range(10)])
+
+        stats = pub.stats()
+        self.assertEqual(stats['published'], 10)
+        self.assertEqual(stats['queue'], 0)
+        self.assertEqual(stats['spool'], 0)
+        self.assertTrue(stats['latency_max'] >= stats['latency_avg'] >= 0)
+
+    def test_publish_does_not_block(self):
+        """ Test publishing does not wait for the broker and the messages
+        beyond the size of the queue are spooled. """
+        self.fake.release.clear()
+        pub = self._publisher(maxsize=2, batch_size=1)
+        for cnt in range(5):
+            pub.publish('meeting.new', {'id': cnt})
+        self.assertFalse(pub.flush(timeout=0.1))
+        self.assertTrue(pub.stats()['spooled'] >= 2)
+
+        self.fake.release.set()
+        self.assertTrue(pub.flush(timeout=5))
+        self._wait_for(lambda: len(self.fake.messages) == 5)
+        self.assertEqual(
+            sorted(msg['id'] for _, msg in self.fake.messages),
+            list(range(5)))
+
+    def test_invalid_message(self):
+        """ Test an invalid message is dropped. """
+        pub = self._publisher()
+        pub.publish('meeting.new', {'invalid': True})
+        pub.publish('meeting.new', {'id': 1})
+        self.assertTrue(pub.flush(timeout=5))
+        self.assertEqual(self.fake.messages, [('meeting.new', {'id': 1})])
+        self.assertEqual(pub.stats()['failed'], 1)
+
+    def test_broker_unavailable(self):
+        """ Test the messages are spooled while the broker is down and
+        published in order once it is back. """
+        spool = publisher.SqliteSpool(os.path.join(self.path, 'spool.db'))
+        pub = self._publisher(spool=spool, retry_delay=3600)
+        self.fake.down = True
+        pub.publish('meeting.new', {'id': 1})
+        pub.publish('meeting.new', {'id': 2})
+        self.assertTrue(pub.flush(timeout=5))
+        self.assertEqual(self.fake.messages, [])
+        self.assertEqual(len(spool), 2)
+
+        # Messages published while waiting to retry go after the spooled
+        # ones
+        pub.publish('meeting.new', {'id': 3})
+        self.assertTrue(pub.flush(timeout=5))
+        self.assertEqual(len(spool), 3)
+        self.assertEqual(pub.stats()['spool'], 3)
+
+        self.fake.down = False
+        pub._retry_at = 0
+        self._wait_for(lambda: not len(spool))
+        self.assertEqual(
+            self.fake.messages,
+            [('meeting.new', {'id': cnt}) for cnt in (1, 2, 3)])
+        self.assertEqual(pub.stats()['replayed'], 3)
+
+    @patch('fedora_messaging.api.publish')
+    def test_publish_timeout(self, publish_mock):
+        """ Test the messages timing out are spooled and published again
+        instead of being dropped. """
+        publish_mock.side_effect = PublishTimeout('Timed out')
+        spool = publisher.MemorySpool()
+        pub = publisher.Publisher(
+            fedmsgshim.send, spool=spool, retry_delay=3600)
+        self.publishers.append(pub)
+        pub.publish('meeting.new', {'meeting': {'meeting_id': 1}})
+        self.assertTrue(pub.flush(timeout=5))
+        self.assertEqual(len(spool), 1)
+        self.assertEqual(pub.stats()['failed'], 0)
+
+        publish_mock.side_effect = None
+        pub._retry_at = 0
+        self._wait_for(lambda: not len(spool))
+        self.assertEqual(len(spool), 0)
+        self.assertEqual(pub.stats()['replayed'], 1)
+        self.assertEqual(publish_mock.call_count, 2)
+
+    def test_spool_survives_restart(self):
+        """ Test the messages spooled by a process are published by the
+        next one. """
+        path = os.path.join(self.path, 'spool.db')
+        self.fake.down = True
+        pub = self._publisher(spool=publisher.SqliteSpool(path))
+        pub.publish('calendar.new', {'id': 1})
+        pub.close(timeout=5)
+        self.assertEqual(len(publisher.SqliteSpool(path)), 1)
+
+        # Messages published after close are spooled directly
+        pub.publish('calendar.new', {'id': 2})
+        self.assertEqual(len(publisher.SqliteSpool(path)), 2)
+
+        self.fake.down = False
+        pub = self._publisher(spool=publisher.SqliteSpool(path))
+        self.assertTrue(pub.flush(timeout=5))
+        self._wait_for(lambda: not len(publisher.SqliteSpool(path)))
+        self.assertEqual(
+            self.fake.messages,
+            [('calendar.new', {'id': 1}), ('calendar.new', {'id': 2})])
+
+    def test_memory_spool(self):
+        """ Test the MemorySpool drops the oldest messages when full. """
+        spool = publisher.MemorySpool(maxsize=2)
+        spool.add([('a', {}, 0), ('b', {}, 0), ('c', {}, 0)])
+        self.assertEqual(len(spool), 2)
+        items = spool.peek(5)
+        self.assertEqual([item[1] for item in items], ['b', 'c'])
+        spool.remove([items[0][0]])
+        self.assertEqual([item[1] for item in spool.peek(5)], ['c'])
+
+
+if __name__ == '__main__':
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(Publishertests)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+ (c) 2012 - Copyright Pierre-Yves Chibon
+ Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+ Distributed under License GPLv3 or later
+ You can find a copy of this license on the website
+ http://www.gnu.org/licenses/gpl.html
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+ MA 02110-1301, USA.
+
+ fedocal.recurrence test script
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import unittest
+import sys
+import os
+
+from datetime import date
+from datetime import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+from fedocal.fedocallib import model
+from fedocal.fedocallib import recurrence
+
+
+def _weekly_meeting():
+    """ Return a weekly meeting started in 2012 and ending in 2030. """
+    return model.Meeting(
+        meeting_name='Old weekly meeting',
+        meeting_date=date(2012, 1, 2),
+        meeting_date_end=date(2012, 1, 3),
+        meeting_time_start=time(23, 0),
+        meeting_time_stop=time(1, 0),
+        meeting_information='A series which started a long time ago',
+        calendar_name='test_calendar',
+        recursion_frequency=7,
+        recursion_ends=date(2030, 12, 31))
+
+
+class Recurrencetests(unittest.TestCase):
+    """ Recurrence tests. """
+
+    def test_first_occurrence_index(self):
+        """ Test the first_occurrence_index function. """
+        start = date(2012, 1, 2)
+        self.assertEqual(
+            recurrence.first_occurrence_index(start, 7, date(2011, 1, 1)), 0)
+        self.assertEqual(
+            recurrence.first_occurrence_index(start, 7, start), 0)
+        self.assertEqual(
+            recurrence.first_occurrence_index(start, 7, date(2012, 1, 3)), 1)
+        self.assertEqual(
+            recurrence.first_occurrence_index(start, 7, date(2012, 1, 9)), 1)
+        self.assertEqual(
+            recurrence.first_occurrence_index(start, 14, date(2012, 1, 10)),
+            1)
+
+    def test_last_occurrence_index(self):
+        """ Test the last_occurrence_index function. """
+        start = date(2012, 1, 2)
+        self.assertEqual(
+            recurrence.last_occurrence_index(start, 7, date(2012, 1, 8)), 0)
+        self.assertEqual(
+            recurrence.last_occurrence_index(start, 7, date(2012, 1, 9)), 1)
+        self.assertTrue(
+            recurrence.last_occurrence_index(start, 7, date(2011, 1, 1)) < 0)
+
+    def test_iter_occurrences(self):
+        """ Test the iter_occurrences function only yields the
+        occurrences of the window. """
+        meeting = _weekly_meeting()
+        occurrences = list(recurrence.iter_occurrences(
+            meeting, start_date=date(2020, 3, 1),
+            end_date=date(2020, 3, 31)))
+        self.assertEqual(
+            [occ[1] for occ in occurrences],
+            [date(2020, 3, 2), date(2020, 3, 9), date(2020, 3, 16),
+             date(2020, 3, 23), date(2020, 3, 30)])
+        self.assertEqual(
+            [occ[2] for occ in occurrences],
+            [date(2020, 3, 3), date(2020, 3, 10), date(2020, 3, 17),
+             date(2020, 3, 24), date(2020, 3, 31)])
+        self.assertEqual(occurrences[0][0], 426)
+
+        # The end of the recursion is honored
+        meeting.recursion_ends = date(2020, 3, 20)
+        occurrences = list(recurrence.iter_occurrences(
+            meeting, start_date=date(2020, 3, 1),
+            end_date=date(2020, 3, 31)))
+        self.assertEqual(len(occurrences), 3)
+
+        # Window before the start of the series
+        occurrences = list(recurrence.iter_occurrences(
+            meeting, start_date=date(2011, 3, 1),
+            end_date=date(2011, 3, 31)))
+        self.assertEqual(occurrences, [])
+
+    def test_nearest_occurrence_index(self):
+        """ Test the nearest_occurrence_index function. """
+        meeting = _weekly_meeting()
+        self.assertEqual(
+            recurrence.nearest_occurrence_index(meeting, date(2011, 1, 1)),
+            0)
+        self.assertEqual(
+            recurrence.nearest_occurrence_index(meeting, date(2012, 1, 3)),
+            1)
+        # Bounded by the last occurrence
+        meeting.recursion_ends = date(2012, 1, 20)
+        self.assertEqual(
+            recurrence.nearest_occurrence_index(meeting, date(2013, 1, 1)),
+            2)
+
+    def test_is_occurrence(self):
+        """ Test the is_occurrence function. """
+        meeting = _weekly_meeting()
+        self.assertTrue(recurrence.is_occurrence(meeting, date(2012, 1, 2)))
+        self.assertTrue(recurrence.is_occurrence(meeting, date(2020, 3, 9)))
+        self.assertFalse(
+            recurrence.is_occurrence(meeting, date(2020, 3, 10)))
+        self.assertFalse(
+            recurrence.is_occurrence(meeting, date(2011, 12, 26)))
+        self.assertFalse(
+            recurrence.is_occurrence(meeting, date(2031, 1, 6)))
+
+
+if __name__ == '__main__':
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(Recurrencetests)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)
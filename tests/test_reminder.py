@@ -32,11 +32,15 @@ import unittest
 import sys
 import os
 
+from datetime import date, datetime, time, timedelta
+from unittest.mock import patch
+
 from sqlalchemy.exc import IntegrityError, DataError
 
 sys.path.insert(0, os.path.join(os.path.dirname(
     os.path.abspath(__file__)), '..'))
 
+import fedocal.fedocallib as fedocallib
 from fedocal.fedocallib import model
 from tests import Modeltests
 
@@ -80,6 +84,186 @@ class Remindertests(Modeltests):
         self.assertEqual(
             obj.reminder_text, 'This is your friendly reminder')
 
+class ReminderOutboxtests(Modeltests):
+    """ ReminderOutbox tests. """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(ReminderOutboxtests, self).setUp()
+        self.now = datetime(2014, 7, 7, 10, 0)
+
+        calendar = model.Calendar(
+            calendar_name='test_calendar',
+            calendar_contact='test@example.com',
+            calendar_description='This is a test calendar')
+        calendar.save(self.session)
+        reminder = model.Reminder(
+            'H-12', 'pingou@fp.o', 'list@fp.o', 'Come to our meeting')
+        reminder.save(self.session)
+        self.session.flush()
+
+        # Single meeting in 12 hours and weekly meeting in 10 hours,
+        # both in Paris
+        for name, start, recursion_ends in [
+                ('Single meeting', datetime(2014, 7, 8, 0, 0), None),
+                ('Weekly meeting', datetime(2014, 7, 7, 22, 0),
+                 date(2014, 9, 1))]:
+            meeting = model.Meeting(
+                meeting_name=name,
+                meeting_date=start.date(),
+                meeting_date_end=start.date(),
+                meeting_time_start=start.time(),
+                meeting_time_stop=time(23, 0),
+                meeting_information='Meeting with a reminder',
+                calendar_name='test_calendar',
+                meeting_timezone='Europe/Paris',
+                reminder_id=reminder.reminder_id,
+                recursion_frequency=7 if recursion_ends else None,
+                recursion_ends=recursion_ends)
+            meeting.save(self.session)
+        self.session.commit()
+
+    def test_fill_reminder_outbox(self):
+        """ Test the fill_reminder_outbox function of fedocallib. """
+        cnt = fedocallib.fill_reminder_outbox(
+            self.session, self.now, horizon=timedelta(days=8))
+        self.assertEqual(cnt, 3)
+
+        entries = self.session.query(model.ReminderOutbox).order_by(
+            model.ReminderOutbox.send_at).all()
+        self.assertEqual(
+            [(entry.meeting_id, entry.occurrence_start, entry.send_at)
+             for entry in entries],
+            [
+                # Missed by 2 hours but still sent
+                (2, datetime(2014, 7, 7, 20, 0),
+                 datetime(2014, 7, 7, 8, 0)),
+                (1, datetime(2014, 7, 7, 22, 0),
+                 datetime(2014, 7, 7, 10, 0)),
+                (2, datetime(2014, 7, 14, 20, 0),
+                 datetime(2014, 7, 14, 8, 0)),
+            ]
+        )
+        self.assertEqual(
+            set(entry.status for entry in entries), set(['pending']))
+
+        # Nothing is added twice
+        cnt = fedocallib.fill_reminder_outbox(
+            self.session, self.now, horizon=timedelta(days=8))
+        self.assertEqual(cnt, 0)
+
+        # Not anymore once missed for too long
+        self.session.query(model.ReminderOutbox).delete()
+        self.session.commit()
+        cnt = fedocallib.fill_reminder_outbox(
+            self.session, self.now, horizon=timedelta(days=1),
+            catchup=timedelta(hours=1))
+        self.assertEqual(cnt, 1)
+
+    def test_fill_reminder_outbox_concurrent(self):
+        """ Test fill_reminder_outbox adds the reminders another job did
+        not add in the meantime. """
+        cnt = fedocallib.fill_reminder_outbox(self.session, self.now)
+        self.assertEqual(cnt, 3)
+        entry = self.session.query(model.ReminderOutbox).order_by(
+            model.ReminderOutbox.send_at).first()
+        self.session.delete(entry)
+        self.session.commit()
+
+        # The keys are read before the other job added its reminders
+        get_keys = model.ReminderOutbox.get_keys
+        with patch.object(
+                model.ReminderOutbox, 'get_keys',
+                side_effect=[set(), get_keys(self.session, self.now)]):
+            cnt = fedocallib.fill_reminder_outbox(self.session, self.now)
+        self.assertEqual(cnt, 1)
+        self.assertEqual(
+            self.session.query(model.ReminderOutbox).count(), 3)
+
+    def test_claim(self):
+        """ Test the ReminderOutbox claim function. """
+        fedocallib.fill_reminder_outbox(self.session, self.now)
+        lease = timedelta(minutes=5)
+
+        entries = model.ReminderOutbox.claim(
+            self.session, 'worker1', self.now, lease, limit=1)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].send_at, datetime(2014, 7, 7, 8, 0))
+        self.assertTrue(entries[0].lease_owner.startswith('worker1:'))
+
+        entries2 = model.ReminderOutbox.claim(
+            self.session, 'worker2', self.now, lease)
+        self.assertEqual(len(entries2), 1)
+        self.assertNotEqual(entries[0].outbox_id, entries2[0].outbox_id)
+
+        token = entries[0].lease_token
+
+        # Nothing left until the leases expire
+        self.assertEqual(
+            model.ReminderOutbox.claim(
+                self.session, 'worker3', self.now, lease), [])
+        entries3 = model.ReminderOutbox.claim(
+            self.session, 'worker3', self.now + timedelta(minutes=6), lease)
+        self.assertEqual(len(entries3), 2)
+
+        # The first worker lost its lease (the workers run in different
+        # processes, here they share the same objects)
+        entries[0].lease_token = token
+        self.assertFalse(entries[0].mark_sent(self.session, self.now))
+        entries3[0].lease_token = entries3[1].lease_token
+        self.assertTrue(entries3[0].mark_sent(self.session, self.now))
+        self.assertEqual(entries3[0].status, 'sent')
+        self.assertEqual(entries3[0].lease_owner, None)
+
+    def test_mark_failed(self):
+        """ Test the ReminderOutbox mark_failed function. """
+        fedocallib.fill_reminder_outbox(self.session, self.now)
+        delay = timedelta(minutes=5)
+        now = self.now
+
+        for attempt in range(1, 4):
+            entries = model.ReminderOutbox.claim(
+                self.session, 'worker', now, delay, limit=1)
+            self.assertEqual(len(entries), 1)
+            self.assertTrue(
+                entries[0].mark_failed(
+                    self.session, now, 'Connection refused', delay, 3))
+            self.assertEqual(entries[0].attempts, attempt)
+            self.assertEqual(
+                entries[0].next_attempt, now + delay * 2 ** (attempt - 1))
+            self.assertEqual(entries[0].last_error, 'Connection refused')
+            # Not tried again before the delay
+            self.assertNotIn(
+                entries[0].outbox_id,
+                [entry.outbox_id for entry in model.ReminderOutbox.claim(
+                    self.session, 'worker', now, delay)])
+            now = entries[0].next_attempt
+
+        self.assertEqual(entries[0].status, 'failed')
+
+    def test_get_outbox_meeting(self):
+        """ Test the get_outbox_meeting function of fedocallib. """
+        fedocallib.fill_reminder_outbox(self.session, self.now)
+        entries = self.session.query(model.ReminderOutbox).order_by(
+            model.ReminderOutbox.send_at).all()
+
+        meeting = fedocallib.get_outbox_meeting(entries[2])
+        self.assertTrue(isinstance(meeting, model.MeetingOccurrence))
+        self.assertEqual(meeting.meeting_date, date(2014, 7, 14))
+        meeting = fedocallib.get_outbox_meeting(entries[1])
+        self.assertEqual(meeting.meeting_name, 'Single meeting')
+
+        # The meeting moved
+        meeting.meeting_time_start = time(1, 0)
+        self.session.commit()
+        self.assertEqual(fedocallib.get_outbox_meeting(entries[1]), None)
+
+        # The reminder changed
+        meeting.reminder.reminder_offset = 'H-24'
+        self.session.commit()
+        self.assertEqual(fedocallib.get_outbox_meeting(entries[0]), None)
+
+
 if __name__ == '__main__':
     SUITE = unittest.TestLoader().loadTestsFromTestCase(Remindertests)
     unittest.TextTestRunner(verbosity=2).run(SUITE)
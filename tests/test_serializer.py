@@ -0,0 +1,134 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+ (c) 2012 - Copyright Pierre-Yves Chibon
+ Author: Pierre-Yves Chibon <pingou@pingoured.fr>
+
+ Distributed under License GPLv3 or later
+ You can find a copy of this license on the website
+ http://www.gnu.org/licenses/gpl.html
+
+ This program is free software; you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation; either version 3 of the License, or
+ (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+ MA 02110-1301, USA.
+
+ fedocal.serializer test script
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import json
+import unittest
+import sys
+import os
+
+from datetime import date, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+from fedocal.fedocallib import serializer
+
+
+class FakeMeeting(object):
+    """ Meeting counting the accesses to its list of managers. """
+
+    def __init__(self, meeting_id, meeting_date):
+        self.meeting_id = meeting_id
+        self.meeting_name = 'Meeting %s' % meeting_id
+        self.meeting_date = meeting_date
+        self.meeting_date_end = meeting_date
+        self.meeting_time_start = time(9, 5)
+        self.meeting_time_stop = time(10, 0, 30)
+        self.meeting_timezone = 'Europe/Paris'
+        self.meeting_information = 'Information é'
+        self.meeting_location = None
+        self.calendar_name = 'test_calendar'
+        self.calls = 0
+
+    @property
+    def meeting_manager(self):
+        self.calls += 1
+        return ['pingou', 'shaiton']
+
+    def recursion_to_json(self):
+        return {'frequency': 7}
+
+
+class Serializertests(unittest.TestCase):
+    """ Serializer tests. """
+
+    def tearDown(self):
+        """ Restore the default backend. """
+        serializer.configure({})
+
+    def test_meeting_serializer(self):
+        """ Test the MeetingSerializer only computes once what the
+        occurrences of a meeting share. """
+        serialize = serializer.MeetingSerializer()
+        meeting = FakeMeeting(1, date(2013, 5, 4))
+        self.assertEqual(
+            serialize(meeting),
+            {
+                'meeting_id': 1,
+                'meeting_name': 'Meeting 1',
+                'meeting_manager': ['pingou', 'shaiton'],
+                'meeting_date': '2013-05-04',
+                'meeting_date_end': '2013-05-04',
+                'meeting_time_start': '09:05:00',
+                'meeting_time_stop': '10:00:30',
+                'meeting_timezone': 'Europe/Paris',
+                'meeting_information': 'Information é',
+                'meeting_location': None,
+                'calendar_name': 'test_calendar',
+            })
+
+        meeting.meeting_date = date(2013, 5, 11)
+        output = serialize(meeting)
+        self.assertEqual(output['meeting_date'], '2013-05-11')
+        self.assertEqual(meeting.calls, 1)
+
+        serialize = serializer.MeetingSerializer(recursion=True)
+        self.assertEqual(serialize(meeting)['recursion'], {'frequency': 7})
+
+    def test_iterencode(self):
+        """ Test iterencode yields the list of items by chunks with both
+        backends. """
+        for backend in ('json', 'orjson'):
+            if backend == 'orjson' and serializer.orjson is None:
+                continue
+            serializer.configure({'JSON_BACKEND': backend})
+            self.assertEqual(serializer.BACKEND, backend)
+            chunks = list(serializer.iterencode(
+                {'arguments': {'start': 'é'}}, 'meetings',
+                ({'id': cnt} for cnt in range(5)), chunk_size=2))
+            self.assertEqual(len(chunks), 5)
+            self.assertEqual(
+                json.loads(''.join(chunks)),
+                {
+                    'arguments': {'start': 'é'},
+                    'meetings': [{'id': cnt} for cnt in range(5)],
+                })
+
+            self.assertEqual(
+                json.loads(''.join(serializer.iterencode({}, 'items', []))),
+                {'items': []})
+
+        self.assertRaises(
+            ValueError, serializer.configure, {'JSON_BACKEND': 'yaml'})
+
+
+if __name__ == '__main__':
+    SUITE = unittest.TestLoader().loadTestsFromTestCase(Serializertests)
+    unittest.TextTestRunner(verbosity=2).run(SUITE)